@@ -1,22 +1,62 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, current_app, request, jsonify, make_response, Response, stream_with_context
 from flask_cors import CORS
-import pymysql
-import boto3
-from botocore.exceptions import ClientError
+import click
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-import uuid
-import google.generativeai as genai
-import PyPDF2
+from datetime import datetime, timedelta, timezone
+import atexit
+import base64
+import csv
 import io
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db import ConnectionPool, TimedDictCursor, TimedSSDictCursor
+from pymysql.err import IntegrityError
+import metrics
+from metrics import span
+import stats
+from leaderboard import Leaderboard
+from llm_cache import LLMCache
+from jobs import JobQueue, QueueFull, TERMINAL_STATES
+from url_cache import PresignedURLCache
+from autosave import DebouncedWriter
+from solver_sessions import SolverSessions
+from solver_context import SolverContext, CompactedHistory, count_hints, estimate_tokens
+from llm_gateway import LLMGateway, LLMUnavailable
+from pdf_text import PDFExtractor, ExtractionTimeout
+from recommender import ProblemCatalog
+from uploads import UploadRequest, content_hash as upload_content_hash, spool_copy
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Routes are registered on a blueprint; create_app() builds the Flask app
+api = Blueprint('api', __name__, cli_group=None)
+
+# Uploads are hashed while they are parsed and spooled to disk past
+# UPLOAD_SPOOL_BYTES; bodies over MAX_UPLOAD_BYTES are refused before they
+# are read (create_app adds 64 KiB for multipart headers and form fields)
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', 5 * 1024 * 1024))
+UploadRequest.spool_max_size = int(os.getenv('UPLOAD_SPOOL_BYTES', 512 * 1024))
+
+# Shared clients, each built on first use so importing this module (in
+# every worker and test) doesn't load boto3 or the Gemini library, or need
+# their credentials
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Helper function to build a shared client once, on first use
+def lazy_client(name, factory):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
 
 # Database configuration
 DB_CONFIG = {
@@ -27,41 +67,258 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 3306))
 }
 
-# AWS S3 configuration
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION')
+# Helper function to get the shared connection pool (sizes and timeouts are in seconds)
+def get_db_pool():
+    return lazy_client('db_pool', lambda: ConnectionPool(
+        size=int(os.getenv('DB_POOL_SIZE', 10)),
+        max_lifetime=int(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+        idle_timeout=int(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+        checkout_timeout=int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        cursorclass=TimedDictCursor,
+        **DB_CONFIG
+    ))
+
+# Change counters for dashboard ETags
+data_versions = stats.DataVersions()
+
+# Helper function to load users' totals for the leaderboard index: everyone,
+# or with `since` only users whose stats changed at or after it
+def load_leaderboard_rows(since=None):
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        if since is None:
+            cursor.execute(
+                '''SELECT u.id, u.name, u.email,
+                          COALESCE(s.total_points, 0) as total_points,
+                          COALESCE(s.total_problems, 0) as total_problems,
+                          s.updated_at
+                   FROM users u
+                   LEFT JOIN user_stats s ON s.user_id = u.id'''
+            )
+        else:
+            cursor.execute(
+                '''SELECT u.id, u.name, u.email, s.total_points, s.total_problems, s.updated_at
+                   FROM user_stats s
+                   JOIN users u ON u.id = s.user_id
+                   WHERE s.updated_at >= %s''',
+                (since,)
+            )
+        return cursor.fetchall()
+
+leaderboard = Leaderboard(
+    load_leaderboard_rows,
+    refresh_interval=int(os.getenv('LEADERBOARD_REFRESH_INTERVAL', 60)),
+    full_refresh_interval=int(os.getenv('LEADERBOARD_FULL_REFRESH_INTERVAL', 3600)),
+    overlap=int(os.getenv('LEADERBOARD_REFRESH_OVERLAP', 10)),
+    # Writes from other workers change this worker's dashboard ETags too
+    on_change=data_versions.bump_many
 )
+
+# Helper function to publish a user's new totals after a problem write
+def publish_totals(user_id, totals):
+    data_versions.bump(user_id)
+    leaderboard.update(user_id, totals['total_points'], totals['total_problems'])
+
+# AWS S3 configuration
 S3_BUCKET = os.getenv('S3_BUCKET_NAME')
 
-# Configure Gemini API
+# Helper function to create the S3 client
+def create_s3_client():
+    import boto3
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.getenv('AWS_REGION')
+    )
+
+# Helper function to get the shared S3 client
+def get_s3_client():
+    return lazy_client('s3', create_s3_client)
+
+# Helper function to create the S3 upload settings: stream uploads in parts
+# rather than one large PUT
+def create_s3_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)),
+        multipart_chunksize=int(os.getenv('S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024)),
+        max_concurrency=int(os.getenv('S3_MAX_CONCURRENCY', 4))
+    )
+
+# Helper function for `except` clauses that catch S3 client errors. Before
+# boto3 is first used no S3 error can happen, so botocore isn't imported
+# just to name the class.
+def s3_errors():
+    exceptions = sys.modules.get('botocore.exceptions')
+    return (exceptions.ClientError,) if exceptions else ()
+
+# Presigned download URLs are valid for 1 hour and reused until 5 minutes
+# before they expire
+# Helper function to sign a download URL for an S3 key
+def sign_s3_url(s3_key, expires_in):
+    with span('s3', 'generate_presigned_url'):
+        return get_s3_client().generate_presigned_url(
+            'get_object',
+            Params={'Bucket': S3_BUCKET, 'Key': s3_key},
+            ExpiresIn=expires_in
+        )
+
+presigned_urls = PresignedURLCache(
+    sign_s3_url,
+    expires_in=3600,
+    safety_margin=int(os.getenv('PRESIGNED_URL_SAFETY_MARGIN', 300))
+)
+
+# Gemini API settings
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'models/gemini-2.5-flash')
+
+# Helper function to create the Gemini model; the client library is
+# imported and configured on the first LLM call
+def create_gemini_model():
+    import google.generativeai as genai
+    if GEMINI_API_KEY:
+        genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+# Gemini response cache (memory LRU, plus SQLite when LLM_CACHE_PATH is set)
+llm_cache = LLMCache(
+    max_entries=int(os.getenv('LLM_CACHE_SIZE', 512)),
+    disk_path=os.getenv('LLM_CACHE_PATH')
+)
+
+# Cache TTL in seconds for each kind of Gemini call
+LLM_CACHE_TTLS = {
+    'candidate_name': 30 * 24 * 3600,
+    'resume_analysis': 7 * 24 * 3600,
+    'suggest': 3600,
+    'solve_explain': 7 * 24 * 3600,
+    'solve_hint': 24 * 3600,
+    'solve_feedback': 24 * 3600,
+    'solve_solution': 7 * 24 * 3600,
+    'solve_summary': 7 * 24 * 3600,
+}
+
+# Every Gemini call goes through one gateway: bounded concurrency, per-call
+# deadlines, retries on 429/5xx and a circuit breaker. It builds the model
+# on first use.
+llm_gateway = LLMGateway(
+    create_gemini_model,
+    GEMINI_MODEL,
+    llm_cache,
+    max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 5)),
+    deadline=float(os.getenv('LLM_DEADLINE_SECONDS', 60)),
+    stream_deadline=float(os.getenv('LLM_STREAM_IDLE_SECONDS', 30)),
+    max_attempts=int(os.getenv('LLM_MAX_ATTEMPTS', 3)),
+    failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', 5)),
+    reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30)),
+    max_async_concurrency=int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', 64))
+)
+
+# Shared pool for issuing independent Gemini calls in parallel
+llm_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('LLM_PARALLEL_WORKERS', 8)),
+    thread_name_prefix='llm'
+)
+
+# Resume text beyond this many characters is never sent to Gemini, so
+# extraction stops once it has collected them
+RESUME_PROMPT_CHARS = 15000
+
+# PDF parsing runs in worker processes so it doesn't hold the GIL
+pdf_extractor = PDFExtractor(
+    max_workers=int(os.getenv('PDF_WORKERS', 2)),
+    timeout=int(os.getenv('PDF_TIMEOUT_SECONDS', 20)),
+    queue_timeout=int(os.getenv('PDF_QUEUE_TIMEOUT_SECONDS', 20)),
+    max_pages=int(os.getenv('PDF_MAX_PAGES', 50)),
+    max_chars=RESUME_PROMPT_CHARS
+)
+
+# Background parses of new uploads get their own small pool, so slow PDFs
+# never hold the llm_executor threads that Gemini calls run on
+resume_prefetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('RESUME_PREFETCH_WORKERS', 2)),
+    thread_name_prefix='resume-prefetch'
+)
+
+# content hash -> Future of a prefetch parse that hasn't finished yet
+_resume_prefetches = {}
+_resume_prefetches_lock = threading.Lock()
+
+# Helper function to call Gemini through the gateway and response cache
+def generate_text(prompt, stage, bypass=False):
+    return llm_gateway.generate(stage, prompt, ttl=LLM_CACHE_TTLS[stage], bypass=bypass)
+
+# Helper function to check whether the client asked to skip the LLM cache
+def cache_bypass_requested():
+    value = request.args.get('no_cache') or request.form.get('no_cache')
+    if value is None and request.is_json:
+        value = (request.get_json(silent=True) or {}).get('no_cache')
+    return str(value).lower() in ('1', 'true', 'yes')
+
+# Helper function to format one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Helper functions for keyset pagination cursors over (timestamp, id)
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """Raises ValueError if the cursor is malformed."""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
 
 # Helper function to get database connection
 def get_db_connection():
-    return pymysql.connect(**DB_CONFIG, cursorclass=pymysql.cursors.DictCursor)
+    """
+    Check out a pooled connection. Use as a context manager so the
+    connection is returned to the pool on every path:
 
-# Helper function to extract text from PDF
-def extract_text_from_pdf(pdf_file):
-    try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        print(f"Error extracting PDF text: {e}")
-        return None
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            ...
+    """
+    return get_db_pool().connection()
+
+# Words that make a capitalized header line a title or section, not a name
+NOT_NAME_WORDS = {
+    'resume', 'curriculum', 'vitae', 'cv', 'summary', 'objective', 'profile',
+    'contact', 'experience', 'education', 'skills', 'projects', 'engineer',
+    'developer', 'manager', 'analyst', 'scientist', 'designer', 'intern',
+    'student', 'consultant', 'architect', 'software', 'senior', 'junior'
+}
+NAME_WORD = re.compile(r"^[A-Z][A-Za-z'\-]*\.?$")
+
+# Helper function to guess the candidate name without calling Gemini
+def guess_candidate_name(text):
+    """
+    Return the name if one of the first two non-empty lines clearly looks like
+    one (2-4 capitalized alphabetic words, no titles or contact details),
+    otherwise None.
+    """
+    lines = [line.strip() for line in text.strip().split('\n')[:5] if line.strip()]
+    for line in lines[:2]:
+        words = line.split()
+        if not 2 <= len(words) <= 4 or len(line) >= 50:
+            continue
+        if any(word.lower().strip('.') in NOT_NAME_WORDS for word in words):
+            continue
+        if all(NAME_WORD.match(word) for word in words):
+            # Normalize ALL CAPS headers to title case
+            return line.title() if line.isupper() else line
+    return None
 
 # Helper function to extract candidate name from resume
-def extract_candidate_name(text):
+def extract_candidate_name(text, bypass_cache=False):
     """
     Extract candidate name from resume text using heuristics.
     Assumes name is in the first few lines of the resume.
+    Falls back to Gemini when the heuristic is not confident.
     """
     try:
         lines = text.strip().split('\n')
@@ -71,16 +328,18 @@ def extract_candidate_name(text):
         if not first_lines:
             return "the candidate"
         
+        guessed = guess_candidate_name(text)
+        if guessed:
+            return guessed
+        
         # Use Gemini to extract the name
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
         name_prompt = f"""From the following resume excerpt, extract ONLY the candidate's full name. 
 Return just the name, nothing else. If you cannot find a clear name, return "Candidate".
 
 Resume excerpt:
 {chr(10).join(first_lines[:3])}
 """
-        response = model.generate_content(name_prompt)
-        name = response.text.strip()
+        name = generate_text(name_prompt, 'candidate_name', bypass=bypass_cache).strip()
         
         # Validate the name (should be 2-4 words, not too long)
         words = name.split()
@@ -95,7 +354,7 @@ Resume excerpt:
 
 # ========== AUTHENTICATION ENDPOINTS ==========
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     try:
         data = request.json
@@ -106,27 +365,22 @@ def register():
         if not all([name, email, password]):
             return jsonify({'error': 'All fields are required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if email already exists
-        cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email already registered'}), 409
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            # Check if email already exists
+            cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
+            if cursor.fetchone():
+                return jsonify({'error': 'Email already registered'}), 409
         
-        # Hash password and insert user
-        hashed_password = generate_password_hash(password)
-        cursor.execute(
-            'INSERT INTO users (name, email, password) VALUES (%s, %s, %s)',
-            (name, email, hashed_password)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
+            # Hash password and insert user
+            hashed_password = generate_password_hash(password)
+            cursor.execute(
+                'INSERT INTO users (name, email, password) VALUES (%s, %s, %s)',
+                (name, email, hashed_password)
+            )
+            conn.commit()
+            user_id = cursor.lastrowid
         
-        cursor.close()
-        conn.close()
+        leaderboard.update(user_id, 0, 0, name=name, email=email)
         
         return jsonify({
             'message': 'Registration successful',
@@ -136,7 +390,7 @@ def register():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.json
@@ -146,14 +400,9 @@ def login():
         if not all([email, password]):
             return jsonify({'error': 'Email and password required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-        user = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
+            user = cursor.fetchone()
         
         if not user or not check_password_hash(user['password'], password):
             return jsonify({'error': 'Invalid credentials'}), 401
@@ -172,31 +421,118 @@ def login():
 
 # ========== PROBLEM TRACKER ENDPOINTS ==========
 
-@app.route('/api/problems', methods=['GET'])
+# Columns a client may ask for with ?fields=; summary and notes are TEXT,
+# so list views should leave them out
+PROBLEM_FIELDS = ('id', 'user_id', 'number', 'name', 'difficulty', 'topic',
+                  'summary', 'notes', 'points', 'created_at')
+
+# Rows per page of /api/problems when the client doesn't pass a limit
+PROBLEMS_PAGE_SIZE = int(os.getenv('PROBLEMS_PAGE_SIZE', 50))
+
+# Helper function to turn ?fields= into a column list for problem queries
+def get_problem_columns():
+    """Raises ValueError on an unknown field."""
+    fields = request.args.get('fields')
+    if not fields:
+        return ', '.join(PROBLEM_FIELDS)
+    
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in PROBLEM_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    # id and created_at are always needed to build the next cursor
+    columns = ['id', 'created_at'] + [f for f in requested if f not in ('id', 'created_at')]
+    return ', '.join(columns)
+
+@api.route('/api/problems', methods=['GET'])
 def get_problems():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        try:
+            columns = get_problem_columns()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Paged by default; pass the X-Next-Cursor header back as `cursor`
+        limit = max(1, min(request.args.get('limit', PROBLEMS_PAGE_SIZE, type=int), 200))
+        
+        query = f'SELECT {columns} FROM problems WHERE user_id = %s'
+        params = [user_id]
+        
+        difficulty = request.args.get('difficulty')
+        if difficulty:
+            if difficulty not in stats.DIFFICULTIES:
+                return jsonify({'error': 'Invalid difficulty'}), 400
+            query += ' AND difficulty = %s'
+            params.append(difficulty)
+        
+        topic = request.args.get('topic')
+        if topic:
+            query += ' AND topic = %s'
+            params.append(topic)
+        
+        if request.args.get('cursor'):
+            try:
+                created_at, last_id = decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query += ' AND (created_at < %s OR (created_at = %s AND id < %s))'
+            params += [created_at, created_at, last_id]
+        
+        # Fetch one extra row to know whether another page exists
+        query += ' ORDER BY created_at DESC, id DESC LIMIT %s'
+        params.append(limit + 1)
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, tuple(params))
+            problems = cursor.fetchall()
+        
+        next_cursor = None
+        if len(problems) > limit:
+            problems = problems[:limit]
+            next_cursor = encode_cursor(problems[-1]['created_at'], problems[-1]['id'])
+        
+        response = make_response(jsonify(problems), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
         
-        cursor.execute(
-            'SELECT * FROM problems WHERE user_id = %s ORDER BY created_at DESC',
-            (user_id,)
-        )
-        problems = cursor.fetchall()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/problems/<int:problem_id>', methods=['GET'])
+def get_problem(problem_id):
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
         
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {', '.join(PROBLEM_FIELDS)} FROM problems WHERE id = %s AND user_id = %s",
+                (problem_id, user_id)
+            )
+            problem = cursor.fetchone()
+        
+        if not problem:
+            return jsonify({'error': 'Problem not found'}), 404
         
-        return jsonify(problems), 200
+        return jsonify(problem), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/problems', methods=['POST'])
+# Points awarded for solving a problem of each difficulty
+PROBLEM_POINTS = {'Easy': 10, 'Medium': 25, 'Hard': 50}
+
+# MySQL's error code for a row that breaks a unique key
+DUPLICATE_ENTRY = 1062
+
+@api.route('/api/problems', methods=['POST'])
 def add_problem():
     try:
         data = request.json
@@ -210,95 +546,388 @@ def add_problem():
         
         if not all([user_id, number, name, difficulty, topic]):
             return jsonify({'error': 'All fields except summary and notes are required'}), 400
+        if difficulty not in PROBLEM_POINTS:
+            return jsonify({'error': 'Invalid difficulty'}), 400
         
         # Calculate points based on difficulty
-        points = {'Easy': 10, 'Medium': 25, 'Hard': 50}.get(difficulty, 10)
+        points = PROBLEM_POINTS[difficulty]
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''INSERT INTO problems (user_id, number, name, difficulty, topic, summary, notes, points)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
-            (user_id, number, name, difficulty, topic, summary, notes, points)
-        )
-        conn.commit()
-        problem_id = cursor.lastrowid
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                '''INSERT INTO problems (user_id, number, name, difficulty, topic, summary, notes, points)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)''',
+                (user_id, number, name, difficulty, topic, summary, notes, points)
+            )
+            problem_id = cursor.lastrowid
+            stats.apply_problem(cursor, problem_id, 1)
+            totals = stats.get_summary(cursor, user_id)
+            conn.commit()
         
-        cursor.close()
-        conn.close()
+        publish_totals(user_id, totals)
         
         return jsonify({
             'message': 'Problem added successfully',
             'id': problem_id
         }), 201
         
+    except IntegrityError as e:
+        if e.args[0] == DUPLICATE_ENTRY:
+            return jsonify({'error': 'You have already added this problem number'}), 409
+        return jsonify({'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Largest import /api/problems/bulk accepts, and rows per insert transaction
+MAX_BULK_PROBLEMS = int(os.getenv('MAX_BULK_PROBLEMS', 5000))
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+
+# Column widths of the problems table, checked before inserting
+PROBLEM_FIELD_LENGTHS = {'number': 50, 'name': 255, 'topic': 100}
+
+# Helper function to read the problems sent to /api/problems/bulk
+def read_bulk_problems():
+    """
+    Return (user_id, rows). JSON bodies may be a list of problems or an
+    object with user_id and problems; NDJSON bodies have one problem per
+    line and take user_id from the query string. Lines that aren't valid
+    JSON come back as None so they are reported like other bad rows.
+    Raises ValueError if the body is neither.
+    """
+    user_id = request.args.get('user_id')
+    
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = []
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+            if len(rows) > MAX_BULK_PROBLEMS:
+                break
+        return user_id, rows
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        user_id = data.get('user_id') or user_id
+        data = data.get('problems')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of problems or NDJSON')
+    return user_id, data
+
+# Helper function to validate one imported problem and fill in its defaults
+def normalize_bulk_problem(row, now, utc_offset):
+    """
+    Return (problem, None) or (None, error message). `utc_offset` is the
+    database session's offset from UTC, for created_at values that carry one.
+    """
+    if not isinstance(row, dict):
+        return None, 'Not a JSON object'
+    
+    missing = [field for field in ('number', 'name', 'difficulty', 'topic') if not row.get(field)]
+    if missing:
+        return None, f"Missing {', '.join(missing)}"
+    
+    if row['difficulty'] not in stats.DIFFICULTIES:
+        return None, 'Invalid difficulty'
+    
+    problem = {field: str(row[field]).strip() for field in ('number', 'name', 'topic')}
+    for field, max_length in PROBLEM_FIELD_LENGTHS.items():
+        if len(problem[field]) > max_length:
+            return None, f'{field} is longer than {max_length} characters'
+    
+    # Imported history may carry the original solve date
+    created_at = now
+    if row.get('created_at'):
+        try:
+            created_at = datetime.fromisoformat(str(row['created_at']).replace('Z', '+00:00'))
+        except ValueError:
+            return None, 'Invalid created_at'
+        if created_at.tzinfo is not None:
+            # Stored in the session's time zone, as NOW() is
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None) + utc_offset
+    
+    problem.update(
+        difficulty=row['difficulty'],
+        summary=row.get('summary') or '',
+        notes=row.get('notes') or '',
+        points=PROBLEM_POINTS[row['difficulty']],
+        created_at=created_at
+    )
+    return problem, None
+
+@api.route('/api/problems/bulk', methods=['POST'])
+def bulk_add_problems():
+    """
+    Import many problems at once. Rows whose number the user already has
+    (or that repeat an earlier row) are skipped, and each row gets a result.
+    """
+    try:
+        try:
+            user_id, rows = read_bulk_problems()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        
+        if len(rows) > MAX_BULK_PROBLEMS:
+            return jsonify({'error': f'At most {MAX_BULK_PROBLEMS} problems per import'}), 400
+        
+        results = []
+        created = 0
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            # Use the database clock, as single inserts do
+            cursor.execute('SELECT NOW() AS now, UTC_TIMESTAMP() AS utc_now')
+            clock = cursor.fetchone()
+            now = clock['now']
+            utc_offset = timedelta(minutes=round((now - clock['utc_now']).total_seconds() / 60))
+            
+            # Validate everything up front, dropping repeats within the body
+            candidates = []
+            seen = set()
+            for index, row in enumerate(rows):
+                problem, error = normalize_bulk_problem(row, now, utc_offset)
+                if error:
+                    results.append({'index': index, 'status': 'invalid', 'error': error})
+                elif problem['number'].lower() in seen:
+                    results.append({'index': index, 'status': 'duplicate', 'number': problem['number']})
+                else:
+                    seen.add(problem['number'].lower())
+                    candidates.append((index, problem))
+            
+            for start in range(0, len(candidates), BULK_BATCH_SIZE):
+                batch = candidates[start:start + BULK_BATCH_SIZE]
+                numbers = [problem['number'] for _, problem in batch]
+                placeholders = ', '.join(['%s'] * len(numbers))
+                
+                # Imports for one user run one at a time, so their gap locks
+                # below can't deadlock each other
+                cursor.execute('SELECT id FROM users WHERE id = %s FOR UPDATE', (user_id,))
+                if not cursor.fetchone():
+                    conn.rollback()
+                    return jsonify({'error': 'User not found'}), 404
+                
+                # A locking read on the unique key also locks the gaps where
+                # missing numbers would go, so a single add can't insert one
+                # of them before this batch does
+                cursor.execute(
+                    f'''SELECT number FROM problems
+                        WHERE user_id = %s AND number IN ({placeholders}) FOR UPDATE''',
+                    (user_id, *numbers)
+                )
+                existing = {row['number'].lower() for row in cursor.fetchall()}
+                
+                new = []
+                for index, problem in batch:
+                    if problem['number'].lower() in existing:
+                        results.append({'index': index, 'status': 'duplicate', 'number': problem['number']})
+                    else:
+                        new.append((index, problem))
+                
+                if new:
+                    # The unique key skips anything that got in regardless
+                    cursor.executemany(
+                        '''INSERT IGNORE INTO problems
+                               (user_id, number, name, difficulty, topic, summary, notes, points, created_at)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
+                        [(user_id, p['number'], p['name'], p['difficulty'], p['topic'],
+                          p['summary'], p['notes'], p['points'], p['created_at']) for _, p in new]
+                    )
+                    stats.apply_new_problems(cursor, user_id, [problem for _, problem in new])
+                    
+                    # A multi-row insert only reports its first id, so look them up
+                    cursor.execute(
+                        f'SELECT id, number FROM problems WHERE user_id = %s AND number IN ({placeholders})',
+                        (user_id, *numbers)
+                    )
+                    ids = {row['number'].lower(): row['id'] for row in cursor.fetchall()}
+                    for index, problem in new:
+                        results.append({'index': index, 'status': 'created',
+                                        'id': ids.get(problem['number'].lower()),
+                                        'number': problem['number']})
+                    created += len(new)
+                
+                conn.commit()
+            
+            totals = stats.get_summary(cursor, user_id) if created else None
+        
+        if created:
+            publish_totals(user_id, totals)
+        
+        results.sort(key=lambda result: result['index'])
+        return jsonify({
+            'message': f'Imported {created} problems',
+            'created': created,
+            'duplicates': sum(result['status'] == 'duplicate' for result in results),
+            'invalid': sum(result['status'] == 'invalid' for result in results),
+            'results': results
+        }), 201 if created else 200
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/problems/<int:problem_id>', methods=['PUT'])
+# Columns written by /api/problems/export: the problem, then its notes
+EXPORT_COLUMNS = (
+    'id', 'number', 'name', 'difficulty', 'topic', 'summary', 'notes', 'points', 'created_at',
+    'approach', 'solution_code', 'time_complexity', 'space_complexity',
+    'key_insights', 'mistakes_made', 'related_problems'
+)
+
+# Rows per chunk written to an export response
+EXPORT_CHUNK_ROWS = 200
+
+# Helper function to stream a user's problems and notes from the database
+def iter_export_rows(user_id):
+    """
+    Yield one dict per problem. An unbuffered server-side cursor hands rows
+    over as MySQL sends them, so memory stays flat however long the
+    history is; the pooled connection is held until the last row is read.
+    """
+    with get_db_connection() as conn, conn.cursor(TimedSSDictCursor) as cursor:
+        cursor.execute(
+            '''SELECT p.id, p.number, p.name, p.difficulty, p.topic, p.summary, p.notes,
+                      p.points, p.created_at,
+                      n.approach, n.solution_code, n.time_complexity, n.space_complexity,
+                      n.key_insights, n.mistakes_made, n.related_problems
+               FROM problems p
+               LEFT JOIN problem_notes n ON n.problem_id = p.id AND n.user_id = p.user_id
+               WHERE p.user_id = %s
+               ORDER BY p.created_at DESC, p.id DESC''',
+            (user_id,)
+        )
+        for row in cursor:
+            if row['created_at']:
+                row['created_at'] = row['created_at'].isoformat()
+            yield row
+
+# Helper function to encode export rows as CSV, a chunk of rows at a time
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# Helper function to encode export rows as newline-delimited JSON
+def export_ndjson(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row))
+        if len(lines) == EXPORT_CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+@api.route('/api/problems/export', methods=['GET'])
+def export_problems():
+    """Download all of a user's problems with their notes as CSV or NDJSON."""
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({'error': 'user_id required'}), 400
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        body, mimetype = export_csv(iter_export_rows(user_id)), 'text/csv'
+    elif export_format == 'ndjson':
+        body, mimetype = export_ndjson(iter_export_rows(user_id)), 'application/x-ndjson'
+    else:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename=problems-{user_id}.{export_format}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@api.route('/api/problems/<int:problem_id>', methods=['PUT'])
 def update_problem(problem_id):
     try:
         data = request.json
+        if 'difficulty' in data and data['difficulty'] not in PROBLEM_POINTS:
+            return jsonify({'error': 'Invalid difficulty'}), 400
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            # Build update query dynamically
+            update_fields = []
+            values = []
+        
+            if 'number' in data:
+                update_fields.append('number = %s')
+                values.append(data['number'])
+            if 'name' in data:
+                update_fields.append('name = %s')
+                values.append(data['name'])
+            if 'difficulty' in data:
+                update_fields.append('difficulty = %s')
+                values.append(data['difficulty'])
+                # Update points based on new difficulty
+                points = PROBLEM_POINTS[data['difficulty']]
+                update_fields.append('points = %s')
+                values.append(points)
+            if 'topic' in data:
+                update_fields.append('topic = %s')
+                values.append(data['topic'])
+            if 'summary' in data:
+                update_fields.append('summary = %s')
+                values.append(data['summary'])
+            if 'notes' in data:
+                update_fields.append('notes = %s')
+                values.append(data['notes'])
+        
+            if not update_fields:
+                return jsonify({'error': 'No fields to update'}), 400
+        
+            values.append(problem_id)
+            query = f"UPDATE problems SET {', '.join(update_fields)} WHERE id = %s"
+        
+            # Swap the old contribution to the aggregates for the new one
+            cursor.execute('SELECT user_id FROM problems WHERE id = %s FOR UPDATE', (problem_id,))
+            existing = cursor.fetchone()
+            stats.apply_problem(cursor, problem_id, -1)
+            cursor.execute(query, tuple(values))
+            stats.apply_problem(cursor, problem_id, 1)
+            if existing:
+                totals = stats.get_summary(cursor, existing['user_id'])
+            conn.commit()
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build update query dynamically
-        update_fields = []
-        values = []
-        
-        if 'number' in data:
-            update_fields.append('number = %s')
-            values.append(data['number'])
-        if 'name' in data:
-            update_fields.append('name = %s')
-            values.append(data['name'])
-        if 'difficulty' in data:
-            update_fields.append('difficulty = %s')
-            values.append(data['difficulty'])
-            # Update points based on new difficulty
-            points = {'Easy': 10, 'Medium': 25, 'Hard': 50}.get(data['difficulty'], 10)
-            update_fields.append('points = %s')
-            values.append(points)
-        if 'topic' in data:
-            update_fields.append('topic = %s')
-            values.append(data['topic'])
-        if 'summary' in data:
-            update_fields.append('summary = %s')
-            values.append(data['summary'])
-        if 'notes' in data:
-            update_fields.append('notes = %s')
-            values.append(data['notes'])
-        
-        if not update_fields:
-            return jsonify({'error': 'No fields to update'}), 400
-        
-        values.append(problem_id)
-        query = f"UPDATE problems SET {', '.join(update_fields)} WHERE id = %s"
-        
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
+        if existing:
+            publish_totals(existing['user_id'], totals)
         
         return jsonify({'message': 'Problem updated successfully'}), 200
         
+    except IntegrityError as e:
+        if e.args[0] == DUPLICATE_ENTRY:
+            return jsonify({'error': 'You have already added this problem number'}), 409
+        return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/problems/<int:problem_id>', methods=['DELETE'])
+@api.route('/api/problems/<int:problem_id>', methods=['DELETE'])
 def delete_problem(problem_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT user_id FROM problems WHERE id = %s FOR UPDATE', (problem_id,))
+            existing = cursor.fetchone()
+            stats.apply_problem(cursor, problem_id, -1)
+            cursor.execute('DELETE FROM problems WHERE id = %s', (problem_id,))
+            if existing:
+                totals = stats.get_summary(cursor, existing['user_id'])
+            conn.commit()
         
-        cursor.execute('DELETE FROM problems WHERE id = %s', (problem_id,))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
+        if existing:
+            publish_totals(existing['user_id'], totals)
         
         return jsonify({'message': 'Problem deleted successfully'}), 200
         
@@ -307,264 +936,428 @@ def delete_problem(problem_id):
 
 # ========== DASHBOARD ANALYTICS ENDPOINTS ==========
 
-@app.route('/api/analytics/difficulty', methods=['GET'])
+@api.route('/api/analytics/difficulty', methods=['GET'])
 def analytics_by_difficulty():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT difficulty, COUNT(*) as count
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY difficulty''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            summary = stats.get_summary(cursor, user_id)
         
-        return jsonify(results), 200
+        return jsonify(stats.difficulty_breakdown(summary)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/topic', methods=['GET'])
+@api.route('/api/analytics/topic', methods=['GET'])
 def analytics_by_topic():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT topic, COUNT(*) as count
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY topic
-               ORDER BY count DESC''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            results = stats.get_topic_breakdown(cursor, user_id)
         
         return jsonify(results), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/points', methods=['GET'])
+@api.route('/api/analytics/points', methods=['GET'])
 def analytics_points_over_time():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT DATE(created_at) as date, SUM(points) as total_points
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY DATE(created_at)
-               ORDER BY date ASC''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        # Calculate cumulative points
-        cumulative = 0
-        cumulative_data = []
-        for row in results:
-            cumulative += row['total_points']
-            cumulative_data.append({
-                'date': row['date'].strftime('%Y-%m-%d'),
-                'points': cumulative
-            })
-        
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cumulative_data = stats.get_points_series(cursor, user_id)
         
         return jsonify(cumulative_data), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/summary', methods=['GET'])
+@api.route('/api/analytics/summary', methods=['GET'])
 def analytics_summary():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            summary = stats.get_summary(cursor, user_id)
         
-        # Total problems
-        cursor.execute(
-            'SELECT COUNT(*) as total FROM problems WHERE user_id = %s',
-            (user_id,)
-        )
-        total = cursor.fetchone()['total']
+        return jsonify({
+            'total_problems': summary['total_problems'],
+            'total_points': summary['total_points']
+        }), 200
         
-        # Total points
-        cursor.execute(
-            'SELECT SUM(points) as total_points FROM problems WHERE user_id = %s',
-            (user_id,)
-        )
-        points_result = cursor.fetchone()
-        total_points = points_result['total_points'] if points_result['total_points'] else 0
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/dashboard', methods=['GET'])
+def dashboard():
+    """
+    Everything the dashboard page needs in one response: summary, difficulty
+    and topic breakdowns, cumulative points, leaderboard and the user's rank.
+    Unchanged dashboards are answered with 304 before any database work
+    (other than the leaderboard's periodic check for other workers' writes).
+    """
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
         
-        cursor.close()
-        conn.close()
+        leaderboard.refresh()
+        etag = data_versions.etag(user_id)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+        
+        position = leaderboard.rank(user_id)
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            summary = stats.get_summary(cursor, user_id)
+            payload = {
+                'summary': {
+                    'total_problems': summary['total_problems'],
+                    'total_points': summary['total_points']
+                },
+                'difficulty': stats.difficulty_breakdown(summary),
+                'topics': stats.get_topic_breakdown(cursor, user_id),
+                'points': stats.get_points_series(cursor, user_id),
+                'rank': position['rank'] if position else None,
+                'leaderboard': leaderboard.top(10)
+            }
         
-        return jsonify({
-            'total_problems': total,
-            'total_points': total_points
-        }), 200
+        response = make_response(jsonify(payload), 200)
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ========== RESUME UPLOAD ENDPOINT ==========
 
-@app.route('/api/upload-resume', methods=['POST'])
+# Helper function to validate the uploaded resume in request.files
+def get_uploaded_pdf():
+    """Return (file, None) or (None, error response)."""
+    try:
+        files = request.files
+    except RequestEntityTooLarge as e:
+        return None, request_too_large(e)
+    
+    if 'file' not in files:
+        return None, (jsonify({'error': 'No file provided'}), 400)
+    
+    file = files['file']
+    
+    if file.filename == '':
+        return None, (jsonify({'error': 'No file selected'}), 400)
+    
+    if not file.filename.lower().endswith('.pdf'):
+        return None, (jsonify({'error': 'Only PDF files allowed'}), 400)
+    
+    return file, None
+
+# Helper function to get a presigned download URL, reusing a cached one
+def presign_resume(s3_key):
+    return presigned_urls.get(s3_key)
+
+@api.route('/api/upload-resume', methods=['POST'])
 def upload_resume():
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        file, error = get_uploaded_pdf()
+        if error:
+            return error
         
-        file = request.files['file']
         user_id = request.form.get('user_id')
         
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        # Resumes are stored under the SHA-256 of their bytes
+        content_hash = upload_content_hash(file.stream)
         
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files allowed'}), 400
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                '''SELECT id, user_id, s3_key FROM resumes
+                   WHERE content_hash = %s
+                   ORDER BY user_id = %s DESC
+                   LIMIT 1''',
+                (content_hash, user_id)
+            )
+            existing = cursor.fetchone()
         
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"resumes/{user_id}_{uuid.uuid4()}.{file_extension}"
+        # Same file already uploaded by this user: reuse that record
+        if existing and str(existing['user_id']) == str(user_id):
+            return jsonify({
+                'message': 'Resume already uploaded',
+                'resume_id': existing['id'],
+                'file_url': presign_resume(existing['s3_key']),
+                'content_hash': content_hash,
+                'duplicate': True
+            }), 200
         
-        # Upload to S3
-        s3_client.upload_fileobj(
-            file,
-            S3_BUCKET,
-            unique_filename,
-            ExtraArgs={'ContentType': 'application/pdf'}
-        )
+        # Upload to S3 unless these bytes are already stored
+        if existing:
+            s3_key = existing['s3_key']
+        else:
+            s3_key = f"resumes/{content_hash}.pdf"
+            file.stream.seek(0)
+            with span('s3', 'upload_fileobj'):
+                get_s3_client().upload_fileobj(
+                    file.stream,
+                    S3_BUCKET,
+                    s3_key,
+                    ExtraArgs={'ContentType': 'application/pdf'},
+                    Config=lazy_client('s3_transfer_config', create_s3_transfer_config)
+                )
         
         # Generate presigned URL (valid for 1 hour)
-        file_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': unique_filename},
-            ExpiresIn=3600
-        )
+        file_url = presign_resume(s3_key)
         
-        # Save to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''INSERT INTO resumes (user_id, filename, s3_key, file_url)
-               VALUES (%s, %s, %s, %s)''',
-            (user_id, file.filename, unique_filename, file_url)
-        )
-        conn.commit()
-        resume_id = cursor.lastrowid
+        # Save to database; URLs expire, so only the key is stored
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                '''INSERT INTO resumes (user_id, filename, s3_key, content_hash)
+                   VALUES (%s, %s, %s, %s)''',
+                (user_id, file.filename, s3_key, content_hash)
+            )
+            conn.commit()
+            resume_id = cursor.lastrowid
         
-        cursor.close()
-        conn.close()
+        # Parse the text once now, off the request thread, so analyzing this
+        # resume later needs neither a re-upload nor a parse
+        prefetch_resume_content(content_hash, file.stream)
         
         return jsonify({
             'message': 'Resume uploaded successfully',
             'resume_id': resume_id,
-            'file_url': file_url
+            'file_url': file_url,
+            'content_hash': content_hash,
+            'duplicate': False
         }), 201
         
-    except ClientError as e:
+    except s3_errors() as e:
         return jsonify({'error': f'AWS S3 error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/resumes', methods=['GET'])
+@api.route('/api/resumes', methods=['GET'])
 def get_resumes():
     try:
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        limit = request.args.get('limit', type=int)
+        lazy_urls = request.args.get('urls') == 'lazy'
+        
+        query = '''SELECT id, user_id, filename, s3_key, content_hash, uploaded_at
+                   FROM resumes WHERE user_id = %s'''
+        params = [user_id]
+        
+        if request.args.get('cursor'):
+            try:
+                uploaded_at, last_id = decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query += ' AND (uploaded_at < %s OR (uploaded_at = %s AND id < %s))'
+            params += [uploaded_at, uploaded_at, last_id]
+        
+        query += ' ORDER BY uploaded_at DESC, id DESC'
+        if limit:
+            # Fetch one extra row to know whether another page exists
+            limit = max(1, min(limit, 100))
+            query += ' LIMIT %s'
+            params.append(limit + 1)
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, tuple(params))
+            resumes = cursor.fetchall()
+        
+        next_cursor = None
+        if limit and len(resumes) > limit:
+            resumes = resumes[:limit]
+            next_cursor = encode_cursor(resumes[-1]['uploaded_at'], resumes[-1]['id'])
+        
+        # Sign only the rows being returned; with urls=lazy the client asks
+        # for each URL when the item is shown
+        if not lazy_urls:
+            for resume in resumes:
+                resume['file_url'] = presign_resume(resume['s3_key'])
+        
+        response = make_response(jsonify(resumes), 200)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
         
-        cursor.execute(
-            'SELECT * FROM resumes WHERE user_id = %s ORDER BY uploaded_at DESC',
-            (user_id,)
-        )
-        resumes = cursor.fetchall()
-        
-        # Generate fresh presigned URLs
-        for resume in resumes:
-            resume['file_url'] = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': resume['s3_key']},
-                ExpiresIn=3600
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/resumes/<int:resume_id>/url', methods=['GET'])
+def get_resume_url(resume_id):
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT s3_key FROM resumes WHERE id = %s AND user_id = %s',
+                (resume_id, user_id)
             )
+            resume = cursor.fetchone()
         
-        cursor.close()
-        conn.close()
+        if not resume:
+            return jsonify({'error': 'Resume not found'}), 404
         
-        return jsonify(resumes), 200
+        return jsonify({'resume_id': resume_id, 'file_url': presign_resume(resume['s3_key'])}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # ========== GEMINI AI RESUME ANALYSIS ENDPOINT ==========
 
-@app.route('/api/analyze-resume', methods=['POST'])
-def analyze_resume():
+# Helper function to load the cached text and analysis for a resume's bytes
+def get_resume_content(content_hash):
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            '''SELECT extracted_text, page_count, candidate_name, analysis
+               FROM resume_contents WHERE content_hash = %s''',
+            (content_hash,)
+        )
+        return cursor.fetchone()
+
+# Helper function to cache the text and analysis for a resume's bytes
+def save_resume_content(content_hash, extracted_text=None, candidate_name=None, analysis=None,
+                        page_count=None):
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO resume_contents
+                   (content_hash, extracted_text, page_count, candidate_name, analysis)
+               VALUES (%s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE
+                   extracted_text = COALESCE(VALUES(extracted_text), extracted_text),
+                   page_count = COALESCE(VALUES(page_count), page_count),
+                   candidate_name = COALESCE(VALUES(candidate_name), candidate_name),
+                   analysis = COALESCE(VALUES(analysis), analysis)''',
+            (content_hash, extracted_text, page_count, candidate_name, analysis)
+        )
+        conn.commit()
+
+# Helper function to get a resume's text, parsing the PDF only the first time
+def load_resume_content(content_hash, open_pdf):
+    """
+    Return the resume_contents row for `content_hash`. `open_pdf()` must
+    return the PDF as a binary stream; it is only called when the text is
+    not cached yet. Raises ValueError if no text can be extracted.
+    """
+    cached = get_resume_content(content_hash) or {}
+    if cached.get('extracted_text'):
+        return cached
+    
+    # Wait for a prefetch of the same bytes rather than parsing them twice
+    with _resume_prefetches_lock:
+        prefetch = _resume_prefetches.get(content_hash)
+    if prefetch:
+        try:
+            return prefetch.result()
+        except Exception:
+            pass
+    
+    return parse_resume_content(content_hash, open_pdf, cached)
+
+# Helper function to parse a resume and cache its text
+def parse_resume_content(content_hash, open_pdf, cached):
+    """Raises ValueError if no text can be extracted; see load_resume_content."""
     try:
-        if not GEMINI_API_KEY:
-            return jsonify({'error': 'Gemini API key not configured'}), 500
-        
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files allowed'}), 400
-        
-        # Extract text from PDF
-        pdf_text = extract_text_from_pdf(io.BytesIO(file.read()))
-        
-        if not pdf_text:
-            return jsonify({'error': 'Could not extract text from PDF'}), 400
-        
-        # Extract candidate name
-        candidate_name = extract_candidate_name(pdf_text)
-        
-        # Analyze with Gemini using the custom prompt
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        
-        prompt = f"""You are an expert career advisor. Review this resume for {candidate_name} carefully.
+        document = pdf_extractor.extract_document(open_pdf())
+    except ExtractionTimeout:
+        raise ValueError('PDF took too long to process')
+    
+    if not document or not document['text']:
+        raise ValueError('Could not extract text from PDF')
+    
+    # Only the free local guess here; the Gemini fallback is left to analysis
+    candidate_name = cached.get('candidate_name') or guess_candidate_name(document['text'])
+    save_resume_content(content_hash, document['text'], candidate_name,
+                        page_count=document['page_count'])
+    
+    return dict(cached,
+                extracted_text=document['text'],
+                page_count=document['page_count'],
+                candidate_name=candidate_name,
+                analysis=cached.get('analysis'))
+
+# Helper function to cache a newly uploaded resume's text in the background
+def prefetch_resume_content(content_hash, stream):
+    if get_resume_content(content_hash):
+        return
+    
+    # The request's spooled file is closed at teardown, so parse a copy
+    pdf_file = spool_copy(stream)
+    
+    def run():
+        try:
+            return parse_resume_content(content_hash, lambda: pdf_file, {})
+        except Exception as e:
+            print(f"Error caching resume text: {e}")
+            raise
+        finally:
+            pdf_file.close()
+            with _resume_prefetches_lock:
+                _resume_prefetches.pop(content_hash, None)
+    
+    with _resume_prefetches_lock:
+        if content_hash in _resume_prefetches:
+            pdf_file.close()
+            return
+        # Stored before run() can remove it, since run() needs this lock too
+        _resume_prefetches[content_hash] = resume_prefetch_executor.submit(run)
+
+# Helper function to read a stored resume back from S3
+def download_resume(s3_key):
+    with span('s3', 'get_object'):
+        response = get_s3_client().get_object(Bucket=S3_BUCKET, Key=s3_key)
+        return io.BytesIO(response['Body'].read())
+
+# Helper function to run the full resume analysis on a resume's bytes
+def run_resume_analysis(content_hash, open_pdf, bypass_cache=False):
+    """
+    Raises ValueError if no text can be extracted from the PDF. Text,
+    candidate name and analysis are cached per SHA-256 of the file, so a
+    previously seen resume is answered without parsing it or calling Gemini.
+    """
+    content = load_resume_content(content_hash, open_pdf)
+    if content['analysis'] and not bypass_cache:
+        return {
+            'analysis': content['analysis'],
+            'candidate_name': content['candidate_name'],
+            'content_hash': content_hash
+        }
+    
+    pdf_text = content['extracted_text']
+    
+    # Use the stored or local name guess when there is one; otherwise ask
+    # Gemini for the name in parallel with the analysis, which then can't
+    # depend on it
+    candidate_name = content['candidate_name']
+    name_future = None
+    if candidate_name:
+        subject = f"this resume for {candidate_name}"
+    else:
+        name_future = llm_executor.submit(extract_candidate_name, pdf_text, bypass_cache)
+        subject = "this resume"
+    
+    # Analyze with Gemini using the custom prompt
+    prompt = f"""You are an expert career advisor. Review {subject} carefully.
 
 Tasks:
 1. Give a **short summary** (2–3 lines) of their professional profile.
@@ -573,233 +1366,505 @@ Tasks:
 4. Recommend **action verbs** and **restructuring tips** to make it stronger.
 
 Resume Text:
-{pdf_text[:15000]}
+{pdf_text[:RESUME_PROMPT_CHARS]}
 """
 
-        response = model.generate_content(prompt)
-        analysis = response.text
+    try:
+        analysis = generate_text(prompt, 'resume_analysis', bypass=bypass_cache)
+    finally:
+        if name_future:
+            candidate_name = name_future.result()
+    
+    save_resume_content(content_hash, candidate_name=candidate_name, analysis=analysis)
+    
+    return {'analysis': analysis, 'candidate_name': candidate_name, 'content_hash': content_hash}
+
+# Helper function to analyze a resume from the request's uploaded file
+def run_upload_analysis(pdf_file, bypass_cache=False):
+    return run_resume_analysis(upload_content_hash(pdf_file), lambda: pdf_file, bypass_cache)
+
+# Helper function to analyze a resume previously stored by /api/upload-resume
+def run_stored_analysis(resume, bypass_cache=False):
+    content_hash = resume['content_hash']
+    if content_hash:
+        return run_resume_analysis(content_hash, lambda: download_resume(resume['s3_key']),
+                                   bypass_cache)
+    
+    # Uploaded before resumes were hashed: hash it now and remember it
+    pdf_file = download_resume(resume['s3_key'])
+    content_hash = upload_content_hash(pdf_file)
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('UPDATE resumes SET content_hash = %s WHERE id = %s',
+                       (content_hash, resume['id']))
+        conn.commit()
+    return run_resume_analysis(content_hash, lambda: pdf_file, bypass_cache)
+
+# Helper function to find the stored resume named by resume_id in the request
+def get_requested_resume():
+    """
+    Return (resume, None), (None, error response), or (None, None) when the
+    request has no resume_id and should carry a file instead.
+    """
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    resume_id = data.get('resume_id')
+    if not resume_id:
+        return None, None
+    
+    user_id = data.get('user_id')
+    if not user_id:
+        return None, (jsonify({'error': 'user_id required'}), 400)
+    
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, filename, s3_key, content_hash FROM resumes WHERE id = %s AND user_id = %s',
+            (resume_id, user_id)
+        )
+        resume = cursor.fetchone()
+    
+    if not resume:
+        return None, (jsonify({'error': 'Resume not found'}), 404)
+    
+    return resume, None
+
+@api.route('/api/analyze-resume', methods=['POST'])
+def analyze_resume():
+    """Analyze an uploaded PDF, or a stored one given by resume_id."""
+    try:
+        if not GEMINI_API_KEY:
+            return jsonify({'error': 'Gemini API key not configured'}), 500
+        
+        resume, error = get_requested_resume()
+        if error:
+            return error
+        
+        file = None
+        if not resume:
+            file, error = get_uploaded_pdf()
+            if error:
+                return error
+        
+        try:
+            if resume:
+                result = run_stored_analysis(resume, bypass_cache=cache_bypass_requested())
+            else:
+                result = run_upload_analysis(file.stream, bypass_cache=cache_bypass_requested())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
-            'analysis': analysis,
-            'candidate_name': candidate_name,
+            'analysis': result['analysis'],
+            'candidate_name': result['candidate_name'],
+            'content_hash': result['content_hash'],
             'message': 'Resume analyzed successfully'
         }), 200
         
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    except s3_errors() as e:
+        return jsonify({'error': f'AWS S3 error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Analysis error: {str(e)}'}), 500
 
-# ========== PROBLEM NOTES ENDPOINTS ==========
+# Helper function to save a resume analysis job's state
+def persist_resume_job(job):
+    result = job['result'] or {}
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO resume_analyses
+                   (id, user_id, filename, status, attempts, candidate_name, analysis, error)
+               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+               ON DUPLICATE KEY UPDATE
+                   status = VALUES(status), attempts = VALUES(attempts),
+                   candidate_name = VALUES(candidate_name), analysis = VALUES(analysis),
+                   error = VALUES(error)''',
+            (job['id'], job.get('user_id'), job.get('filename'), job['status'], job['attempts'],
+             result.get('candidate_name'), result.get('analysis'), job['error'])
+        )
+        conn.commit()
 
-@app.route('/api/notes/<int:problem_id>', methods=['GET'])
-def get_notes(problem_id):
-    try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+# Helper function to shape a job for API responses
+def resume_job_payload(job):
+    result = job.get('result') or {}
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'candidate_name': result.get('candidate_name', job.get('candidate_name')),
+        'analysis': result.get('analysis', job.get('analysis')),
+        'error': job.get('error')
+    }
+
+# Helper function to look up a job in memory, then in the database
+def find_resume_job(job_id):
+    job = resume_jobs.get(job_id)
+    if job:
+        return job
+    with get_db_connection() as conn, conn.cursor() as cursor:
         cursor.execute(
-            'SELECT * FROM problem_notes WHERE problem_id = %s AND user_id = %s',
-            (problem_id, user_id)
+            '''SELECT id, status, attempts, candidate_name, analysis, error
+               FROM resume_analyses WHERE id = %s''',
+            (job_id,)
         )
-        notes = cursor.fetchone()
+        return cursor.fetchone()
+
+# Resume analysis jobs; the gateway retries transient Gemini errors itself, so
+# jobs only retry when it is shedding load or its circuit is open
+resume_jobs = JobQueue(
+    max_workers=int(os.getenv('RESUME_JOB_WORKERS', 4)),
+    max_pending=int(os.getenv('RESUME_JOB_MAX_PENDING', 32)),
+    max_attempts=int(os.getenv('RESUME_JOB_MAX_ATTEMPTS', 3)),
+    retry_on=(LLMUnavailable,),
+    on_update=persist_resume_job
+)
+
+@api.route('/api/analyze-resume/jobs', methods=['POST'])
+def submit_resume_analysis():
+    """Queue a resume analysis and return its job id immediately."""
+    try:
+        if not GEMINI_API_KEY:
+            return jsonify({'error': 'Gemini API key not configured'}), 500
         
-        cursor.close()
-        conn.close()
+        resume, error = get_requested_resume()
+        if error:
+            return error
+        
+        data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+        meta = {'user_id': data.get('user_id') or None}
+        
+        if resume:
+            # Stored resumes are read from the text cache (or S3) by the job
+            try:
+                job_id = resume_jobs.submit(
+                    run_stored_analysis,
+                    resume,
+                    bypass_cache=cache_bypass_requested(),
+                    meta=dict(meta, filename=resume['filename'])
+                )
+            except QueueFull as e:
+                return jsonify({'error': str(e)}), 503
+        else:
+            file, error = get_uploaded_pdf()
+            if error:
+                return error
+            
+            # The request's spooled file is closed at teardown, so the job
+            # gets its own copy
+            pdf_file = spool_copy(file.stream)
+            try:
+                job_id = resume_jobs.submit(
+                    run_upload_analysis,
+                    pdf_file,
+                    bypass_cache=cache_bypass_requested(),
+                    meta=dict(meta, filename=file.filename),
+                    cleanup=pdf_file.close
+                )
+            except QueueFull as e:
+                pdf_file.close()
+                return jsonify({'error': str(e)}), 503
+            except Exception:
+                pdf_file.close()
+                raise
         
-        return jsonify(notes if notes else {}), 200
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/analyze-resume/jobs/{job_id}',
+            'events_url': f'/api/analyze-resume/jobs/{job_id}/events'
+        }), 202
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return jsonify({'error': f'Analysis error: {str(e)}'}), 500
 
-@app.route('/api/notes', methods=['POST'])
-def create_or_update_notes():
+@api.route('/api/analyze-resume/jobs/<job_id>', methods=['GET'])
+def get_resume_analysis(job_id):
     try:
-        data = request.json
-        problem_id = data.get('problem_id')
-        user_id = data.get('user_id')
-        approach = data.get('approach', '')
-        solution_code = data.get('solution_code', '')
-        time_complexity = data.get('time_complexity', '')
-        space_complexity = data.get('space_complexity', '')
-        key_insights = data.get('key_insights', '')
-        mistakes_made = data.get('mistakes_made', '')
-        related_problems = data.get('related_problems', '')
+        job = find_resume_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
         
-        if not all([problem_id, user_id]):
-            return jsonify({'error': 'problem_id and user_id required'}), 400
+        return jsonify(resume_job_payload(job)), 200
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if notes already exist
-        cursor.execute(
-            'SELECT id FROM problem_notes WHERE problem_id = %s AND user_id = %s',
-            (problem_id, user_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/analyze-resume/jobs/<job_id>/events', methods=['GET'])
+def stream_resume_analysis(job_id):
+    """Server-Sent Events feed of a job's status until it finishes."""
+    job = find_resume_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def generate():
+        version = -1
+        payload = None
+        while True:
+            current = resume_jobs.wait_for_change(job_id, version, timeout=15)
+            if current is not None:
+                version = current['version']
+            else:
+                # Owned by another process, or finished and pruned: poll the table
+                current = find_resume_job(job_id) or job
+                if current['status'] not in TERMINAL_STATES:
+                    time.sleep(2)
+            
+            next_payload = resume_job_payload(current)
+            if next_payload != payload:
+                payload = next_payload
+                yield sse_event('status', payload)
+            else:
+                yield ': keepalive\n\n'
+            
+            if current['status'] in TERMINAL_STATES:
+                return
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ========== PROBLEM NOTES ENDPOINTS ==========
+
+# Editable columns of problem_notes
+NOTE_FIELDS = ('approach', 'solution_code', 'time_complexity', 'space_complexity',
+               'key_insights', 'mistakes_made', 'related_problems')
+
+# Helper function to upsert some or all note fields in one statement
+def save_note_fields(problem_id, user_id, fields, age=None):
+    """
+    Insert the notes row, or update only the given columns of an existing
+    one, so untouched fields (e.g. a large solution_code) aren't rewritten.
+    With `age` (seconds since the edits were made) an existing row is only
+    updated if nothing was written to it since then, so a delayed autosave
+    can't overwrite a newer save handled by another worker.
+    Returns the affected row count: 1 if created, 2 if updated, 0 if unchanged.
+    """
+    columns = [field for field in NOTE_FIELDS if field in fields]
+    params = [problem_id, user_id] + [fields[column] for column in columns]
+    if not columns:
+        # Nothing to change, but make sure the row exists
+        updates = 'problem_id = problem_id'
+    elif age is None:
+        updates = ', '.join(f'{column} = VALUES({column})' for column in columns)
+    else:
+        # updated_at isn't assigned here, so every test sees the row's old stamp
+        updates = ', '.join(
+            f'{column} = IF(updated_at <= NOW(6) - INTERVAL %s MICROSECOND, VALUES({column}), {column})'
+            for column in columns)
+        params += [int(age * 1000000)] * len(columns)
+    
+    column_list = ', '.join(['problem_id', 'user_id'] + columns)
+    placeholders = ', '.join(['%s'] * (len(columns) + 2))
+    
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        affected = cursor.execute(
+            f'''INSERT INTO problem_notes ({column_list}) VALUES ({placeholders})
+                ON DUPLICATE KEY UPDATE {updates}''',
+            tuple(params)
         )
-        existing = cursor.fetchone()
+        conn.commit()
+    return affected
+
+# Autosaved edits are merged per (problem, user) and written once the
+# editor pauses
+notes_autosave = DebouncedWriter(
+    lambda key, fields, age: save_note_fields(key[0], key[1], fields, age=age),
+    delay=float(os.getenv('NOTES_AUTOSAVE_DELAY', 2)),
+    max_delay=float(os.getenv('NOTES_AUTOSAVE_MAX_DELAY', 10))
+)
+atexit.register(notes_autosave.flush_all)
+
+@api.route('/api/notes/<int:problem_id>', methods=['GET'])
+def get_notes(problem_id):
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
         
-        if existing:
-            # Update existing notes
-            cursor.execute(
-                '''UPDATE problem_notes SET 
-                   approach = %s, solution_code = %s, time_complexity = %s, 
-                   space_complexity = %s, key_insights = %s, mistakes_made = %s, 
-                   related_problems = %s, updated_at = CURRENT_TIMESTAMP
-                   WHERE problem_id = %s AND user_id = %s''',
-                (approach, solution_code, time_complexity, space_complexity, 
-                 key_insights, mistakes_made, related_problems, problem_id, user_id)
-            )
-            message = 'Notes updated successfully'
-        else:
-            # Create new notes
+        with get_db_connection() as conn, conn.cursor() as cursor:
             cursor.execute(
-                '''INSERT INTO problem_notes 
-                   (problem_id, user_id, approach, solution_code, time_complexity, 
-                    space_complexity, key_insights, mistakes_made, related_problems)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)''',
-                (problem_id, user_id, approach, solution_code, time_complexity, 
-                 space_complexity, key_insights, mistakes_made, related_problems)
+                'SELECT * FROM problem_notes WHERE problem_id = %s AND user_id = %s',
+                (problem_id, user_id)
             )
-            message = 'Notes created successfully'
+            notes = cursor.fetchone()
         
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Show autosaved edits that haven't been written yet
+        pending = notes_autosave.pending((problem_id, str(user_id)))
+        if pending:
+            notes = dict(notes or {'problem_id': problem_id, 'user_id': int(user_id)}, **pending)
         
-        return jsonify({'message': message}), 200
+        return jsonify(notes if notes else {}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/notes/<int:problem_id>', methods=['DELETE'])
-def delete_notes(problem_id):
+@api.route('/api/notes', methods=['POST'])
+def create_or_update_notes():
+    """Replace all note fields; missing ones are saved as empty."""
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
+        data = request.json
+        problem_id = data.get('problem_id')
+        user_id = data.get('user_id')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        if not all([problem_id, user_id]):
+            return jsonify({'error': 'problem_id and user_id required'}), 400
         
-        cursor.execute(
-            'DELETE FROM problem_notes WHERE problem_id = %s AND user_id = %s',
-            (problem_id, user_id)
-        )
-        conn.commit()
+        # This write supersedes any autosaved edits still buffered
+        notes_autosave.take((int(problem_id), str(user_id)))
         
-        cursor.close()
-        conn.close()
+        affected = save_note_fields(problem_id, user_id,
+                                    {field: data.get(field, '') for field in NOTE_FIELDS})
+        message = 'Notes created successfully' if affected == 1 else 'Notes updated successfully'
         
-        return jsonify({'message': 'Notes deleted successfully'}), 200
+        return jsonify({'message': message}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# ========== AI PROBLEM RECOMMENDATION ENDPOINT ==========
-
-@app.route('/api/suggest-problems', methods=['POST'])
-def suggest_problems():
+@api.route('/api/notes/<int:problem_id>', methods=['PATCH'])
+def patch_notes(problem_id):
+    """
+    Update only the note fields present in the body. With autosave set,
+    the edit is buffered and merged with later ones instead of written now.
+    """
     try:
-        if not GEMINI_API_KEY:
-            return jsonify({'error': 'Gemini API key not configured'}), 500
-        
-        data = request.json
+        data = request.json or {}
         user_id = data.get('user_id')
-        topic = data.get('topic')  # Can be None or a specific topic
-        
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        # Get all solved problems for the user
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT number, name, difficulty, topic FROM problems WHERE user_id = %s',
-            (user_id,)
-        )
-        solved_problems = cursor.fetchall()
+        fields = {field: data[field] for field in NOTE_FIELDS if field in data}
+        key = (problem_id, str(user_id))
         
-        cursor.close()
-        conn.close()
+        if data.get('autosave'):
+            notes_autosave.submit(key, fields)
+            return jsonify({'message': 'Notes queued for saving', 'pending': True}), 202
         
-        # Format solved problems list
-        solved_list = []
-        for p in solved_problems:
-            solved_list.append(f"{p['number']} - {p['name']} ({p['difficulty']}, {p['topic']})")
+        # Fold in buffered autosave edits so they aren't written after this
+        pending = notes_autosave.take(key)
+        if pending:
+            fields = dict(pending, **fields)
         
-        solved_problem_list = "\n".join(solved_list) if solved_list else "No problems solved yet."
+        affected = save_note_fields(problem_id, user_id, fields)
+        message = 'Notes created successfully' if affected == 1 else 'Notes updated successfully'
         
-        # Build Gemini prompt
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
+        return jsonify({'message': message, 'pending': False}), 200
         
-        if topic and topic.lower() != 'none':
-            prompt = f"""You are an expert DSA tutor helping users improve coding problem coverage.
-
-The user has already solved the following problems (from their practice tracker):
-{solved_problem_list}
-
-They want new recommendations specifically for the topic: {topic}
-
-Recommend 5 unsolved LeetCode-style problems from the {topic} topic, balanced across easy, medium, and hard difficulties. Ensure these problems are NOT in the solved list above.
-
-Format your response STRICTLY as a JSON array (no markdown, no extra text):
-[
-  {{"problem_name": "Two Sum", "topic": "Arrays", "difficulty": "Easy", "reason": "Classic problem for hash maps"}},
-  {{"problem_name": "...", "topic": "...", "difficulty": "...", "reason": "..."}}
-]
-"""
-        else:
-            prompt = f"""You are an expert DSA tutor helping users improve coding problem coverage.
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-The user has already solved the following problems (from their practice tracker):
-{solved_problem_list}
+@api.route('/api/notes/<int:problem_id>', methods=['DELETE'])
+def delete_notes(problem_id):
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
+        
+        notes_autosave.take((problem_id, str(user_id)))
+        
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM problem_notes WHERE problem_id = %s AND user_id = %s',
+                (problem_id, user_id)
+            )
+            conn.commit()
+        
+        return jsonify({'message': 'Notes deleted successfully'}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-They want general recommendations (no specific topic).
+# ========== PROBLEM RECOMMENDATION ENDPOINT ==========
 
-Recommend 5 problems total:
-- 3 problems that are similar to the solved ones (based on topic/difficulty patterns, but slightly harder or related)
-- 2 problems that are new topics but relevant to their learning curve
+# Bundled problem catalog used for local recommendations
+problem_catalog = ProblemCatalog.load(os.getenv(
+    'PROBLEM_CATALOG_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'problem_catalog.json')
+))
 
-Ensure these problems are NOT in the solved list above.
+# Whether suggest-problems asks Gemini to write the reasons by default
+SUGGEST_LLM_REASONS = os.getenv('SUGGEST_LLM_REASONS', 'false').lower() in ('1', 'true', 'yes')
 
-Format your response STRICTLY as a JSON array (no markdown, no extra text):
-[
-  {{"problem_name": "Two Sum", "topic": "Arrays", "difficulty": "Easy", "reason": "Classic problem for hash maps"}},
-  {{"problem_name": "...", "topic": "...", "difficulty": "...", "reason": "..."}}
-]
+# Helper function to have Gemini rewrite the reason text for recommendations
+def write_recommendation_reasons(recommendations, solved_problems, bypass=False):
+    """
+    Replace each recommendation's local reason with one written by Gemini.
+    Any pick Gemini doesn't answer for keeps its local reason. The prompt
+    only uses per-topic counts, so it stays small and repeats often enough
+    to be served from the LLM cache.
+    """
+    topic_counts = {}
+    for p in solved_problems:
+        topic_counts[p['topic']] = topic_counts.get(p['topic'], 0) + 1
+    progress = ', '.join(f"{topic}: {count}" for topic, count in sorted(topic_counts.items()))
+    picks = '\n'.join(
+        f"{rec['number']}. {rec['problem_name']} ({rec['difficulty']}, {rec['topic']}) - {rec['reason']}"
+        for rec in recommendations
+    )
+    prompt = f"""You are an expert DSA tutor. A student has solved {len(solved_problems)} problems ({progress or 'none yet'}).
+
+These problems were picked for them next, each with a short note on why:
+{picks}
+
+For each problem, write one encouraging sentence (at most 25 words) telling the student why it is a good next step.
+
+Respond STRICTLY as a JSON object mapping each problem number to its sentence (no markdown, no extra text), e.g. {{"1": "..."}}
 """
+    text = generate_text(prompt, 'suggest', bypass=bypass)
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    reasons = json.loads(match.group()) if match else {}
+    for rec in recommendations:
+        reason = reasons.get(rec['number']) if isinstance(reasons, dict) else None
+        if isinstance(reason, str) and reason.strip():
+            rec['reason'] = reason.strip()
+
+@api.route('/api/suggest-problems', methods=['POST'])
+def suggest_problems():
+    try:
+        data = request.json
+        user_id = data.get('user_id')
+        topic = data.get('topic')  # Can be None or a specific topic
         
-        response = model.generate_content(prompt)
-        recommendations_text = response.text.strip()
+        if not user_id:
+            return jsonify({'error': 'user_id required'}), 400
         
-        # Try to parse JSON (remove markdown if present)
-        if recommendations_text.startswith('```'):
-            # Remove markdown code blocks
-            recommendations_text = recommendations_text.split('```')[1]
-            if recommendations_text.startswith('json'):
-                recommendations_text = recommendations_text[4:]
-            recommendations_text = recommendations_text.strip()
+        catalog_topic = None
+        if topic and topic.lower() != 'none':
+            catalog_topic = problem_catalog.match_topic(topic)
+            if not catalog_topic:
+                return jsonify({'error': f'Unknown topic: {topic}'}), 400
         
-        # Parse JSON
-        import json
-        try:
-            recommendations = json.loads(recommendations_text)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return raw text
-            return jsonify({
-                'recommendations': [],
-                'raw_text': recommendations_text,
-                'message': 'Could not parse recommendations as JSON'
-            }), 200
+        # Get all solved problems for the user
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT number, name, difficulty, topic FROM problems WHERE user_id = %s',
+                (user_id,)
+            )
+            solved_problems = cursor.fetchall()
+        
+        recommendations = problem_catalog.recommend(solved_problems, topic=catalog_topic)
+        
+        # The LLM only rewords the reasons, and the local ones stand if it fails
+        reasons = 'local'
+        llm_reasons = data.get('llm_reasons', SUGGEST_LLM_REASONS)
+        if recommendations and GEMINI_API_KEY and str(llm_reasons).lower() in ('1', 'true', 'yes'):
+            try:
+                write_recommendation_reasons(recommendations, solved_problems,
+                                             bypass=cache_bypass_requested())
+                reasons = 'llm'
+            except Exception as e:
+                print(f"Error writing recommendation reasons: {e}")
+        
+        if recommendations:
+            message = 'Recommendations generated successfully'
+        else:
+            message = "You've solved every problem in the catalog for this selection"
         
         return jsonify({
             'recommendations': recommendations,
-            'topic': topic,
-            'message': 'Recommendations generated successfully'
+            'topic': catalog_topic,
+            'reasons': reasons,
+            'message': message
         }), 200
         
     except Exception as e:
@@ -807,7 +1872,174 @@ Format your response STRICTLY as a JSON array (no markdown, no extra text):
 
 # ========== GUIDED PROBLEM SOLVER ENDPOINT ==========
 
-@app.route('/api/solve-problem', methods=['POST'])
+# Helper function to build the full solver prompt for a stage
+def build_solver_prompt(problem, stage, user_input, history_text, hint_count):
+    """
+    Return the prompt for the given stage, or None if the stage is unknown.
+    `history_text` is the compacted conversation from SolverContext.
+    """
+    # Core prompt logic
+    base_system_prompt = (
+        "You are an expert DSA mentor. "
+        "You help students solve coding problems step-by-step. "
+        "Your tone is encouraging and structured. "
+        "You always respond in clean Markdown (use bullet points, code blocks where needed). "
+        "IMPORTANT: When giving hints, be progressive. If you've given hints before, make the next one more specific. "
+        "CRITICAL: When you see conversation history, anything marked [YOU (MENTOR) SAID] was YOUR previous response - do not praise the student for it. "
+        "Only praise the student for their own thoughts marked as [STUDENT SAID]."
+    )
+    
+    # Build context from conversation history
+    context = ""
+    if history_text:
+        context = "\n\nPrevious conversation (for your context - you are the Mentor):\n"
+        context += "=" * 60 + "\n"
+        context += history_text + "\n\n"
+        context += "=" * 60 + "\n"
+        context += "Remember: Everything marked [YOU (MENTOR) SAID] was YOUR previous response, not the student's work.\n"
+    
+    # Stage-specific instructions
+    if stage == 'explain':
+        user_prompt = (
+            f"Explain the following problem in simple, beginner-friendly language:\n\n{problem}"
+        )
+    elif stage == 'hint':
+        # Previous hints make the next one more specific
+        if hint_count == 0:
+            hint_instruction = "Give the FIRST hint - be vague and high-level. Just point towards the general approach or data structure without specifics."
+        elif hint_count == 1:
+            hint_instruction = "Give the SECOND hint - be more specific. Mention the exact approach or algorithm, but don't reveal implementation details."
+        elif hint_count == 2:
+            hint_instruction = "Give the THIRD hint - be very direct. Provide key implementation details, edge cases, or the main logic flow."
+        else:
+            hint_instruction = "Give a FINAL hint - at this point, provide almost the complete approach with pseudocode if needed."
+        
+        user_prompt = (
+            f"{hint_instruction}\n\n"
+            f"Problem:\n{problem}\n"
+            f"{context}"
+        )
+    elif stage == 'feedback':
+        user_prompt = (
+            "You are evaluating a student's partial idea. "
+            "Give constructive feedback — tell what's good and what can improve. "
+            "Do not give the full solution yet.\n\n"
+            f"Student's thought:\n{user_input}\n\n"
+            f"Problem:\n{problem}\n"
+            f"{context}"
+        )
+    elif stage == 'solution':
+        user_prompt = (
+            "Now provide the full optimal solution with step-by-step explanation, "
+            "time and space complexity, and possible alternative approaches.\n\n"
+            f"Problem:\n{problem}\n"
+            f"{context}"
+        )
+    else:
+        return None
+    
+    return f"{base_system_prompt}\n\n{user_prompt}"
+
+# Solver history beyond the last few turns is folded into a cached summary
+solver_context = SolverContext(
+    lambda prompt: generate_text(prompt, 'solve_summary'),
+    recent_turns=int(os.getenv('SOLVER_RECENT_TURNS', 6)),
+    block_turns=int(os.getenv('SOLVER_SUMMARY_BLOCK', 4)),
+    max_tokens=int(os.getenv('SOLVER_CONTEXT_TOKENS', 3000))
+)
+
+# Helper function to compact a solver request's history and build its prompt
+def prepare_solver_prompt(data, problem, stage, user_input, session=None):
+    """
+    Return (prompt, prompt size stats), or (None, None) for an unknown stage.
+    Messages may carry a `stage` tag; the hint count comes from those tags
+    unless the client sends `hint_count` itself. For a `session`, its stored
+    running summary is used and advanced.
+    """
+    if f'solve_{stage}' not in LLM_CACHE_TTLS:
+        return None, None
+    
+    history = data.get('conversation_history') or []
+    
+    hint_count = data.get('hint_count')
+    if not isinstance(hint_count, int):
+        hint_count = count_hints(history)
+    
+    # Explaining the problem doesn't use the history, so skip compacting it
+    if stage == 'explain':
+        compacted = CompactedHistory('', [], 0, 0)
+    elif session:
+        compacted = solver_context.compact(history, (session.summary, session.summary_turns))
+        if compacted.summary and compacted.summarized > session.summary_turns:
+            try:
+                solver_sessions.save_summary(session, compacted.summary, compacted.summarized)
+            except Exception as e:
+                print(f"Error saving solver summary: {e}")
+    else:
+        compacted = solver_context.compact(history)
+    
+    prompt = build_solver_prompt(problem, stage, user_input, compacted.render(), hint_count)
+    if prompt is None:
+        return None, None
+    
+    return prompt, dict(compacted.stats(),
+                        history_turns=len(history),
+                        chars=len(prompt),
+                        estimated_tokens=estimate_tokens(prompt))
+
+# Helper function to build the `done` event that ends a streamed solver reply
+def solver_done_event(stage, meta, started, first_token_ms, prompt, prompt_stats):
+    usage = meta.get('usage_metadata')
+    return sse_event('done', {
+        'stage': stage,
+        'cached': meta.get('cached', False),
+        'coalesced': meta.get('coalesced', False),
+        'latency_ms': round((time.monotonic() - started) * 1000),
+        'first_token_ms': first_token_ms,
+        'prompt_chars': len(prompt),
+        'prompt': prompt_stats,
+        'usage': {
+            'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+            'response_tokens': getattr(usage, 'candidates_token_count', None),
+            'total_tokens': getattr(usage, 'total_token_count', None)
+        } if usage else None
+    })
+
+# Helper function to stream a solver reply as Server-Sent Events
+def stream_solver_events(prompt, stage, prompt_stats, bypass_cache, on_complete=None):
+    """
+    Yield `token` events as Gemini produces text, then a `done` event with
+    latency and usage metadata (or an `error` event). `on_complete(text)`
+    runs with the full reply before `done` is sent.
+    """
+    started = time.monotonic()
+    first_token_ms = None
+    meta = {}
+    parts = []
+    try:
+        chunks = llm_gateway.stream(
+            f'solve_{stage}', prompt,
+            ttl=LLM_CACHE_TTLS[f'solve_{stage}'], bypass=bypass_cache, meta=meta
+        )
+        # Werkzeug closes this generator when the client disconnects,
+        # which closes `chunks` and cancels the upstream request.
+        for text in chunks:
+            if first_token_ms is None:
+                first_token_ms = round((time.monotonic() - started) * 1000)
+            parts.append(text)
+            yield sse_event('token', {'text': text})
+        
+        if on_complete:
+            on_complete(''.join(parts).strip())
+        
+        yield solver_done_event(stage, meta, started, first_token_ms, prompt, prompt_stats)
+    except LLMUnavailable as e:
+        yield sse_event('error', {'error': str(e)})
+    except Exception as e:
+        print('Error streaming solver response:', e)
+        yield sse_event('error', {'error': 'Something went wrong processing your request.'})
+
+@api.route('/api/solve-problem', methods=['POST'])
 def solve_problem():
     """
     Step-by-step guided DSA problem solver.
@@ -821,593 +2053,385 @@ def solve_problem():
         problem = data.get('problem', '').strip()
         stage = data.get('stage', 'explain')
         user_input = data.get('user_input', '').strip()
-        conversation_history = data.get('conversation_history', [])  # NEW: Get history
         
         if not problem:
             return jsonify({'error': 'Problem statement missing'}), 400
         
-        # Core prompt logic
-        base_system_prompt = (
-            "You are an expert DSA mentor. "
-            "You help students solve coding problems step-by-step. "
-            "Your tone is encouraging and structured. "
-            "You always respond in clean Markdown (use bullet points, code blocks where needed). "
-            "IMPORTANT: When giving hints, be progressive. If you've given hints before, make the next one more specific. "
-            "CRITICAL: When you see conversation history, anything marked [YOU (MENTOR) SAID] was YOUR previous response - do not praise the student for it. "
-            "Only praise the student for their own thoughts marked as [STUDENT SAID]."
-        )
-        
-        # Build context from conversation history
-        context = ""
-        if conversation_history:
-            context = "\n\nPrevious conversation (for your context - you are the Mentor):\n"
-            context += "=" * 60 + "\n"
-            for msg in conversation_history:
-                role = msg.get('role', '')
-                content = msg.get('content', '')
-                if role == 'user':
-                    context += f"[STUDENT SAID]: {content}\n\n"
-                elif role == 'assistant':
-                    context += f"[YOU (MENTOR) SAID]: {content}\n\n"
-            context += "=" * 60 + "\n"
-            context += "Remember: Everything marked [YOU (MENTOR) SAID] was YOUR previous response, not the student's work.\n"
-        
-        # Stage-specific instructions
-        if stage == 'explain':
-            user_prompt = (
-                f"Explain the following problem in simple, beginner-friendly language:\n\n{problem}"
-            )
-        elif stage == 'hint':
-            # Count previous hints to make them progressive
-            hint_count = sum(1 for msg in conversation_history if msg.get('role') == 'user' and 'hint' in msg.get('content', '').lower())
-            
-            if hint_count == 0:
-                hint_instruction = "Give the FIRST hint - be vague and high-level. Just point towards the general approach or data structure without specifics."
-            elif hint_count == 1:
-                hint_instruction = "Give the SECOND hint - be more specific. Mention the exact approach or algorithm, but don't reveal implementation details."
-            elif hint_count == 2:
-                hint_instruction = "Give the THIRD hint - be very direct. Provide key implementation details, edge cases, or the main logic flow."
-            else:
-                hint_instruction = "Give a FINAL hint - at this point, provide almost the complete approach with pseudocode if needed."
-            
-            user_prompt = (
-                f"{hint_instruction}\n\n"
-                f"Problem:\n{problem}\n"
-                f"{context}"
-            )
-        elif stage == 'feedback':
-            user_prompt = (
-                "You are evaluating a student's partial idea. "
-                "Give constructive feedback — tell what's good and what can improve. "
-                "Do not give the full solution yet.\n\n"
-                f"Student's thought:\n{user_input}\n\n"
-                f"Problem:\n{problem}\n"
-                f"{context}"
-            )
-        elif stage == 'solution':
-            user_prompt = (
-                "Now provide the full optimal solution with step-by-step explanation, "
-                "time and space complexity, and possible alternative approaches.\n\n"
-                f"Problem:\n{problem}\n"
-                f"{context}"
-            )
-        else:
+        prompt, prompt_stats = prepare_solver_prompt(data, problem, stage, user_input)
+        if prompt is None:
             return jsonify({'error': 'Invalid stage'}), 400
         
         # Generate response from Gemini
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content(f"{base_system_prompt}\n\n{user_prompt}")
-        
-        output = response.text.strip() if response and hasattr(response, 'text') else 'No response.'
+        output = generate_text(
+            prompt,
+            f'solve_{stage}',
+            bypass=cache_bypass_requested()
+        ).strip() or 'No response.'
         
-        return jsonify({'response': output}), 200
+        return jsonify({'response': output, 'stage': stage, 'prompt': prompt_stats}), 200
         
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         print('Error in /api/solve-problem:', e)
         return jsonify({'error': 'Something went wrong processing your request.'}), 500
 
-# ========== LEADERBOARD ENDPOINT ==========
+@api.route('/api/solve-problem/stream', methods=['POST'])
+def solve_problem_stream():
+    """
+    Streaming variant of /api/solve-problem. Sends `token` events as Gemini
+    produces text, then a `done` event with latency and usage metadata (or an
+    `error` event). Takes the same JSON body as the buffered endpoint.
+    """
+    if not GEMINI_API_KEY:
+        return jsonify({'error': 'Gemini API key not configured'}), 500
+    
+    data = request.get_json()
+    problem = data.get('problem', '').strip()
+    stage = data.get('stage', 'explain')
+    user_input = data.get('user_input', '').strip()
+    
+    if not problem:
+        return jsonify({'error': 'Problem statement missing'}), 400
+    
+    prompt, prompt_stats = prepare_solver_prompt(data, problem, stage, user_input)
+    if prompt is None:
+        return jsonify({'error': 'Invalid stage'}), 400
+    
+    return Response(
+        stream_with_context(stream_solver_events(prompt, stage, prompt_stats, cache_bypass_requested())),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ========== SOLVER SESSION ENDPOINTS ==========
+
+# Solver conversations kept server-side; idle ones leave memory after
+# SOLVER_SESSION_IDLE_TTL and the database after SOLVER_SESSION_RETENTION
+solver_sessions = SolverSessions(
+    get_db_connection,
+    idle_ttl=int(os.getenv('SOLVER_SESSION_IDLE_TTL', 1800)),
+    retention=int(os.getenv('SOLVER_SESSION_RETENTION', 7 * 24 * 3600))
+)
 
-@app.route('/api/leaderboard', methods=['GET'])
-def get_leaderboard():
+# Helper function to describe the student's side of a turn, as the solver page shows it
+def solver_user_turn(stage, user_input):
+    """Return the stored user message for a stage (None for explain)."""
+    if stage == 'hint':
+        content = 'Can I have a hint?'
+    elif stage == 'feedback':
+        content = f"💡 My thought: {user_input}"
+    elif stage == 'solution':
+        content = 'Please show me the complete solution.'
+    else:
+        return None
+    return {'role': 'user', 'stage': stage, 'content': content}
+
+# Helper function to build the prompt for a session's next turn
+def build_session_turn(session, data):
+    """
+    Return the turn (session, stage, stored user message, prompt and prompt
+    size stats) for a request body, or None for an unknown stage. Call with
+    session.lock held, so the prompt includes the turn before it and only
+    one turn advances the stored summary.
+    """
+    stage = data.get('stage', 'explain')
+    user_input = (data.get('user_input') or '').strip()
+    
+    prompt, prompt_stats = prepare_solver_prompt(
+        {'conversation_history': session.turns}, session.problem, stage, user_input, session
+    )
+    if prompt is None:
+        return None
+    
+    return {
+        'session': session,
+        'stage': stage,
+        'user_turn': solver_user_turn(stage, user_input),
+        'prompt': prompt,
+        'prompt_stats': prompt_stats
+    }
+
+# Helper function to load a session and check the request for its next turn
+def prepare_session_turn(session_id):
+    """Return (session, request body, None) or (None, None, error response)."""
+    session = solver_sessions.get(session_id)
+    if not session:
+        return None, None, (jsonify({'error': 'Session not found'}), 404)
+    
+    data = request.get_json(silent=True) or {}
+    if f"solve_{data.get('stage', 'explain')}" not in LLM_CACHE_TTLS:
+        return None, None, (jsonify({'error': 'Invalid stage'}), 400)
+    
+    return session, data, None
+
+# Helper function to build a session turn inside a stream, where errors become events
+def build_streamed_session_turn(session, data):
+    """Return (turn, None) or (None, error event); see build_session_turn."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT u.name, u.email, SUM(p.points) as total_points, COUNT(p.id) as total_problems
-               FROM users u
-               LEFT JOIN problems p ON u.id = p.user_id
-               GROUP BY u.id
-               ORDER BY total_points DESC, total_problems DESC
-               LIMIT 10'''
-        )
-        leaderboard = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(leaderboard), 200
-        
+        turn = build_session_turn(session, data)
+    except LLMUnavailable as e:
+        return None, sse_event('error', {'error': str(e)})
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-# ========== HEALTH CHECK ==========
-
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5000)
-
-# ========== AUTHENTICATION ENDPOINTS ==========
-
-@app.route('/api/register', methods=['POST'])
-def register():
+        print('Error preparing solver session turn:', e)
+        return None, sse_event('error', {'error': 'Something went wrong processing your request.'})
+    if turn is None:
+        return None, sse_event('error', {'error': 'Invalid stage'})
+    return turn, None
+
+# Helper function to store both sides of a finished turn on its session
+def record_session_turn(turn, output):
+    messages = [turn['user_turn']] if turn['user_turn'] else []
+    messages.append({'role': 'assistant', 'stage': turn['stage'], 'content': output})
+    solver_sessions.append(turn['session'], *messages)
+
+@api.route('/api/solver/sessions', methods=['POST'])
+def create_solver_session():
+    """Start a session; later turns send only their stage and input."""
     try:
-        data = request.json
-        name = data.get('name')
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not all([name, email, password]):
-            return jsonify({'error': 'All fields are required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if email already exists
-        cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
-        if cursor.fetchone():
-            cursor.close()
-            conn.close()
-            return jsonify({'error': 'Email already registered'}), 409
-        
-        # Hash password and insert user
-        hashed_password = generate_password_hash(password)
-        cursor.execute(
-            'INSERT INTO users (name, email, password) VALUES (%s, %s, %s)',
-            (name, email, hashed_password)
-        )
-        conn.commit()
-        user_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
+        data = request.get_json(silent=True) or {}
+        problem = (data.get('problem') or '').strip()
+        if not problem:
+            return jsonify({'error': 'Problem statement missing'}), 400
         
-        return jsonify({
-            'message': 'Registration successful',
-            'user': {'id': user_id, 'name': name, 'email': email}
-        }), 201
+        session = solver_sessions.create(problem, data.get('user_id'))
+        return jsonify({'session_id': session.id}), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/login', methods=['POST'])
-def login():
+@api.route('/api/solver/sessions/<session_id>', methods=['GET'])
+def get_solver_session(session_id):
     try:
-        data = request.json
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not all([email, password]):
-            return jsonify({'error': 'Email and password required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-        user = cursor.fetchone()
-        
-        cursor.close()
-        conn.close()
-        
-        if not user or not check_password_hash(user['password'], password):
-            return jsonify({'error': 'Invalid credentials'}), 401
-        
-        return jsonify({
-            'message': 'Login successful',
-            'user': {
-                'id': user['id'],
-                'name': user['name'],
-                'email': user['email']
-            }
-        }), 200
+        session = solver_sessions.get(session_id)
+        if not session:
+            return jsonify({'error': 'Session not found'}), 404
+        return jsonify(session.to_dict()), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# ========== PROBLEM TRACKER ENDPOINTS ==========
-
-@app.route('/api/problems', methods=['GET'])
-def get_problems():
+@api.route('/api/solver/sessions/<session_id>', methods=['DELETE'])
+def delete_solver_session(session_id):
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT * FROM problems WHERE user_id = %s ORDER BY created_at DESC',
-            (user_id,)
-        )
-        problems = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(problems), 200
+        if not solver_sessions.delete(session_id):
+            return jsonify({'error': 'Session not found'}), 404
+        return jsonify({'message': 'Session deleted'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/problems', methods=['POST'])
-def add_problem():
+@api.route('/api/solver/sessions/<session_id>/turns', methods=['POST'])
+def solver_session_turn(session_id):
+    """Run one solver stage on a session and store both sides of the turn."""
     try:
-        data = request.json
-        user_id = data.get('user_id')
-        number = data.get('number')
-        name = data.get('name')
-        difficulty = data.get('difficulty')
-        topic = data.get('topic')
-        summary = data.get('summary', '')
-        
-        if not all([user_id, number, name, difficulty, topic]):
-            return jsonify({'error': 'All fields except summary are required'}), 400
-        
-        # Calculate points based on difficulty
-        points = {'Easy': 10, 'Medium': 25, 'Hard': 50}.get(difficulty, 10)
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        if not GEMINI_API_KEY:
+            return jsonify({'error': 'Gemini API key not configured'}), 500
         
-        cursor.execute(
-            '''INSERT INTO problems (user_id, number, name, difficulty, topic, summary, points)
-               VALUES (%s, %s, %s, %s, %s, %s, %s)''',
-            (user_id, number, name, difficulty, topic, summary, points)
-        )
-        conn.commit()
-        problem_id = cursor.lastrowid
+        session, data, error = prepare_session_turn(session_id)
+        if error:
+            return error
         
-        cursor.close()
-        conn.close()
+        if not session.lock.acquire(blocking=False):
+            return jsonify({'error': 'Another turn is already in progress'}), 409
+        try:
+            turn = build_session_turn(session, data)
+            if turn is None:
+                return jsonify({'error': 'Invalid stage'}), 400
+            output = generate_text(
+                turn['prompt'],
+                f"solve_{turn['stage']}",
+                bypass=cache_bypass_requested()
+            ).strip() or 'No response.'
+            record_session_turn(turn, output)
+        finally:
+            session.lock.release()
         
         return jsonify({
-            'message': 'Problem added successfully',
-            'id': problem_id
-        }), 201
+            'response': output,
+            'stage': turn['stage'],
+            'turn_count': len(session.turns),
+            'prompt': turn['prompt_stats']
+        }), 200
         
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        print('Error in /api/solver/sessions turn:', e)
+        return jsonify({'error': 'Something went wrong processing your request.'}), 500
 
-@app.route('/api/problems/<int:problem_id>', methods=['PUT'])
-def update_problem(problem_id):
-    try:
-        data = request.json
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build update query dynamically
-        update_fields = []
-        values = []
-        
-        if 'number' in data:
-            update_fields.append('number = %s')
-            values.append(data['number'])
-        if 'name' in data:
-            update_fields.append('name = %s')
-            values.append(data['name'])
-        if 'difficulty' in data:
-            update_fields.append('difficulty = %s')
-            values.append(data['difficulty'])
-            # Update points based on new difficulty
-            points = {'Easy': 10, 'Medium': 25, 'Hard': 50}.get(data['difficulty'], 10)
-            update_fields.append('points = %s')
-            values.append(points)
-        if 'topic' in data:
-            update_fields.append('topic = %s')
-            values.append(data['topic'])
-        if 'summary' in data:
-            update_fields.append('summary = %s')
-            values.append(data['summary'])
-        
-        if not update_fields:
-            return jsonify({'error': 'No fields to update'}), 400
-        
-        values.append(problem_id)
-        query = f"UPDATE problems SET {', '.join(update_fields)} WHERE id = %s"
-        
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'message': 'Problem updated successfully'}), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+@api.route('/api/solver/sessions/<session_id>/turns/stream', methods=['POST'])
+def solver_session_turn_stream(session_id):
+    """SSE variant of a session turn; the turn is stored once the reply completes."""
+    if not GEMINI_API_KEY:
+        return jsonify({'error': 'Gemini API key not configured'}), 500
+    
+    session, data, error = prepare_session_turn(session_id)
+    if error:
+        return error
+    
+    bypass_cache = cache_bypass_requested()
+    
+    def generate():
+        # Taken inside the generator so a response that is never iterated
+        # can't leave the session locked
+        if not session.lock.acquire(blocking=False):
+            yield sse_event('error', {'error': 'Another turn is already in progress'})
+            return
+        try:
+            turn, error_event = build_streamed_session_turn(session, data)
+            if error_event:
+                yield error_event
+                return
+            yield from stream_solver_events(
+                turn['prompt'], turn['stage'], turn['prompt_stats'], bypass_cache,
+                on_complete=lambda output: record_session_turn(turn, output or 'No response.')
+            )
+        finally:
+            session.lock.release()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-@app.route('/api/problems/<int:problem_id>', methods=['DELETE'])
-def delete_problem(problem_id):
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM problems WHERE id = %s', (problem_id,))
-        conn.commit()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'message': 'Problem deleted successfully'}), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+# ========== LEADERBOARD ENDPOINT ==========
 
-# ========== DASHBOARD ANALYTICS ENDPOINTS ==========
+# Helper function to parse a page size argument
+def get_limit_arg(default=10, maximum=100):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
 
-@app.route('/api/analytics/difficulty', methods=['GET'])
-def analytics_by_difficulty():
+@api.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT difficulty, COUNT(*) as count
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY difficulty''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(results), 200
+        return jsonify(leaderboard.top(get_limit_arg())), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/topic', methods=['GET'])
-def analytics_by_topic():
+@api.route('/api/leaderboard/page', methods=['GET'])
+def get_leaderboard_page():
+    """Cursor-paginated leaderboard; pass next_cursor back to get the following page."""
     try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT topic, COUNT(*) as count
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY topic
-               ORDER BY count DESC''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        try:
+            entries, next_cursor = leaderboard.page(request.args.get('cursor'), get_limit_arg())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify(results), 200
+        return jsonify({'entries': entries, 'next_cursor': next_cursor}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/points', methods=['GET'])
-def analytics_points_over_time():
+@api.route('/api/leaderboard/rank', methods=['GET'])
+def get_leaderboard_rank():
     try:
-        user_id = request.args.get('user_id')
+        user_id = request.args.get('user_id', type=int)
         if not user_id:
             return jsonify({'error': 'user_id required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        position = leaderboard.rank(user_id)
+        if not position:
+            return jsonify({'error': 'User not found'}), 404
         
-        cursor.execute(
-            '''SELECT DATE(created_at) as date, SUM(points) as total_points
-               FROM problems
-               WHERE user_id = %s
-               GROUP BY DATE(created_at)
-               ORDER BY date ASC''',
-            (user_id,)
-        )
-        results = cursor.fetchall()
-        
-        # Calculate cumulative points
-        cumulative = 0
-        cumulative_data = []
-        for row in results:
-            cumulative += row['total_points']
-            cumulative_data.append({
-                'date': row['date'].strftime('%Y-%m-%d'),
-                'points': cumulative
-            })
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(cumulative_data), 200
+        return jsonify(dict(position, total_users=len(leaderboard))), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/analytics/summary', methods=['GET'])
-def analytics_summary():
-    try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Total problems
-        cursor.execute(
-            'SELECT COUNT(*) as total FROM problems WHERE user_id = %s',
-            (user_id,)
-        )
-        total = cursor.fetchone()['total']
-        
-        # Total points
-        cursor.execute(
-            'SELECT SUM(points) as total_points FROM problems WHERE user_id = %s',
-            (user_id,)
-        )
-        points_result = cursor.fetchone()
-        total_points = points_result['total_points'] if points_result['total_points'] else 0
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'total_problems': total,
-            'total_points': total_points
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+# ========== METRICS ==========
+
+# Requests slower than this are logged with their time broken down by span
+metrics.registry.slow_request_seconds = float(os.getenv('SLOW_REQUEST_MS', 1000)) / 1000
+
+# Registered before the other request hooks, so requests they answer early are timed too
+@api.before_app_request
+def start_request_trace():
+    metrics.start_trace()
+
+@api.after_app_request
+def finish_request_trace(response):
+    trace = metrics.current_trace()
+    if trace is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        method, status = request.method, response.status_code
+        # A streamed body is still being sent here; stop the clock once it's done
+        response.call_on_close(lambda: metrics.finish_trace(trace, method, route, status))
+    return response
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, span and Gemini call latency histograms in Prometheus text format."""
+    stages = llm_gateway.stats()['stages']
+    text = metrics.registry.render() + metrics.render_histogram(
+        'llm_call_duration_seconds',
+        'Gemini call latency by stage, retries included.',
+        [({'stage': stage}, counters['latency']) for stage, counters in sorted(stages.items())]
+    )
+    return Response(text, mimetype='text/plain; version=0.0.4'), 200
+
+# ========== ERROR HANDLERS ==========
+
+@api.app_errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)}MB)'}), 413
+
+@api.before_app_request
+def reject_oversized_body():
+    # Refuse from the Content-Length header alone, before reading the body
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    if limit and request.content_length and request.content_length > limit:
+        return request_too_large(None)
 
-# ========== RESUME UPLOAD ENDPOINT ==========
+# ========== HEALTH CHECK ==========
 
-@app.route('/api/upload-resume', methods=['POST'])
-def upload_resume():
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        user_id = request.form.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Only PDF files allowed'}), 400
-        
-        # Generate unique filename
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"resumes/{user_id}_{uuid.uuid4()}.{file_extension}"
-        
-        # Upload to S3
-        s3_client.upload_fileobj(
-            file,
-            S3_BUCKET,
-            unique_filename,
-            ExtraArgs={'ContentType': 'application/pdf'}
-        )
-        
-        # Generate presigned URL (valid for 1 hour)
-        file_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': S3_BUCKET, 'Key': unique_filename},
-            ExpiresIn=3600
-        )
-        
-        # Save to database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''INSERT INTO resumes (user_id, filename, s3_key, file_url)
-               VALUES (%s, %s, %s, %s)''',
-            (user_id, file.filename, unique_filename, file_url)
-        )
+@api.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'db_pool': get_db_pool().stats(),
+        'llm_cache': llm_cache.stats(),
+        'llm_gateway': llm_gateway.stats(),
+        'resume_jobs': resume_jobs.stats(),
+        'presigned_urls': presigned_urls.stats(),
+        'pdf_extractor': pdf_extractor.stats(),
+        'notes_autosave': notes_autosave.stats(),
+        'solver_context': solver_context.stats(),
+        'solver_sessions': solver_sessions.stats(),
+        'problem_catalog': problem_catalog.stats()
+    }), 200
+
+# ========== MAINTENANCE COMMANDS ==========
+
+@api.cli.command('rebuild-stats')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+def rebuild_stats_command(user_id):
+    """Backfill the precomputed analytics tables from problems."""
+    with get_db_connection() as conn, conn.cursor() as cursor:
+        stats.rebuild(cursor, user_id)
         conn.commit()
-        resume_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'message': 'Resume uploaded successfully',
-            'resume_id': resume_id,
-            'file_url': file_url
-        }), 201
-        
-    except ClientError as e:
-        return jsonify({'error': f'AWS S3 error: {str(e)}'}), 500
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    click.echo('User stats rebuilt' + (f' for user {user_id}' if user_id else ''))
 
-@app.route('/api/resumes', methods=['GET'])
-def get_resumes():
-    try:
-        user_id = request.args.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id required'}), 400
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT * FROM resumes WHERE user_id = %s ORDER BY uploaded_at DESC',
-            (user_id,)
-        )
-        resumes = cursor.fetchall()
-        
-        # Generate fresh presigned URLs
-        for resume in resumes:
-            resume['file_url'] = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': resume['s3_key']},
-                ExpiresIn=3600
-            )
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(resumes), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-# ========== LEADERBOARD ENDPOINT ==========
+# ========== APPLICATION FACTORY ==========
 
-@app.route('/api/leaderboard', methods=['GET'])
-def get_leaderboard():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            '''SELECT u.name, u.email, SUM(p.points) as total_points, COUNT(p.id) as total_problems
-               FROM users u
-               LEFT JOIN problems p ON u.id = p.user_id
-               GROUP BY u.id
-               ORDER BY total_points DESC, total_problems DESC
-               LIMIT 10'''
-        )
-        leaderboard = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(leaderboard), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-# ========== HEALTH CHECK ==========
+def create_app(config=None):
+    """
+    Build the Flask app. S3, Gemini and the database pool are set up on
+    first use rather than here, so creating an app is cheap.
+    """
+    app = Flask(__name__)
+    CORS(app, expose_headers=['X-Next-Cursor'])
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
+    app.request_class = UploadRequest
+    if config:
+        app.config.update(config)
+    app.register_blueprint(api)
+    return app
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
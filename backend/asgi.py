@@ -0,0 +1,490 @@
+"""
+ASGI entry point for the backend: `uvicorn asgi:app`.
+
+The guided-solver endpoints spend nearly all their time waiting on Gemini.
+Under ASGI they run as coroutines on the event loop and await the LLM
+gateway's async API, so a waiting request holds no thread and one process
+can keep thousands of them open. Every other route, and anything that
+doesn't match a native route exactly, is served by the Flask app on a
+thread pool (WSGI_THREADS threads, default 40) through asgiref's
+WsgiToAsgi, so a long Flask stream such as a job's event feed holds one
+thread and doesn't hold up other requests. Route behaviour and JSON shapes
+are therefore the same whichever way the app is served.
+
+The adapter spools the whole request body before Flask sees it, so bodies
+over MAX_CONTENT_LENGTH are refused here first: by Content-Length before
+anything is read, or as soon as a streamed body passes the limit.
+
+Native routes:
+
+    POST /api/solve-problem
+    POST /api/solve-problem/stream
+    POST /api/solver/sessions/<id>/turns
+    POST /api/solver/sessions/<id>/turns/stream
+
+Their database work (loading a session, storing a turn) is a few
+primary-key queries, run on worker threads through the existing connection
+pool. So is prompt preparation, which may summarize a long history.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import app as backend
+import metrics
+from llm_gateway import LLMUnavailable
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+GENERIC_ERROR = 'Something went wrong processing your request.'
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {key: values[-1] for key, values in
+                     parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope.get('headers', [])}
+        self.body = body
+
+    def get_json(self, silent=False):
+        """Parsed JSON body; None (with `silent`) or ValueError if it isn't JSON."""
+        try:
+            if not self.headers.get('content-type', '').startswith('application/json'):
+                raise ValueError('Expected a JSON body')
+            return json.loads(self.body or b'null')
+        except ValueError:
+            if silent:
+                return None
+            raise
+
+    def cache_bypass_requested(self, data):
+        # Same rule as the Flask helper: ?no_cache=1 or "no_cache": true in the body
+        value = self.args.get('no_cache')
+        if value is None and isinstance(data, dict):
+            value = data.get('no_cache')
+        return str(value).lower() in ('1', 'true', 'yes')
+
+
+def cors_headers(request):
+    # Matches flask-cors's defaults for this app (any origin)
+    if 'origin' in request.headers:
+        return [(b'access-control-allow-origin', b'*'),
+                (b'access-control-expose-headers', b'X-Next-Cursor')]
+    return []
+
+
+async def send_json(send, request, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode())] + cors_headers(request),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def send_events(receive, send, request, events):
+    """
+    Stream an async iterator of SSE strings. If the client disconnects the
+    producer is cancelled, which closes the upstream Gemini stream.
+    """
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': SSE_HEADERS + cors_headers(request)})
+
+    async def pump():
+        async for event in events:
+            await send({'type': 'http.response.body', 'body': event.encode('utf-8'),
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    producer = asyncio.ensure_future(pump())
+    watcher = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({producer, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (producer, watcher):
+            task.cancel()
+        await asyncio.gather(producer, watcher, return_exceptions=True)
+        await events.aclose()
+
+
+async def solver_events(prompt, stage, prompt_stats, bypass_cache, on_complete=None):
+    """Async counterpart of app.stream_solver_events; `on_complete` is awaited."""
+    started = time.monotonic()
+    first_token_ms = None
+    meta = {}
+    parts = []
+    try:
+        async for text in backend.llm_gateway.astream(
+            f'solve_{stage}', prompt,
+            ttl=backend.LLM_CACHE_TTLS[f'solve_{stage}'], bypass=bypass_cache, meta=meta
+        ):
+            if first_token_ms is None:
+                first_token_ms = round((time.monotonic() - started) * 1000)
+            parts.append(text)
+            yield backend.sse_event('token', {'text': text})
+
+        if on_complete:
+            await on_complete(''.join(parts).strip())
+
+        yield backend.solver_done_event(stage, meta, started, first_token_ms, prompt, prompt_stats)
+    except LLMUnavailable as e:
+        yield backend.sse_event('error', {'error': str(e)})
+    except Exception as e:
+        print('Error streaming solver response:', e)
+        yield backend.sse_event('error', {'error': GENERIC_ERROR})
+
+
+async def prepare_solve(request):
+    """Return (data, prompt, stage, prompt_stats, None) or (..., (error, status))."""
+    data = request.get_json()
+    problem = data.get('problem', '').strip()
+    stage = data.get('stage', 'explain')
+    user_input = data.get('user_input', '').strip()
+
+    if not problem:
+        return data, None, stage, None, ({'error': 'Problem statement missing'}, 400)
+
+    prompt, prompt_stats = await asyncio.to_thread(
+        backend.prepare_solver_prompt, data, problem, stage, user_input
+    )
+    if prompt is None:
+        return data, None, stage, None, ({'error': 'Invalid stage'}, 400)
+    return data, prompt, stage, prompt_stats, None
+
+
+async def solve_problem(request, receive, send):
+    try:
+        if not backend.GEMINI_API_KEY:
+            return await send_json(send, request, {'error': 'Gemini API key not configured'}, 500)
+
+        data, prompt, stage, prompt_stats, error = await prepare_solve(request)
+        if error:
+            return await send_json(send, request, *error)
+
+        output = (await backend.llm_gateway.agenerate(
+            f'solve_{stage}', prompt,
+            ttl=backend.LLM_CACHE_TTLS[f'solve_{stage}'],
+            bypass=request.cache_bypass_requested(data)
+        )).strip() or 'No response.'
+
+        await send_json(send, request, {'response': output, 'stage': stage, 'prompt': prompt_stats})
+
+    except LLMUnavailable as e:
+        await send_json(send, request, {'error': str(e)}, 503)
+    except Exception as e:
+        print('Error in /api/solve-problem:', e)
+        await send_json(send, request, {'error': GENERIC_ERROR}, 500)
+
+
+async def solve_problem_stream(request, receive, send):
+    if not backend.GEMINI_API_KEY:
+        return await send_json(send, request, {'error': 'Gemini API key not configured'}, 500)
+
+    data, prompt, stage, prompt_stats, error = await prepare_solve(request)
+    if error:
+        return await send_json(send, request, *error)
+
+    await send_events(receive, send, request, solver_events(
+        prompt, stage, prompt_stats, request.cache_bypass_requested(data)
+    ))
+
+
+async def prepare_session_turn(request, session_id):
+    """Async app.prepare_session_turn: (session, data, None) or (None, None, (error, status))."""
+    session = await asyncio.to_thread(backend.solver_sessions.get, session_id)
+    if not session:
+        return None, None, ({'error': 'Session not found'}, 404)
+
+    data = request.get_json(silent=True) or {}
+    if f"solve_{data.get('stage', 'explain')}" not in backend.LLM_CACHE_TTLS:
+        return None, None, ({'error': 'Invalid stage'}, 400)
+    return session, data, None
+
+
+async def solver_session_turn(request, receive, send, session_id):
+    try:
+        if not backend.GEMINI_API_KEY:
+            return await send_json(send, request, {'error': 'Gemini API key not configured'}, 500)
+
+        session, data, error = await prepare_session_turn(request, session_id)
+        if error:
+            return await send_json(send, request, *error)
+
+        if not session.lock.acquire(blocking=False):
+            return await send_json(send, request, {'error': 'Another turn is already in progress'}, 409)
+        try:
+            # Built under the lock; see app.build_session_turn
+            turn = await asyncio.to_thread(backend.build_session_turn, session, data)
+            if turn is None:
+                return await send_json(send, request, {'error': 'Invalid stage'}, 400)
+            output = (await backend.llm_gateway.agenerate(
+                f"solve_{turn['stage']}", turn['prompt'],
+                ttl=backend.LLM_CACHE_TTLS[f"solve_{turn['stage']}"],
+                bypass=request.cache_bypass_requested(data)
+            )).strip() or 'No response.'
+            await asyncio.to_thread(backend.record_session_turn, turn, output)
+        finally:
+            session.lock.release()
+
+        await send_json(send, request, {
+            'response': output,
+            'stage': turn['stage'],
+            'turn_count': len(session.turns),
+            'prompt': turn['prompt_stats']
+        })
+
+    except LLMUnavailable as e:
+        await send_json(send, request, {'error': str(e)}, 503)
+    except Exception as e:
+        print('Error in /api/solver/sessions turn:', e)
+        await send_json(send, request, {'error': GENERIC_ERROR}, 500)
+
+
+async def solver_session_turn_stream(request, receive, send, session_id):
+    if not backend.GEMINI_API_KEY:
+        return await send_json(send, request, {'error': 'Gemini API key not configured'}, 500)
+
+    session, data, error = await prepare_session_turn(request, session_id)
+    if error:
+        return await send_json(send, request, *error)
+
+    bypass_cache = request.cache_bypass_requested(data)
+
+    async def events():
+        # Taken inside the generator so a stream that never starts can't
+        # leave the session locked
+        if not session.lock.acquire(blocking=False):
+            yield backend.sse_event('error', {'error': 'Another turn is already in progress'})
+            return
+        try:
+            turn, error_event = await asyncio.to_thread(backend.build_streamed_session_turn,
+                                                        session, data)
+            if error_event:
+                yield error_event
+                return
+
+            async def record(output):
+                await asyncio.to_thread(backend.record_session_turn, turn, output or 'No response.')
+
+            async for event in solver_events(turn['prompt'], turn['stage'], turn['prompt_stats'],
+                                             bypass_cache, on_complete=record):
+                yield event
+        finally:
+            session.lock.release()
+
+    await send_events(receive, send, request, events())
+
+
+# (pattern, handler, route rule as Flask would name it in metrics)
+ROUTES = [
+    (re.compile(r'/api/solve-problem'), solve_problem, '/api/solve-problem'),
+    (re.compile(r'/api/solve-problem/stream'), solve_problem_stream, '/api/solve-problem/stream'),
+    (re.compile(r'/api/solver/sessions/(?P<session_id>[^/]+)/turns'), solver_session_turn,
+     '/api/solver/sessions/<session_id>/turns'),
+    (re.compile(r'/api/solver/sessions/(?P<session_id>[^/]+)/turns/stream'), solver_session_turn_stream,
+     '/api/solver/sessions/<session_id>/turns/stream'),
+]
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit):
+    """The request body, or None if it is larger than `limit` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit and size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """
+    asgiref runs every WSGI request on one shared thread (its sync_to_async
+    default), one at a time; this runs each on `executor` instead, and
+    closes the response iterable so Flask's on-close callbacks run.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self.serve, thread_sensitive=False, executor=self.executor)(body)
+
+    def serve(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request'})
+            return
+        output = self.wsgi_application(environ, self.start_response)
+        try:
+            for chunk in output:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                self.sync_send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(output, 'close'):
+                output.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    def __init__(self, wsgi_application, max_threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class BackendASGI:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = ThreadedWsgiToAsgi(flask_app, int(os.getenv('WSGI_THREADS', 40)))
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return None, None, None
+        for pattern, handler, rule in ROUTES:
+            match = pattern.fullmatch(scope['path'])
+            if match:
+                return handler, match.groupdict(), rule
+        return None, None, None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Don't lose debounced note edits on a clean shutdown
+                await asyncio.to_thread(backend.notes_autosave.flush_all)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def flask_rule(self, scope):
+        # The route rule Flask would have recorded the request under
+        try:
+            rule, _ = self.flask_app.url_map.bind('').match(
+                scope['path'], scope['method'], return_rule=True)
+            return rule.rule
+        except Exception:
+            return '<unmatched>'
+
+    async def too_large(self, scope, send):
+        trace = metrics.start_trace()
+        limit_mb = backend.MAX_UPLOAD_BYTES // (1024 * 1024)
+        await send_json(send, Request(scope, b''), {'error': f'File too large (max {limit_mb}MB)'}, 413)
+        metrics.finish_trace(trace, scope['method'], self.flask_rule(scope), 413)
+
+    async def serve_flask(self, scope, receive, send):
+        """Hand a request to Flask, refusing an oversized body before it is spooled."""
+        limit = self.flask_app.config['MAX_CONTENT_LENGTH']
+        if not limit:
+            return await self.wsgi(scope, receive, send)
+
+        length = Request(scope, b'').headers.get('content-length', '')
+        if length.isdigit() and int(length) > limit:
+            return await self.too_large(scope, send)
+
+        size = 0
+
+        async def receive_limited():
+            nonlocal size
+            message = await receive()
+            size += len(message.get('body', b''))
+            if size > limit:
+                raise BodyTooLarge()
+            return message
+
+        try:
+            await self.wsgi(scope, receive_limited, send)
+        except BodyTooLarge:
+            # Raised while the adapter is still reading, before Flask starts a response
+            await self.too_large(scope, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler, params, rule = self.match(scope)
+        if handler is None:
+            if scope['type'] == 'http':
+                return await self.serve_flask(scope, receive, send)
+            return await self.wsgi(scope, receive, send)
+
+        # Flask's request hooks time everything else
+        trace = metrics.start_trace()
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            limit = self.flask_app.config['MAX_CONTENT_LENGTH']
+            body = await read_body(receive, limit)
+            request = Request(scope, body or b'')
+            if body is None:
+                limit_mb = backend.MAX_UPLOAD_BYTES // (1024 * 1024)
+                return await send_json(send_timed, request,
+                                       {'error': f'File too large (max {limit_mb}MB)'}, 413)
+            await handler(request, receive, send_timed, **params)
+        finally:
+            metrics.finish_trace(trace, 'POST', rule, status)
+
+
+def create_asgi_app(flask_app=None):
+    """ASGI app serving the solver natively and everything else through `flask_app`."""
+    return BackendASGI(flask_app or backend.app)
+
+
+app = create_asgi_app()
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', port=5000)
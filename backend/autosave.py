@@ -0,0 +1,107 @@
+"""
+Server-side debouncing for autosaved edits.
+
+Editors that save on every keystroke send many small writes for the same
+record. DebouncedWriter buffers them per key, merging the changed fields,
+and hands the merged result to `flush` once the key has been quiet for
+`delay` seconds, or `max_delay` seconds after its first buffered edit if
+edits never stop. Flushes run on one background thread.
+
+Buffered edits live in this process only; anything still pending at exit
+is flushed by `flush_all`. Another process may write the same record in
+the meantime, so `flush` is also told how long ago the last buffered edit
+was made and can skip the write if the record changed after that.
+"""
+
+import threading
+import time
+
+
+class DebouncedWriter:
+    def __init__(self, flush, delay=2.0, max_delay=10.0):
+        """
+        `flush(key, fields, age)` writes the merged fields for one key; `age`
+        is the number of seconds since the last of those edits.
+        """
+        self.flush = flush
+        self.delay = delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._thread = None
+        self.submitted = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _due_at(self, entry):
+        return min(entry['last_at'] + self.delay, entry['first_at'] + self.max_delay)
+
+    def submit(self, key, fields):
+        now = time.monotonic()
+        with self._cond:
+            entry = self._pending.get(key)
+            if entry:
+                entry['fields'].update(fields)
+                entry['last_at'] = now
+            else:
+                self._pending[key] = {'fields': dict(fields), 'first_at': now, 'last_at': now}
+            self.submitted += 1
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self, key):
+        """Fields buffered for `key` but not yet flushed, or None."""
+        with self._cond:
+            entry = self._pending.get(key)
+            return dict(entry['fields']) if entry else None
+
+    def take(self, key):
+        """Remove and return the buffered fields for `key` (None if none)."""
+        with self._cond:
+            entry = self._pending.pop(key, None)
+            return entry['fields'] if entry else None
+
+    def _write(self, key, entry):
+        try:
+            self.flush(key, entry['fields'], time.monotonic() - entry['last_at'])
+            self.writes += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Error flushing autosave for {key}: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = [key for key, entry in self._pending.items() if self._due_at(entry) <= now]
+                    if due:
+                        batch = [(key, self._pending.pop(key)) for key in due]
+                        break
+                    timeout = None
+                    if self._pending:
+                        timeout = min(self._due_at(entry) for entry in self._pending.values()) - now
+                    self._cond.wait(timeout)
+
+            for key, entry in batch:
+                self._write(key, entry)
+
+    def flush_all(self):
+        with self._cond:
+            batch = list(self._pending.items())
+            self._pending.clear()
+        for key, entry in batch:
+            self._write(key, entry)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'submitted': self.submitted,
+                'writes': self.writes,
+                'errors': self.errors,
+            }
@@ -0,0 +1,219 @@
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from pymysql.cursors import DictCursor, SSDictCursor
+
+from metrics import span
+
+_VERB = re.compile(r'\s*(\w+)')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+`?(\w+)', re.IGNORECASE)
+
+
+def statement_name(query):
+    """'SELECT problems' for a query on problems: the span name for a statement."""
+    # Only the head of the query: multi-row INSERTs carry all their values
+    # inline, and reach execute as bytes
+    head = query[:2000]
+    if isinstance(head, (bytes, bytearray)):
+        head = head.decode('utf-8', 'replace')
+    verb = _VERB.match(head)
+    table = _TABLE.search(head)
+    return ' '.join(part for part in (verb and verb.group(1).upper(), table and table.group(1)) if part)
+
+
+class _TimedExecute:
+    # executemany sends its statements through execute, so each one is timed once
+    def execute(self, query, args=None):
+        with span('db', statement_name(query)):
+            return super().execute(query, args)
+
+
+class TimedDictCursor(_TimedExecute, DictCursor):
+    """DictCursor whose statements are timed as db spans."""
+
+
+class TimedSSDictCursor(_TimedExecute, SSDictCursor):
+    """Unbuffered TimedDictCursor."""
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a raw pymysql connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of pymysql connections.
+
+    At most `size` connections exist at any time. Idle connections are kept
+    in a LIFO stack so hot connections are reused first and cold ones age out.
+    On checkout a connection is discarded if it is older than `max_lifetime`,
+    has been idle longer than `idle_timeout`, or fails a ping.
+    """
+
+    def __init__(self, size=10, max_lifetime=1800, idle_timeout=300,
+                 checkout_timeout=10, ping_interval=5, **connect_kwargs):
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = deque()
+        self._in_use = 0
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = pymysql.connect(**self.connect_kwargs)
+        with self._lock:
+            self._created += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._discarded += 1
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, pooled, now):
+        if now - pooled.created_at > self.max_lifetime:
+            return False
+        if now - pooled.last_used > self.idle_timeout:
+            return False
+        # Skip the round trip for connections that were in use moments ago
+        if now - pooled.last_used < self.ping_interval:
+            return pooled.conn.open
+        try:
+            pooled.conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        """Drop connections that have sat idle too long (oldest are on the left)."""
+        expired = []
+        with self._lock:
+            while self._idle and now - self._idle[0].last_used > self.idle_timeout:
+                expired.append(self._idle.popleft())
+        for pooled in expired:
+            self._discard(pooled)
+
+    def acquire(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(
+                f'No database connection available after {self.checkout_timeout}s'
+            )
+
+        waited = time.monotonic() - started
+        try:
+            now = time.monotonic()
+            self._evict_idle(now)
+            pooled = None
+            while True:
+                with self._lock:
+                    candidate = self._idle.pop() if self._idle else None
+                if candidate is None:
+                    break
+                if self._is_usable(candidate, now):
+                    pooled = candidate
+                    break
+                self._discard(candidate)
+
+            if pooled is None:
+                pooled = self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return pooled
+
+    def release(self, pooled, discard=False):
+        try:
+            if not discard and pooled.conn.open:
+                # Never hand out a connection with an open transaction; a stale
+                # REPEATABLE READ snapshot would leak into the next request.
+                if pooled.conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    try:
+                        pooled.conn.rollback()
+                    except Exception:
+                        discard = True
+            else:
+                discard = True
+
+            if discard:
+                self._discard(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(pooled)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection and always return it, even on error."""
+        with span('db', 'checkout'):
+            pooled = self.acquire()
+        broken = False
+        try:
+            yield pooled.conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(pooled, discard=broken)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'connections_created': self._created,
+                'connections_discarded': self._discarded,
+                'wait_seconds_total': round(self._wait_total, 6),
+                'wait_seconds_max': round(self._wait_max, 6),
+            }
@@ -26,9 +26,15 @@ CREATE TABLE IF NOT EXISTS problems (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_id (user_id),
+    INDEX idx_user_created (user_id, created_at),
+    -- One row per problem number, so imports and single adds can't duplicate
+    UNIQUE KEY uniq_user_number (user_id, number),
     INDEX idx_difficulty (difficulty),
     INDEX idx_topic (topic)
 );
+-- Existing databases (remove duplicate numbers per user first):
+-- ALTER TABLE problems ADD INDEX idx_user_created (user_id, created_at),
+--     ADD UNIQUE KEY uniq_user_number (user_id, number);
 
 -- Resumes table
 CREATE TABLE IF NOT EXISTS resumes (
@@ -37,7 +43,126 @@ CREATE TABLE IF NOT EXISTS resumes (
     filename VARCHAR(255) NOT NULL,
     s3_key VARCHAR(500) NOT NULL,
     file_url TEXT,
+    content_hash CHAR(64),
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_user_id (user_id),
+    INDEX idx_user_uploaded (user_id, uploaded_at),
+    INDEX idx_content_hash (content_hash, user_id)
+);
+-- Existing databases:
+-- ALTER TABLE resumes ADD COLUMN content_hash CHAR(64) AFTER file_url,
+--     ADD INDEX idx_user_uploaded (user_id, uploaded_at),
+--     ADD INDEX idx_content_hash (content_hash, user_id);
+
+-- Problem notes table, one row per (problem, user) so saves can upsert
+CREATE TABLE IF NOT EXISTS problem_notes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    problem_id INT NOT NULL,
+    user_id INT NOT NULL,
+    approach TEXT,
+    solution_code MEDIUMTEXT,
+    time_complexity VARCHAR(100),
+    space_complexity VARCHAR(100),
+    key_insights TEXT,
+    mistakes_made TEXT,
+    related_problems TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Microseconds, so delayed autosaves can tell a newer save apart
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    FOREIGN KEY (problem_id) REFERENCES problems(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    UNIQUE KEY uniq_problem_user (problem_id, user_id),
+    INDEX idx_user_id (user_id)
+);
+-- Existing databases that created problem_notes by hand need the unique
+-- key (remove duplicate rows first) and the finer updated_at:
+-- ALTER TABLE problem_notes ADD UNIQUE KEY uniq_problem_user (problem_id, user_id),
+--     MODIFY updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+-- Precomputed per-user aggregates, maintained by the problem write paths
+-- (see stats.py). Backfill with: flask --app app rebuild-stats
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INT PRIMARY KEY,
+    total_problems INT NOT NULL DEFAULT 0,
+    total_points INT NOT NULL DEFAULT 0,
+    easy_count INT NOT NULL DEFAULT 0,
+    medium_count INT NOT NULL DEFAULT 0,
+    hard_count INT NOT NULL DEFAULT 0,
+    -- Microseconds, so the leaderboard can tell same-second writes apart
+    updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_updated_at (updated_at)
+);
+
+CREATE TABLE IF NOT EXISTS user_topic_stats (
+    user_id INT NOT NULL,
+    topic VARCHAR(100) NOT NULL,
+    problem_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, topic),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_daily_points (
+    user_id INT NOT NULL,
+    day DATE NOT NULL,
+    points INT NOT NULL DEFAULT 0,
+    problem_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Background resume analysis jobs and their results
+CREATE TABLE IF NOT EXISTS resume_analyses (
+    id CHAR(36) PRIMARY KEY,
+    user_id INT,
+    filename VARCHAR(255),
+    status ENUM('queued', 'running', 'succeeded', 'failed') NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    candidate_name VARCHAR(100),
+    analysis MEDIUMTEXT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_user_id (user_id)
-);
\ No newline at end of file
+);
+
+-- Extracted text and analysis, shared by every upload of the same bytes.
+-- Filled in when a resume is uploaded, so analysis by resume_id can skip
+-- the download and parse
+CREATE TABLE IF NOT EXISTS resume_contents (
+    content_hash CHAR(64) PRIMARY KEY,
+    extracted_text MEDIUMTEXT,
+    page_count INT,
+    candidate_name VARCHAR(100),
+    analysis MEDIUMTEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Guided solver sessions (see solver_sessions.py); turns are deleted with
+-- their session
+CREATE TABLE IF NOT EXISTS solver_sessions (
+    id CHAR(36) PRIMARY KEY,
+    user_id INT,
+    problem MEDIUMTEXT NOT NULL,
+    turn_count INT NOT NULL DEFAULT 0,
+    summary MEDIUMTEXT,
+    summary_turns INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_active_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_last_active (last_active_at)
+);
+
+CREATE TABLE IF NOT EXISTS solver_turns (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    session_id CHAR(36) NOT NULL,
+    role ENUM('user', 'assistant') NOT NULL,
+    stage VARCHAR(20),
+    content MEDIUMTEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (session_id) REFERENCES solver_sessions(id) ON DELETE CASCADE,
+    INDEX idx_session (session_id, id)
+);
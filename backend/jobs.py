@@ -0,0 +1,135 @@
+"""
+Background job queue for slow work (LLM calls) that should not hold an
+HTTP worker.
+
+Jobs run on a bounded thread pool; at most `max_pending` may be queued or
+running at once, beyond which `submit` raises QueueFull so the caller can
+shed load. Exceptions listed in `retry_on` are retried with exponential
+backoff. Every state change is passed to `on_update` (used to persist it)
+and wakes anyone blocked in `wait_for_change`.
+"""
+
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL_STATES = ('succeeded', 'failed')
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already queued or running."""
+
+
+class JobQueue:
+    def __init__(self, max_workers=4, max_pending=32, max_attempts=3, backoff=2.0,
+                 retry_on=(), on_update=None, keep_finished=3600):
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.retry_on = tuple(retry_on)
+        self.on_update = on_update
+        self.keep_finished = keep_finished
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._pending = 0
+
+    def _update(self, job_id, **changes):
+        with self._cond:
+            job = self._jobs[job_id]
+            job.update(changes, version=job['version'] + 1, updated_at=time.time())
+            snapshot = dict(job)
+            self._cond.notify_all()
+        if self.on_update:
+            try:
+                self.on_update(snapshot)
+            except Exception as e:
+                print(f"Error persisting job {job_id}: {e}")
+
+    def _prune(self, now):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] in TERMINAL_STATES and now - job['updated_at'] > self.keep_finished]
+        for job_id in finished:
+            del self._jobs[job_id]
+
+    def submit(self, func, *args, meta=None, cleanup=None, **kwargs):
+        """
+        Queue `func(*args, **kwargs)` and return the new job id. `cleanup`,
+        if given, runs once after the final attempt (e.g. to close files);
+        if `submit` raises, the job was never queued and `cleanup` is the
+        caller's job.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._cond:
+            if self._pending >= self.max_pending:
+                raise QueueFull('Too many jobs in progress, try again shortly')
+            self._prune(now)
+            self._pending += 1
+            self._jobs[job_id] = dict(meta or {}, id=job_id, status='queued', attempts=0,
+                                      result=None, error=None, version=0,
+                                      created_at=now, updated_at=now)
+        try:
+            if self.on_update:
+                self.on_update(self.get(job_id))
+            self._executor.submit(self._run, job_id, func, args, kwargs, cleanup)
+        except Exception:
+            # Never scheduled, so nothing else will release its slot
+            with self._cond:
+                self._pending -= 1
+                del self._jobs[job_id]
+            raise
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs, cleanup):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                self._update(job_id, status='running', attempts=attempt)
+                try:
+                    result = func(*args, **kwargs)
+                except self.retry_on as e:
+                    if attempt == self.max_attempts:
+                        self._update(job_id, status='failed', error=str(e))
+                        return
+                    # Jittered exponential backoff before the next attempt
+                    delay = self.backoff * (2 ** (attempt - 1))
+                    time.sleep(delay * random.uniform(0.5, 1.5))
+                except Exception as e:
+                    self._update(job_id, status='failed', error=str(e))
+                    return
+                else:
+                    self._update(job_id, status='succeeded', result=result)
+                    return
+        finally:
+            with self._cond:
+                self._pending -= 1
+            if cleanup:
+                cleanup()
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait_for_change(self, job_id, version, timeout):
+        """
+        Block until the job's version moves past `version` or `timeout`
+        elapses, then return its current snapshot (None if unknown).
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]['version'] > version,
+                timeout=timeout
+            )
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return {'pending': self._pending, 'max_pending': self.max_pending, 'by_status': counts}
@@ -0,0 +1,230 @@
+"""
+In-memory leaderboard over the per-user totals in `user_stats`.
+
+Users are kept in a list sorted by (-total_points, -total_problems, user_id),
+the same order the original GROUP BY query produced. Rank lookups and cursor
+seeks are binary searches; problem writes move a single entry instead of
+recomputing the aggregate.
+
+Writes handled by other worker processes are picked up every
+`refresh_interval` seconds by reading only the `user_stats` rows updated
+since the last refresh (by `updated_at`) and moving those users. The read
+reaches back `overlap` seconds before the newest stamp seen so far, so a
+write stamped in the same instant, or committed after a later-stamped row
+was already read, is still found; rows that come back with the stamp and
+totals already held are skipped. The whole
+index is rebuilt only on first use and every `full_refresh_interval`
+seconds, which also picks up users who have no stats yet and drops deleted
+ones.
+"""
+
+import base64
+import threading
+import time
+from datetime import timedelta
+from bisect import bisect_left, bisect_right, insort
+
+
+def _sort_key(user_id, total_points, total_problems):
+    return (-total_points, -total_problems, user_id)
+
+
+def encode_cursor(key):
+    raw = '.'.join(str(part) for part in key).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """Turn a cursor back into a sort key. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        neg_points, neg_problems, user_id = (int(part) for part in raw.split('.'))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return (neg_points, neg_problems, user_id)
+
+
+def _entry(row):
+    return {
+        'user_id': row['id'],
+        'name': row['name'],
+        'email': row['email'],
+        'total_points': int(row['total_points'] or 0),
+        'total_problems': int(row['total_problems'] or 0),
+    }
+
+
+class Leaderboard:
+    def __init__(self, loader, refresh_interval=60, full_refresh_interval=3600, overlap=10,
+                 on_change=None):
+        """
+        `loader(since=None)` returns rows with id, name, email, total_points,
+        total_problems and updated_at: for every user, or with `since` only
+        for users whose stats were updated at or after it (`overlap` seconds
+        before the latest updated_at from an earlier load). `on_change(user_ids)`,
+        if given, is called with the users a refresh found changed.
+        """
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.overlap = overlap
+        self.on_change = on_change
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._keys = []
+        self._users = {}
+        self._stamps = {}
+        self._since = None
+        self._loaded_at = None
+        self._refreshed_at = None
+
+    def _load(self):
+        keys = []
+        users = {}
+        stamps = {}
+        since = None
+        for row in self.loader():
+            entry = _entry(row)
+            key = _sort_key(entry['user_id'], entry['total_points'], entry['total_problems'])
+            keys.append(key)
+            users[entry['user_id']] = (key, entry)
+            stamps[entry['user_id']] = row.get('updated_at')
+            if row.get('updated_at') is not None and (since is None or row['updated_at'] > since):
+                since = row['updated_at']
+        keys.sort()
+
+        with self._lock:
+            first = self._loaded_at is None and not self._users
+            changed = [user_id for user_id in set(users) | set(self._users)
+                       if user_id not in users or user_id not in self._users
+                       or stamps[user_id] != self._stamps.get(user_id)
+                       or users[user_id][0] != self._users[user_id][0]]
+            self._keys = keys
+            self._users = users
+            self._stamps = stamps
+            self._since = since
+            self._loaded_at = self._refreshed_at = time.monotonic()
+        if changed and not first and self.on_change:
+            self.on_change(changed)
+
+    def _load_changes(self):
+        rows = self.loader(since=self._since - timedelta(seconds=self.overlap))
+        changed = []
+        with self._lock:
+            for row in rows:
+                entry = _entry(row)
+                stamp = row['updated_at']
+                if stamp > self._since:
+                    self._since = stamp
+                # Rows inside the overlap come back again; only a new stamp
+                # or new totals is a change
+                existing = self._users.get(entry['user_id'])
+                if (existing and self._stamps.get(entry['user_id']) == stamp
+                        and existing[1]['total_points'] == entry['total_points']
+                        and existing[1]['total_problems'] == entry['total_problems']):
+                    continue
+                self._place(entry['user_id'], entry['total_points'], entry['total_problems'],
+                            entry['name'], entry['email'])
+                self._stamps[entry['user_id']] = stamp
+                changed.append(entry['user_id'])
+            self._refreshed_at = time.monotonic()
+        if changed and self.on_change:
+            self.on_change(changed)
+
+    def _ensure_fresh(self):
+        loaded_at, refreshed_at = self._loaded_at, self._refreshed_at
+        now = time.monotonic()
+        if loaded_at is not None and now - refreshed_at < self.refresh_interval:
+            return
+        if loaded_at is None:
+            # Nothing to serve yet, so every caller waits for the first load
+            with self._refresh_lock:
+                if self._loaded_at is None:
+                    self._load()
+        elif self._refresh_lock.acquire(blocking=False):
+            # One caller refreshes; everyone else keeps reading the old index
+            try:
+                if self._since is None or now - loaded_at >= self.full_refresh_interval:
+                    self._load()
+                else:
+                    self._load_changes()
+            finally:
+                self._refresh_lock.release()
+
+    def refresh(self):
+        """Pick up other workers' writes if the refresh interval has passed."""
+        self._ensure_fresh()
+
+    def invalidate(self):
+        """Force a reload on next access."""
+        with self._lock:
+            self._loaded_at = None
+
+    def update(self, user_id, total_points, total_problems, name=None, email=None):
+        """Move one user to their new position after a problem write."""
+        if self._loaded_at is None:
+            return
+
+        with self._lock:
+            self._place(int(user_id), total_points, total_problems, name, email)
+
+    def _place(self, user_id, total_points, total_problems, name=None, email=None):
+        """Insert or move one user's entry; call with the lock held."""
+        existing = self._users.get(user_id)
+        if existing:
+            old_key, entry = existing
+            index = bisect_left(self._keys, old_key)
+            if index < len(self._keys) and self._keys[index] == old_key:
+                del self._keys[index]
+        else:
+            entry = {'user_id': user_id, 'name': name, 'email': email}
+
+        entry = dict(entry,
+                     total_points=int(total_points or 0),
+                     total_problems=int(total_problems or 0))
+        if name is not None:
+            entry['name'] = name
+        if email is not None:
+            entry['email'] = email
+
+        key = _sort_key(user_id, entry['total_points'], entry['total_problems'])
+        insort(self._keys, key)
+        self._users[user_id] = (key, entry)
+
+    def _entry_at(self, index):
+        key = self._keys[index]
+        return dict(self._users[key[2]][1], rank=index + 1)
+
+    def top(self, limit=10):
+        self._ensure_fresh()
+        with self._lock:
+            return [self._entry_at(i) for i in range(min(limit, len(self._keys)))]
+
+    def page(self, cursor=None, limit=10):
+        """
+        Return up to `limit` entries that come after `cursor`, plus the cursor
+        for the following page (None at the end).
+        """
+        self._ensure_fresh()
+        with self._lock:
+            start = bisect_right(self._keys, decode_cursor(cursor)) if cursor else 0
+            end = min(start + limit, len(self._keys))
+            entries = [self._entry_at(i) for i in range(start, end)]
+            next_cursor = encode_cursor(self._keys[end - 1]) if end < len(self._keys) else None
+        return entries, next_cursor
+
+    def rank(self, user_id):
+        """Return the user's entry with its 1-based rank, or None if unknown."""
+        self._ensure_fresh()
+        with self._lock:
+            existing = self._users.get(int(user_id))
+            if not existing:
+                return None
+            index = bisect_left(self._keys, existing[0])
+            return self._entry_at(index)
+
+    def __len__(self):
+        self._ensure_fresh()
+        with self._lock:
+            return len(self._keys)
@@ -0,0 +1,200 @@
+"""
+Response cache for LLM calls.
+
+Entries are keyed on (model name, stage, normalized prompt) and live in an
+in-process LRU tier, optionally backed by a SQLite file so they survive
+restarts and are shared by every worker on the host. Each stage has its own
+TTL, chosen by the caller.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so cosmetic differences share a cache entry."""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+
+def cache_key(model_name, stage, prompt):
+    digest = hashlib.sha256(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+    return f'{model_name}:{stage}:{digest}'
+
+
+class LLMCache:
+    def __init__(self, max_entries=512, disk_path=None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._counters = defaultdict(lambda: {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'bypassed': 0})
+
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute('PRAGMA journal_mode=WAL')
+            self._disk.execute(
+                '''CREATE TABLE IF NOT EXISTS llm_cache (
+                       key TEXT PRIMARY KEY,
+                       value TEXT NOT NULL,
+                       expires_at REAL NOT NULL
+                   )'''
+            )
+            self._disk.commit()
+
+    def _count(self, stage, counter):
+        with self._lock:
+            self._counters[stage][counter] += 1
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _set_memory(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _get_disk(self, key, now):
+        if self._disk is None:
+            return None
+        with self._disk_lock:
+            row = self._disk.execute(
+                'SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return row
+
+    def _set_disk(self, key, value, expires_at):
+        if self._disk is None:
+            return
+        with self._disk_lock:
+            self._disk.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+            self._disk.commit()
+
+    def get(self, key, stage=''):
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            self._count(stage, 'memory_hits')
+            return value
+
+        row = self._get_disk(key, now)
+        if row is not None:
+            value, expires_at = row
+            self._set_memory(key, value, expires_at)
+            self._count(stage, 'disk_hits')
+            return value
+
+        self._count(stage, 'misses')
+        return None
+
+    def set(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self._set_memory(key, value, expires_at)
+        self._set_disk(key, value, expires_at)
+
+    def generate(self, model, model_name, stage, prompt, ttl, bypass=False):
+        """
+        Return the text of `model.generate_content(prompt)`, served from the
+        cache when possible. With `bypass` the model is always called, and
+        the fresh result replaces whatever was cached.
+        """
+        key = cache_key(model_name, stage, prompt)
+        if bypass:
+            self._count(stage, 'bypassed')
+        else:
+            cached = self.get(key, stage)
+            if cached is not None:
+                return cached
+
+        response = model.generate_content(prompt)
+        text = response.text if response and hasattr(response, 'text') else ''
+        if text and ttl > 0:
+            self.set(key, text, ttl)
+        return text
+
+    def generate_stream(self, model, model_name, stage, prompt, ttl, bypass=False, meta=None):
+        """
+        Streaming counterpart of `generate`: yields text chunks as the model
+        produces them. A cached response is yielded as a single chunk. The
+        full text is cached only if the stream ran to completion, and the
+        upstream request is cancelled if the consumer stops early.
+
+        `meta`, if given, is filled with `cached` and the response's
+        `usage_metadata` (when the client library provides it).
+        """
+        meta = meta if meta is not None else {}
+        meta['cached'] = False
+        key = cache_key(model_name, stage, prompt)
+        if bypass:
+            self._count(stage, 'bypassed')
+        else:
+            cached = self.get(key, stage)
+            if cached is not None:
+                meta['cached'] = True
+                yield cached
+                return
+
+        response = model.generate_content(prompt, stream=True)
+        chunks = []
+        completed = False
+        try:
+            for chunk in response:
+                text = getattr(chunk, 'text', '')
+                if text:
+                    chunks.append(text)
+                    yield text
+            completed = True
+        finally:
+            if not completed:
+                # The consumer went away; stop the upstream generation too
+                cancel = getattr(getattr(response, '_iterator', None), 'cancel', None)
+                if cancel:
+                    cancel()
+
+        meta['usage_metadata'] = getattr(response, 'usage_metadata', None)
+        text = ''.join(chunks)
+        if text and ttl > 0:
+            self.set(key, text, ttl)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,))
+                self._disk.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'disk': bool(self._disk),
+                'stages': {stage: dict(counts) for stage, counts in self._counters.items()},
+            }
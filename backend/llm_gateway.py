@@ -0,0 +1,671 @@
+"""
+One shared gateway for every Gemini call.
+
+LLMGateway sits between LLMCache and the model and adds:
+
+    concurrency   at most `max_concurrency` calls are in flight; a caller
+                  waits up to `queue_timeout` seconds for a slot, then gets
+                  GatewayBusy instead of pinning its worker
+    deadlines     a call, retries included, must finish within `deadline`
+                  seconds; a stream may go at most `stream_deadline`
+                  seconds between chunks
+    retries       429 and 5xx errors are retried with jittered exponential
+                  backoff, within the same deadline
+    breaker       after `failure_threshold` consecutive failed attempts the
+                  circuit opens and calls fail fast with CircuitOpen for
+                  `reset_timeout` seconds, then a single trial call decides
+                  whether it closes again
+
+When a call fails fast or runs out of retries, the last good response to
+the same prompt is served instead if there is one (it is kept even after
+its cache entry expires). Identical calls that overlap in time share one
+upstream call (see singleflight.py). Latency histograms are kept per
+stage; for streams they measure the time to the first chunk.
+
+The client library has no per-request timeout, so calls run on the
+gateway's own threads and the caller stops waiting at the deadline. An
+abandoned call keeps its slot until it really returns, so a hung upstream
+sheds new load instead of piling it up. A stream holds a single slot from
+the moment it opens until it is closed, and each chunk only has to arrive
+within `stream_deadline`, so a reply that has started can't be cut off by
+new calls taking the slots between its chunks.
+
+`agenerate` and `astream` are the coroutine versions, for the ASGI entry
+point. They await the client's async API directly, so a waiting call holds
+no thread, and are limited separately by `max_async_concurrency`. Both
+kinds of call share the cache, the breaker and the statistics.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from llm_cache import cache_key
+from metrics import LatencyHistogram, span
+from singleflight import SingleFlight, AsyncSingleFlight
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_END = object()
+
+
+class LLMUnavailable(Exception):
+    """Raised when Gemini can't be reached and there is nothing to fall back on."""
+
+
+class GatewayBusy(LLMUnavailable):
+    """Raised when no concurrency slot frees up in time."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Raised while the circuit breaker is failing calls fast."""
+
+
+class CallTimeout(LLMUnavailable):
+    """Raised when a call runs past its deadline."""
+
+
+class _GuardedModel:
+    """Stands in for the model inside LLMCache, routing calls through the gateway."""
+
+    def __init__(self, gateway, stage):
+        self.gateway = gateway
+        self.stage = stage
+
+    def generate_content(self, prompt, stream=False):
+        if stream:
+            return self.gateway._open_stream(self.stage, prompt)
+        return self.gateway._call(self.stage, lambda: self.gateway.model().generate_content(prompt))
+
+
+class _Slot:
+    """
+    One of the gateway's concurrency slots. Calls run on gateway threads
+    under it, and it is given back once it is closed and none of them is
+    still running.
+    """
+
+    def __init__(self, gateway):
+        self._gateway = gateway
+        self._lock = threading.Lock()
+        self._running = 0
+        self._closed = False
+
+    def submit(self, func):
+        with self._lock:
+            self._running += 1
+        future = self._gateway._executor.submit(func)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._running -= 1
+            release = self._closed and not self._running
+        if release:
+            self._gateway._release_slot()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            release = not self._running
+        if release:
+            self._gateway._release_slot()
+
+
+class _GuardedStream:
+    """A streaming response that holds one slot until it ends or is closed."""
+
+    def __init__(self, gateway, response, slot):
+        self._gateway = gateway
+        self._response = response
+        self._slot = slot
+        self._chunks = iter(response)
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._gateway._next_chunk(self._chunks, self._slot)
+                if chunk is _END:
+                    return
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._slot.close()
+
+    def __getattr__(self, name):
+        # usage_metadata, and the iterator LLMCache cancels on early exit
+        return getattr(self._response, name)
+
+
+class LLMGateway:
+    def __init__(self, model_factory, model_name, cache, max_concurrency=8, queue_timeout=5,
+                 deadline=60, stream_deadline=30, max_attempts=3, backoff=0.5, max_backoff=8,
+                 retry_on=(), failure_threshold=5, reset_timeout=30, max_stale=256,
+                 max_async_concurrency=64):
+        """
+        `model_factory()` builds the model, once, on first use. Errors in
+        `retry_on`, or with an HTTP `code` of 429 or 5xx, are retried.
+        """
+        self.model_factory = model_factory
+        self.model_name = model_name
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.stream_deadline = stream_deadline
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_on = tuple(retry_on)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_stale = max_stale
+        self.max_async_concurrency = max_async_concurrency
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # One thread per slot, so submitted calls never queue here
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-call')
+        self._async_slots = asyncio.Semaphore(max_async_concurrency)
+
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._in_flight = 0
+        self._stale = OrderedDict()
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self._async_in_flight = 0
+        self.opens = 0
+        self._stages = defaultdict(lambda: {'calls': 0, 'errors': 0, 'retries': 0, 'rejected': 0,
+                                            'degraded': 0, 'coalesced': 0,
+                                            'latency': LatencyHistogram(LATENCY_BUCKETS)})
+
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = self.model_factory()
+            return self._model
+
+    def _before_attempt(self):
+        with self._lock:
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpen('Gemini is unavailable right now, try again shortly')
+                self._state = 'half_open'
+            if self._state == 'half_open':
+                if self._probing:
+                    raise CircuitOpen('Gemini is unavailable right now, try again shortly')
+                self._probing = True
+
+    def _record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._probing = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.opens += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def _release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def _retryable(self, error):
+        if isinstance(error, self.retry_on):
+            return True
+        code = getattr(error, 'code', None)
+        return isinstance(code, int) and (code == 429 or 500 <= code < 600)
+
+    def _retry_delay(self, attempt):
+        # Jittered exponential backoff
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _acquire_slot(self, end):
+        """A _Slot, waiting up to `queue_timeout` (and no later than `end`) for one."""
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise CallTimeout('Gemini call ran out of time')
+        if not self._slots.acquire(timeout=min(self.queue_timeout, remaining)):
+            raise GatewayBusy('Too many Gemini calls in progress, try again shortly')
+        with self._lock:
+            self._in_flight += 1
+        return _Slot(self)
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _count_rejected(self, stage):
+        with self._lock:
+            self._stages[stage]['rejected'] += 1
+
+    def _attempt(self, func, end, slot=None):
+        """
+        Run `func()` on a gateway thread, waiting no later than `end`. Takes
+        a slot for the call unless it runs under the caller's `slot`.
+        """
+        if slot is None:
+            call_slot = self._acquire_slot(end)
+            future = call_slot.submit(func)
+            call_slot.close()
+        else:
+            future = slot.submit(func)
+        try:
+            return future.result(timeout=max(0, end - time.monotonic()))
+        except FutureTimeout:
+            raise CallTimeout('Gemini call ran out of time')
+
+    def _call(self, stage, func, deadline=None, slot=None):
+        """`func()` with the breaker, retries and the deadline applied."""
+        started = time.monotonic()
+        end = started + (deadline or self.deadline)
+        with self._lock:
+            counters = self._stages[stage]
+        outcome = 'errors'
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    self._before_attempt()
+                except CircuitOpen:
+                    outcome = 'rejected'
+                    raise
+                try:
+                    with span('llm', stage):
+                        result = self._attempt(func, end, slot)
+                except GatewayBusy:
+                    self._release_probe()
+                    outcome = 'rejected'
+                    raise
+                except CallTimeout:
+                    self._record_failure()
+                    raise
+                except Exception as e:
+                    if not self._retryable(e):
+                        # Upstream answered; the request itself was bad
+                        self._record_success()
+                        raise
+                    self._record_failure()
+                    delay = self._retry_delay(attempt)
+                    if attempt == self.max_attempts or time.monotonic() + delay >= end:
+                        raise
+                    with self._lock:
+                        counters['retries'] += 1
+                    time.sleep(delay)
+                else:
+                    self._record_success()
+                    outcome = 'calls'
+                    return result
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                counters[outcome] += 1
+                if outcome != 'rejected':
+                    counters['latency'].observe(elapsed)
+
+    def _open_stream(self, stage, prompt):
+        try:
+            slot = self._acquire_slot(time.monotonic() + self.deadline)
+        except GatewayBusy:
+            self._count_rejected(stage)
+            raise
+        try:
+            response = self._call(stage, lambda: self.model().generate_content(prompt, stream=True),
+                                  slot=slot)
+        except BaseException:
+            slot.close()
+            raise
+        return _GuardedStream(self, response, slot)
+
+    def _next_chunk(self, chunks, slot):
+        try:
+            chunk = self._attempt(lambda: next(chunks, _END), time.monotonic() + self.stream_deadline,
+                                  slot)
+        except Exception as e:
+            if isinstance(e, CallTimeout) or self._retryable(e):
+                self._record_failure()
+            raise
+        return chunk
+
+    async def _aacquire_slot(self, end):
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            raise CallTimeout('Gemini call ran out of time')
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), min(self.queue_timeout, remaining))
+        except asyncio.TimeoutError:
+            raise GatewayBusy('Too many Gemini calls in progress, try again shortly')
+        self._async_in_flight += 1
+
+    def _arelease_slot(self):
+        self._async_in_flight -= 1
+        self._async_slots.release()
+
+    async def _aattempt(self, make_call, end, held=False):
+        """
+        Await `make_call()` under the async concurrency limit, until no later
+        than `end`. `held` means the caller already holds a slot.
+        """
+        if not held:
+            await self._aacquire_slot(end)
+        try:
+            return await asyncio.wait_for(make_call(), max(0, end - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise CallTimeout('Gemini call ran out of time')
+        finally:
+            if not held:
+                self._arelease_slot()
+
+    async def _acall(self, stage, make_call, deadline=None, held=False):
+        """Async `_call`; `make_call()` returns an awaitable."""
+        started = time.monotonic()
+        end = started + (deadline or self.deadline)
+        with self._lock:
+            counters = self._stages[stage]
+        outcome = 'errors'
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    self._before_attempt()
+                except CircuitOpen:
+                    outcome = 'rejected'
+                    raise
+                try:
+                    with span('llm', stage):
+                        result = await self._aattempt(make_call, end, held)
+                except GatewayBusy:
+                    self._release_probe()
+                    outcome = 'rejected'
+                    raise
+                except CallTimeout:
+                    self._record_failure()
+                    raise
+                except asyncio.CancelledError:
+                    # The client went away; don't leave a trial call pending
+                    self._release_probe()
+                    raise
+                except Exception as e:
+                    if not self._retryable(e):
+                        self._record_success()
+                        raise
+                    self._record_failure()
+                    delay = self._retry_delay(attempt)
+                    if attempt == self.max_attempts or time.monotonic() + delay >= end:
+                        raise
+                    with self._lock:
+                        counters['retries'] += 1
+                    await asyncio.sleep(delay)
+                else:
+                    self._record_success()
+                    outcome = 'calls'
+                    return result
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                counters[outcome] += 1
+                if outcome != 'rejected':
+                    counters['latency'].observe(elapsed)
+
+    async def _anext_chunk(self, chunks):
+        try:
+            return await self._aattempt(lambda: anext(chunks, _END),
+                                        time.monotonic() + self.stream_deadline, held=True)
+        except Exception as e:
+            if isinstance(e, CallTimeout) or self._retryable(e):
+                self._record_failure()
+            raise
+
+    def _remember(self, stage, prompt, text):
+        if not text:
+            return
+        key = cache_key(self.model_name, stage, prompt)
+        with self._lock:
+            self._stale[key] = text
+            self._stale.move_to_end(key)
+            while len(self._stale) > self.max_stale:
+                self._stale.popitem(last=False)
+
+    def _fallback(self, stage, prompt, error):
+        """The last good response to `prompt`, or raise if `error` isn't transient."""
+        if not isinstance(error, LLMUnavailable) and not self._retryable(error):
+            raise error
+        key = cache_key(self.model_name, stage, prompt)
+        with self._lock:
+            stale = self._stale.get(key)
+            if stale is not None:
+                self._stages[stage]['degraded'] += 1
+                return stale
+        if isinstance(error, LLMUnavailable):
+            raise error
+        raise LLMUnavailable(f'Gemini is unavailable: {error}') from error
+
+    def _flight_key(self, stage, prompt, bypass):
+        # A bypassing caller must not be handed a result served from the cache
+        return cache_key(self.model_name, stage, prompt) + (':fresh' if bypass else '')
+
+    def _count_coalesced(self, stage):
+        with self._lock:
+            self._stages[stage]['coalesced'] += 1
+
+    def generate(self, stage, prompt, ttl, bypass=False):
+        """
+        Text for `prompt`, from the cache or the model. Identical calls
+        already in flight are joined rather than repeated.
+        """
+        try:
+            text, shared = self._flights.do(
+                self._flight_key(stage, prompt, bypass),
+                lambda: self.cache.generate(_GuardedModel(self, stage), self.model_name, stage,
+                                            prompt, ttl=ttl, bypass=bypass),
+                timeout=self.deadline
+            )
+        except Exception as e:
+            return self._fallback(stage, prompt, e)
+        if shared:
+            self._count_coalesced(stage)
+        self._remember(stage, prompt, text)
+        return text
+
+    def stream(self, stage, prompt, ttl, bypass=False, meta=None):
+        """
+        Streaming counterpart of `generate`, yielding text chunks. `meta` is
+        filled as by LLMCache.generate_stream, plus `stale` when a kept
+        response was served because the call could not start, and
+        `coalesced` when the text came whole from an identical call that
+        was already running.
+        """
+        meta = meta if meta is not None else {}
+        key = self._flight_key(stage, prompt, bypass)
+        flight, leader = self._flights.join(key)
+        if not leader:
+            # Only fall through to our own call if the leader gave up
+            if self._flights.wait(flight, self.deadline) and not flight.abandoned:
+                text = flight.result
+                if flight.error is not None:
+                    text = self._fallback(stage, prompt, flight.error)
+                self._count_coalesced(stage)
+                meta.update(cached=False, coalesced=True)
+                # An empty reply is shared as '', with nothing to yield
+                if text:
+                    yield text
+                return
+
+        result = error = None
+        chunks = self.cache.generate_stream(_GuardedModel(self, stage), self.model_name, stage,
+                                            prompt, ttl=ttl, bypass=bypass, meta=meta)
+        try:
+            try:
+                first = next(chunks)
+            except StopIteration:
+                # Finished but empty, which followers share rather than retry
+                result = ''
+                return
+            except Exception as e:
+                error = e
+                result = self._fallback(stage, prompt, e)
+                meta.update(cached=True, stale=True)
+                yield result
+                return
+
+            parts = [first]
+            yield first
+            for text in chunks:
+                parts.append(text)
+                yield text
+            result = ''.join(parts)
+            self._remember(stage, prompt, result)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            chunks.close()
+            if leader:
+                self._flights.finish(key, flight, result, None if result is not None else error)
+
+    async def _afetch(self, stage, prompt, ttl):
+        response = await self._acall(stage, lambda: self.model().generate_content_async(prompt))
+        text = response.text if response and hasattr(response, 'text') else ''
+        if text and ttl > 0:
+            self.cache.set(cache_key(self.model_name, stage, prompt), text, ttl)
+        return text
+
+    async def agenerate(self, stage, prompt, ttl, bypass=False):
+        """Coroutine version of `generate`."""
+        if not bypass:
+            cached = self.cache.get(cache_key(self.model_name, stage, prompt), stage)
+            if cached is not None:
+                return cached
+        try:
+            text, shared = await self._async_flights.do(
+                self._flight_key(stage, prompt, bypass),
+                lambda: self._afetch(stage, prompt, ttl),
+                timeout=self.deadline
+            )
+        except Exception as e:
+            return self._fallback(stage, prompt, e)
+        if shared:
+            self._count_coalesced(stage)
+        self._remember(stage, prompt, text)
+        return text
+
+    async def astream(self, stage, prompt, ttl, bypass=False, meta=None):
+        """Coroutine version of `stream`, as an async generator."""
+        meta = meta if meta is not None else {}
+        meta['cached'] = False
+        key = cache_key(self.model_name, stage, prompt)
+        if not bypass:
+            cached = self.cache.get(key, stage)
+            if cached is not None:
+                meta['cached'] = True
+                yield cached
+                return
+
+        flight_key = self._flight_key(stage, prompt, bypass)
+        future, leader = self._async_flights.join(flight_key)
+        if not leader:
+            result, error = await self._async_flights.wait(future, self.deadline)
+            if result is not None or error is not None:
+                text = result
+                if error is not None:
+                    text = self._fallback(stage, prompt, error)
+                self._count_coalesced(stage)
+                meta['coalesced'] = True
+                if text:
+                    yield text
+                return
+
+        result = error = None
+        held = False
+        try:
+            try:
+                # Held until the stream ends, like the sync stream's slot
+                try:
+                    await self._aacquire_slot(time.monotonic() + self.deadline)
+                except GatewayBusy:
+                    self._count_rejected(stage)
+                    raise
+                held = True
+                response = await self._acall(
+                    stage, lambda: self.model().generate_content_async(prompt, stream=True),
+                    held=True
+                )
+            except Exception as e:
+                error = e
+                result = self._fallback(stage, prompt, e)
+                meta.update(cached=True, stale=True)
+                yield result
+                return
+
+            chunks = response.__aiter__()
+            parts = []
+            completed = False
+            try:
+                while True:
+                    chunk = await self._anext_chunk(chunks)
+                    if chunk is _END:
+                        break
+                    text = getattr(chunk, 'text', '')
+                    if text:
+                        parts.append(text)
+                        yield text
+                completed = True
+            finally:
+                if not completed:
+                    # The consumer went away; stop the upstream generation too
+                    cancel = getattr(getattr(response, '_iterator', None), 'cancel', None)
+                    if cancel:
+                        cancel()
+
+            meta['usage_metadata'] = getattr(response, 'usage_metadata', None)
+            result = ''.join(parts)
+            if result and ttl > 0:
+                self.cache.set(key, result, ttl)
+            self._remember(stage, prompt, result)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if held:
+                self._arelease_slot()
+            if leader:
+                self._async_flights.finish(flight_key, future, result,
+                                           None if result is not None else error)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'circuit': self._state,
+                'consecutive_failures': self._failures,
+                'opens': self.opens,
+                'in_flight': self._in_flight,
+                'max_concurrency': self.max_concurrency,
+                'async_in_flight': self._async_in_flight,
+                'max_async_concurrency': self.max_async_concurrency,
+                'flights': self._flights.stats(),
+                'async_flights': self._async_flights.stats(),
+                'stages': {
+                    stage: dict(counters, latency=counters['latency'].snapshot())
+                    for stage, counters in self._stages.items()
+                },
+            }
@@ -0,0 +1,182 @@
+"""
+Request latency and span timing, exported in Prometheus text format.
+
+Every request gets a Trace. Code that talks to something slow wraps the
+call in `span(kind, name)`:
+
+    db    each cursor.execute, plus waiting for a pooled connection
+    s3    each S3 API call
+    pdf   each PDF text extraction
+    llm   each Gemini attempt (retries are separate spans)
+
+A span is recorded in the span_duration_seconds histogram and, if it ran
+while a request was being handled, added to that request's trace. When the
+request finishes its latency goes into http_request_duration_seconds by
+method, route rule and status, and a request slower than
+`slow_request_seconds` is logged with its time broken down by span.
+
+The current trace is held in a context variable, so it follows a request
+into coroutines and asyncio.to_thread calls, but not onto pool threads it
+hands work to. Spans must therefore be opened on the thread that waits.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the request and span histogram buckets
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    'http_request_duration_seconds': 'Request latency by method, route and status.',
+    'span_duration_seconds': 'Time spent in database, S3, PDF and Gemini calls.',
+}
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=REQUEST_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self):
+        """Cumulative counts per upper bound, as Prometheus histograms have them."""
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        cumulative['+Inf'] = self.count
+        return {'buckets': cumulative, 'count': self.count, 'sum': round(self.total, 6)}
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans = []
+
+    def breakdown(self):
+        """[(kind, name, count, seconds)], most time first."""
+        totals = {}
+        for kind, name, seconds in self.spans:
+            count, total = totals.get((kind, name), (0, 0.0))
+            totals[kind, name] = (count + 1, total + seconds)
+        return sorted(((kind, name, count, total) for (kind, name), (count, total) in totals.items()),
+                      key=lambda item: -item[3])
+
+
+class Registry:
+    def __init__(self, slow_request_seconds=1.0):
+        self.slow_request_seconds = slow_request_seconds
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.slow_requests = 0
+
+    def observe(self, name, labels, seconds):
+        """Add `seconds` to the histogram `name` for `labels`, a tuple of (label, value) pairs."""
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[name, labels] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def count_slow_request(self):
+        with self._lock:
+            self.slow_requests += 1
+
+    def render(self):
+        """Every histogram and counter, in Prometheus text format."""
+        with self._lock:
+            series = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                series.setdefault(name, []).append((dict(labels), histogram.snapshot()))
+            slow_requests = self.slow_requests
+        text = ''.join(render_histogram(name, HELP.get(name, name), entries)
+                       for name, entries in series.items())
+        return text + (
+            '# HELP slow_requests_total Requests slower than the slow-request threshold.\n'
+            '# TYPE slow_requests_total counter\n'
+            f'slow_requests_total {slow_requests}\n'
+        )
+
+
+registry = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _series(name, labels, extra=None):
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return name
+    return name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_histogram(name, help_text, entries):
+    """
+    Prometheus text for histogram `name`; `entries` are (labels, snapshot)
+    pairs, with snapshots as LatencyHistogram.snapshot returns them.
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, snapshot in entries:
+        for bound, count in snapshot['buckets'].items():
+            lines.append(f"{_series(name + '_bucket', labels, ('le', bound))} {count}")
+        lines.append(f"{_series(name + '_sum', labels)} {snapshot['sum']}")
+        lines.append(f"{_series(name + '_count', labels)} {snapshot['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def span(kind, name):
+    """Time the block as a `kind` span called `name`."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        registry.observe('span_duration_seconds', (('kind', kind), ('name', name)), elapsed)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append((kind, name, elapsed))
+
+
+def start_trace():
+    """Start timing a request in the current context."""
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    """The trace of the request being handled in this context, if any."""
+    return _current.get()
+
+
+def finish_trace(trace, method, route, status):
+    """Record a request's latency, logging it with its spans if it was slow."""
+    elapsed = time.monotonic() - trace.started
+    if _current.get() is trace:
+        _current.set(None)
+    registry.observe('http_request_duration_seconds',
+                     (('method', method), ('route', route), ('status', str(status))), elapsed)
+    if elapsed < registry.slow_request_seconds:
+        return
+
+    registry.count_slow_request()
+    breakdown = trace.breakdown()
+    accounted = sum(total for _, _, _, total in breakdown)
+    parts = [f"{kind} {name} {count}x {total * 1000:.0f}ms" for kind, name, count, total in breakdown]
+    parts.append(f"other {max(0.0, elapsed - accounted) * 1000:.0f}ms")
+    print(f"Slow request: {method} {route} {status} {elapsed * 1000:.0f}ms ({', '.join(parts)})")
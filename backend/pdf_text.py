@@ -0,0 +1,170 @@
+"""
+PDF text extraction in a separate process pool.
+
+PyPDF2 is pure-Python and CPU-bound, so parsing on a request thread holds
+the GIL and stalls every other request in the process. PDFExtractor runs it
+in a small pool of worker processes instead. Each page's text is collected
+into a list and joined once, extraction stops after `max_pages` pages or
+once `max_chars` characters are collected, and a task that runs past
+`timeout` seconds is aborted so a hostile PDF cannot hold a worker.
+
+At most `max_workers` tasks are handed to the pool at once, so a task's
+deadline starts when a worker picks it up. Waiting for a free worker is
+limited separately by `queue_timeout`, and giving up on that wait never
+touches the pool or the parses running in it.
+"""
+
+import io
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import span
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a PDF takes longer than the extractor's timeout."""
+
+
+class _Alarm(BaseException):
+    # A BaseException, so PyPDF2's own `except Exception` blocks can't
+    # swallow it
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _Alarm()
+
+
+def _extract(data, max_pages, max_chars, timeout):
+    """Runs in a worker process. Returns (text, pages read, total pages)."""
+    # Imported here so only the worker processes load PyPDF2
+    import PyPDF2
+
+    # Workers run tasks on their main thread, so SIGALRM can interrupt a
+    # parse stuck inside PyPDF2
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(data))
+        total_pages = len(reader.pages)
+        parts = []
+        collected = 0
+        pages_read = 0
+        for page in reader.pages:
+            if pages_read >= max_pages or collected >= max_chars:
+                break
+            text = page.extract_text() or ''
+            parts.append(text)
+            collected += len(text)
+            pages_read += 1
+        return ''.join(parts)[:max_chars], pages_read, total_pages
+    except _Alarm:
+        raise ExtractionTimeout('PDF extraction timed out')
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class PDFExtractor:
+    def __init__(self, max_workers=2, timeout=20, max_pages=50, max_chars=15000,
+                 queue_timeout=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.queue_timeout = timeout if queue_timeout is None else queue_timeout
+        self.max_pages = max_pages
+        self.max_chars = max_chars
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._executor = None
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.busy = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers only import this module, and avoid forking
+                # a process that already runs threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        """Tear down a pool whose worker is stuck or dead."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, pdf_file):
+        """
+        Return the text of `pdf_file` (a binary stream), or None if it can't
+        be parsed. Raises ExtractionTimeout if parsing takes too long.
+        """
+        document = self.extract_document(pdf_file)
+        return document['text'] if document else None
+
+    def extract_document(self, pdf_file):
+        """
+        Like `extract`, but return a dict with the `text`, the number of
+        `pages_read` and the document's total `page_count`.
+        """
+        pdf_file.seek(0)
+        data = pdf_file.read()
+
+        with span('pdf', 'extract'):
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                self.busy += 1
+                raise ExtractionTimeout('PDF extraction is busy, try again shortly')
+            try:
+                executor = self._get_executor()
+                future = executor.submit(_extract, data, self.max_pages, self.max_chars, self.timeout)
+            except Exception:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda f: self._slots.release())
+            try:
+                # A worker is free, so the task is running now. It times
+                # itself out; the extra second covers a worker that is wedged
+                # somewhere the alarm can't reach.
+                text, pages_read, page_count = future.result(timeout=self.timeout + 1)
+            except (ExtractionTimeout, FutureTimeout):
+                self.timeouts += 1
+                if not future.done():
+                    self._reset(executor)
+                raise ExtractionTimeout('PDF extraction timed out')
+            except BrokenProcessPool as e:
+                self.failed += 1
+                self._reset(executor)
+                print(f"Error extracting PDF text: {e}")
+                return None
+            except Exception as e:
+                self.failed += 1
+                print(f"Error extracting PDF text: {e}")
+                return None
+
+        self.completed += 1
+        return {'text': text, 'pages_read': pages_read, 'page_count': page_count}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            'max_workers': self.max_workers,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'busy': self.busy,
+        }
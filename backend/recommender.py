@@ -0,0 +1,180 @@
+"""
+Local problem recommendations from a bundled catalog.
+
+The catalog (data/problem_catalog.json) lists LeetCode problems with their
+number, name, difficulty, one of the tracker's topics and the numbers of
+`related` problems. Related links are treated as undirected similarity
+edges. ProblemCatalog ranks the problems a user has not solved by:
+
+    coverage      topics with few solved problems come first
+    progression   difficulty closest to the user's next step in that topic
+    similarity    problems linked to ones the user has already solved
+
+Solved problems are matched against hash sets of normalized numbers and
+names, so nothing the user has solved is ever suggested.
+"""
+
+import json
+import re
+
+LEVELS = {'Easy': 0, 'Medium': 1, 'Hard': 2}
+
+# Problems solved in a topic at (or above) a level before moving up a level
+STEP_UP_AFTER = 3
+
+COVERAGE_WEIGHT = 1.0
+PROGRESSION_WEIGHT = 1.0
+SIMILARITY_WEIGHT = 0.8
+
+
+def normalize_number(value):
+    """'#0042', 'LC 42' and 42 all become '42' ('' if there is no number)."""
+    match = re.search(r'\d+', str(value or ''))
+    return str(int(match.group())) if match else ''
+
+
+def normalize_name(value):
+    return ' '.join(re.findall(r'[a-z0-9]+', str(value or '').lower()))
+
+
+def target_level(counts):
+    """Next difficulty level for a topic, from its (easy, medium, hard) counts."""
+    easy, medium, hard = counts
+    if medium + hard >= STEP_UP_AFTER:
+        return 2
+    if easy + medium + hard >= STEP_UP_AFTER:
+        return 1
+    return 0
+
+
+class ProblemCatalog:
+    def __init__(self, problems):
+        self.problems = problems
+        self.by_number = {p['number']: p for p in problems}
+        self.by_name = {normalize_name(p['name']): p for p in problems}
+        self.topics = {}
+        self.neighbours = {p['number']: set() for p in problems}
+        for problem in problems:
+            self.topics.setdefault(problem['topic'].lower(), problem['topic'])
+            for other in problem.get('related', ()):
+                if other in self.neighbours and other != problem['number']:
+                    self.neighbours[problem['number']].add(other)
+                    self.neighbours[other].add(problem['number'])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def match_topic(self, topic):
+        """The catalog's spelling of `topic`, or None if it has no such topic."""
+        return self.topics.get(str(topic or '').strip().lower())
+
+    def _profile(self, solved):
+        """Solved-number and solved-name sets, plus per-topic level counts."""
+        numbers = set()
+        names = set()
+        counts = {}
+        for row in solved:
+            number = normalize_number(row.get('number'))
+            name = normalize_name(row.get('name'))
+            if number:
+                numbers.add(number)
+            if name:
+                names.add(name)
+
+            # Coverage follows the user's own topic and difficulty tags, as
+            # their dashboard does; the catalog only fills in missing ones
+            topic, level = self.match_topic(row.get('topic')), LEVELS.get(row.get('difficulty'))
+            entry = self.by_number.get(number) or self.by_name.get(name)
+            if entry:
+                numbers.add(entry['number'])
+                topic = topic or entry['topic']
+                level = LEVELS[entry['difficulty']] if level is None else level
+            if topic and level is not None:
+                counts.setdefault(topic, [0, 0, 0])[level] += 1
+        return numbers, names, counts
+
+    def _rank(self, candidates, numbers, counts):
+        ranked = []
+        for order, problem in enumerate(candidates):
+            topic_counts = counts.get(problem['topic'], (0, 0, 0))
+            coverage = 1.0 / (1 + sum(topic_counts))
+            level = LEVELS[problem['difficulty']]
+            progression = 1 - abs(level - target_level(topic_counts)) / 2
+            linked = sorted(self.neighbours[problem['number']] & numbers, key=int)
+            similarity = min(len(linked), 2) / 2
+            score = (COVERAGE_WEIGHT * coverage + PROGRESSION_WEIGHT * progression
+                     + SIMILARITY_WEIGHT * similarity)
+            # Catalog order breaks ties, so results are stable
+            ranked.append((-score, order, problem, linked))
+        ranked.sort(key=lambda item: item[:2])
+        return [(problem, linked) for _, _, problem, linked in ranked]
+
+    def _reason(self, problem, linked, counts):
+        topic, difficulty = problem['topic'], problem['difficulty']
+        if linked:
+            solved = self.by_number[linked[0]]
+            return f"Related to {solved['number']}. {solved['name']}, which you've already solved"
+        topic_counts = counts.get(topic)
+        if not topic_counts:
+            return f"Opens up {topic}, a topic you haven't practised yet"
+        solved_count = sum(topic_counts)
+        plural = 's' if solved_count != 1 else ''
+        highest = max(level for level, count in enumerate(topic_counts) if count)
+        if LEVELS[difficulty] > highest:
+            return f"Steps up to {difficulty} in {topic}, where you've solved {solved_count} problem{plural}"
+        return f"More {difficulty} practice in {topic}, where you've solved {solved_count} problem{plural}"
+
+    def recommend(self, solved, topic=None, limit=5, new_topics=2):
+        """
+        Up to `limit` unsolved problems for a user whose solved problems are
+        `solved` (dicts with number, name, difficulty and topic).
+
+        With a `topic`, picks come from that topic and are spread across
+        difficulties, nearest the user's next level first. Without one,
+        `new_topics` picks come from topics the user hasn't touched and the
+        rest from topics they have, at most two per topic.
+        """
+        numbers, names, counts = self._profile(solved)
+        candidates = [p for p in self.problems
+                      if p['number'] not in numbers and normalize_name(p['name']) not in names]
+
+        if topic:
+            ranked = self._rank([p for p in candidates if p['topic'] == topic], numbers, counts)
+            target = target_level(counts.get(topic, (0, 0, 0)))
+            by_level = {}
+            for problem, linked in ranked:
+                by_level.setdefault(LEVELS[problem['difficulty']], []).append((problem, linked))
+            # Round-robin over difficulty levels, nearest the target first
+            queues = [by_level[level] for level in sorted(by_level, key=lambda l: (abs(l - target), l))]
+            picks = []
+            while len(picks) < limit and any(queues):
+                for queue in queues:
+                    if queue and len(picks) < limit:
+                        picks.append(queue.pop(0))
+        else:
+            ranked = self._rank(candidates, numbers, counts)
+            per_topic = {}
+            familiar, fresh = [], []
+            for problem, linked in ranked:
+                if per_topic.get(problem['topic'], 0) >= 2:
+                    continue
+                pool = familiar if problem['topic'] in counts else fresh
+                pool.append((problem, linked))
+                per_topic[problem['topic']] = per_topic.get(problem['topic'], 0) + 1
+            fresh_count = min(new_topics, len(fresh), limit)
+            familiar_count = min(limit - fresh_count, len(familiar))
+            fresh_count = min(limit - familiar_count, len(fresh))
+            picks = familiar[:familiar_count] + fresh[:fresh_count]
+
+        return [{
+            'number': problem['number'],
+            'problem_name': problem['name'],
+            'topic': problem['topic'],
+            'difficulty': problem['difficulty'],
+            'reason': self._reason(problem, linked, counts),
+        } for problem, linked in picks]
+
+    def stats(self):
+        return {'problems': len(self.problems), 'topics': len(self.topics)}
@@ -0,0 +1,152 @@
+"""
+Request coalescing for identical in-flight work.
+
+When several callers ask for the same key at once (a class opening the same
+problem, say), only the first one, the leader, does the work; the others
+wait for it and share its result or its exception. Nothing is kept once the
+leader finishes, so this only merges calls that overlap in time; caching
+finished results is LLMCache's job.
+
+SingleFlight is for threads; AsyncSingleFlight does the same for
+coroutines on one event loop.
+"""
+
+import asyncio
+import threading
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    @property
+    def abandoned(self):
+        """The leader stopped without a result or an error."""
+        return self.result is None and self.error is None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """
+        Return (flight, leader). The leader must call `finish`; everyone else
+        calls `wait` on the flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight:
+                flight.waiters += 1
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def wait(self, flight, timeout=None):
+        """True once the leader has finished, False if `timeout` ran out first."""
+        return flight.done.wait(timeout)
+
+    def do(self, key, func, timeout=None):
+        """
+        Return (result, shared): `func()`'s result, with `shared` True if it
+        came from another caller's call. A follower whose leader was
+        abandoned, or didn't finish within `timeout`, calls `func` itself.
+        """
+        flight, leader = self.join(key)
+        if not leader:
+            if self.wait(flight, timeout) and not flight.abandoned:
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, True
+            return func(), False
+
+        result = error = None
+        try:
+            result = func()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.finish(key, flight, result, error)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._flights), 'leaders': self.leaders,
+                    'followers': self.followers}
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key):
+        """
+        Return (future, leader). The leader must call `finish`; everyone else
+        awaits `wait` on the future.
+        """
+        future = self._flights.get(key)
+        if future is not None:
+            self.followers += 1
+            return future, False
+        future = self._flights[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        if not future.done():
+            # A (result, error) pair rather than set_exception, so a flight
+            # nobody joined doesn't log an unretrieved exception
+            future.set_result((result, error))
+
+    async def wait(self, future, timeout=None):
+        """The leader's (result, error), or (None, None) if it was abandoned or timed out."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+
+    async def do(self, key, make, timeout=None):
+        """Async `SingleFlight.do`; `make()` returns an awaitable."""
+        future, leader = self.join(key)
+        if not leader:
+            result, error = await self.wait(future, timeout)
+            if error is not None:
+                raise error
+            if result is not None:
+                return result, True
+            return await make(), False
+
+        result = error = None
+        try:
+            result = await make()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.finish(key, future, result, error)
+        return result, False
+
+    def stats(self):
+        return {'in_flight': len(self._flights), 'leaders': self.leaders,
+                'followers': self.followers}
@@ -0,0 +1,186 @@
+"""
+Conversation-history compaction for the guided solver.
+
+Sending the whole conversation with every request makes prompts (and
+latency) grow with each turn. SolverContext keeps the most recent turns
+verbatim and folds older ones, a whole block at a time, into a running
+summary. An update starts from the longest summarized prefix it knows of
+(cached in this process, or passed in by the caller, e.g. as saved with a
+server-side session) and folds in everything after it with a single call,
+so a request makes at most one summarization call however long the
+history is. Finally the verbatim part is trimmed to a token budget.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Rough characters-per-token ratio for English text and code
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def count_hints(history):
+    """Number of hints already given, from the `stage` tag on mentor turns."""
+    return sum(1 for msg in history
+               if msg.get('role') == 'assistant' and msg.get('stage') == 'hint')
+
+
+def _format_turns(turns):
+    lines = []
+    for msg in turns:
+        if msg.get('role') == 'user':
+            lines.append(f"[STUDENT SAID]: {msg.get('content', '')}")
+        elif msg.get('role') == 'assistant':
+            lines.append(f"[YOU (MENTOR) SAID]: {msg.get('content', '')}")
+    return '\n\n'.join(lines)
+
+
+class CompactedHistory:
+    def __init__(self, summary, recent, summarized, dropped):
+        self.summary = summary
+        self.recent = recent
+        self.summarized = summarized
+        self.dropped = dropped
+
+    def render(self):
+        """The history as prompt text ('' if there is none)."""
+        if not self.summary and not self.recent:
+            return ''
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation:\n{self.summary}")
+        if self.dropped:
+            parts.append(f"({self.dropped} earlier messages omitted)")
+        if self.recent:
+            parts.append(_format_turns(self.recent))
+        return '\n\n'.join(parts)
+
+    def stats(self):
+        return {
+            'turns_verbatim': len(self.recent),
+            'turns_summarized': self.summarized,
+            'turns_dropped': self.dropped,
+        }
+
+
+class SolverContext:
+    def __init__(self, summarize, recent_turns=6, block_turns=4, max_tokens=3000,
+                 max_turn_chars=4000, max_cached=1024):
+        """
+        `summarize(prompt)` returns summary text. The last `recent_turns`
+        messages are kept verbatim (plus up to `block_turns - 1` more until a
+        full block can be summarized). The rendered history is kept within
+        `max_tokens`, and each verbatim message is cut to `max_turn_chars`.
+        """
+        self.summarize = summarize
+        self.recent_turns = recent_turns
+        self.block_turns = block_turns
+        self.max_tokens = max_tokens
+        self.max_turn_chars = max_turn_chars
+        self.max_cached = max_cached
+
+        self._lock = threading.Lock()
+        self._summaries = OrderedDict()
+        self.summary_calls = 0
+        self.summary_errors = 0
+
+    def _prefix_keys(self, turns):
+        """Cache key of each whole-block prefix of `turns`, by its length."""
+        digest = hashlib.sha256()
+        keys = {}
+        for length, msg in enumerate(turns, 1):
+            digest.update(f"{msg.get('role')}\0{msg.get('content')}\0".encode('utf-8'))
+            if length % self.block_turns == 0:
+                keys[length] = digest.hexdigest()
+        return keys
+
+    def _summarize_block(self, previous, block):
+        prompt = (
+            "You are condensing a tutoring conversation between a DSA mentor and a student "
+            "so the mentor can continue it. In at most 150 words, record the student's ideas "
+            "and mistakes, the hints and feedback already given (in order), and any approach "
+            "that was agreed on. Refer to the mentor as 'the mentor'.\n\n"
+        )
+        if previous:
+            prompt += f"Summary so far:\n{previous}\n\n"
+        block = [dict(msg, content=self._clip(msg.get('content', ''))) for msg in block]
+        prompt += f"New messages:\n{_format_turns(block)}\n\nUpdated summary:"
+        self.summary_calls += 1
+        return self.summarize(prompt).strip()
+
+    def _running_summary(self, older, saved=None):
+        """
+        Summary of `older`, which is a whole number of blocks long. `saved`
+        is a (summary, turns) pair already known for its first turns.
+        """
+        keys = self._prefix_keys(older)
+        start, previous = 0, ''
+        if saved and saved[0] and 0 < saved[1] <= len(older):
+            start, previous = saved[1], saved[0]
+
+        with self._lock:
+            for length in sorted(keys, reverse=True):
+                if length <= start:
+                    break
+                if keys[length] in self._summaries:
+                    self._summaries.move_to_end(keys[length])
+                    start, previous = length, self._summaries[keys[length]]
+                    break
+        if start == len(older):
+            return previous
+
+        summary = self._summarize_block(previous, older[start:])
+        with self._lock:
+            self._summaries[keys[len(older)]] = summary
+            while len(self._summaries) > self.max_cached:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def compact(self, history, saved=None):
+        """
+        Compact `history`; `saved` is an optional (summary, turns) pair
+        summarizing its first turns (see _running_summary).
+        """
+        turns = [msg for msg in history if msg.get('role') in ('user', 'assistant')]
+
+        # Summarize only whole blocks; the remainder stays verbatim
+        aged = max(0, len(turns) - self.recent_turns)
+        summarized = aged - aged % self.block_turns
+        older, recent = turns[:summarized], turns[summarized:]
+
+        summary = ''
+        dropped = 0
+        if older:
+            try:
+                summary = self._running_summary(older, saved)
+            except Exception as e:
+                # Without a summary, fall back to leaving old turns out
+                self.summary_errors += 1
+                print(f"Error summarizing solver history: {e}")
+                dropped, summarized = summarized, 0
+
+        recent = [dict(msg, content=self._clip(msg.get('content', ''))) for msg in recent]
+        compacted = CompactedHistory(summary, recent, summarized, dropped)
+
+        # Drop the oldest verbatim turns until the history fits the budget
+        while compacted.recent and estimate_tokens(compacted.render()) > self.max_tokens:
+            compacted.recent.pop(0)
+            compacted.dropped += 1
+        return compacted
+
+    def _clip(self, content):
+        if len(content) <= self.max_turn_chars:
+            return content
+        return content[:self.max_turn_chars] + ' [...]'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached_summaries': len(self._summaries),
+                'summary_calls': self.summary_calls,
+                'summary_errors': self.summary_errors,
+            }
@@ -0,0 +1,191 @@
+"""
+Server-side guided solver sessions.
+
+A session holds the problem statement and every turn so far, so a client
+sends only its new input instead of the whole conversation. Sessions and
+turns are stored in MySQL (`solver_sessions`, `solver_turns`). Active
+sessions are also kept in memory, so a turn costs a primary-key check of
+the session's turn count (another worker may have added turns) rather than
+reloading the conversation. They are dropped from memory after `idle_ttl`
+seconds without use, and deleted from the database after `retention`
+seconds.
+
+The running summary of a session's older turns (see solver_context.py) is
+stored with it, so whichever worker serves the next turn continues from it
+instead of summarizing the conversation again.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SolverSession:
+    def __init__(self, session_id, problem, user_id=None, turns=None, summary='', summary_turns=0):
+        self.id = session_id
+        self.problem = problem
+        self.user_id = user_id
+        self.turns = turns or []
+        self.summary = summary or ''
+        self.summary_turns = summary_turns or 0
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def to_dict(self):
+        return {'session_id': self.id, 'problem': self.problem,
+                'user_id': self.user_id, 'turns': list(self.turns)}
+
+
+class SolverSessions:
+    def __init__(self, connect, idle_ttl=1800, max_cached=1000, retention=86400,
+                 purge_interval=600):
+        """`connect()` returns a context manager yielding a DB connection."""
+        self.connect = connect
+        self.idle_ttl = idle_ttl
+        self.max_cached = max_cached
+        self.retention = retention
+        self.purge_interval = purge_interval
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._purged_at = time.monotonic()
+        self.hits = 0
+        self.loads = 0
+
+    def _cache(self, session):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            # Least recently used first, so stop at the first live one
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if len(self._sessions) <= self.max_cached and now - oldest.last_used < self.idle_ttl:
+                    break
+                self._sessions.popitem(last=False)
+
+    def create(self, problem, user_id=None):
+        session = SolverSession(str(uuid.uuid4()), problem, user_id)
+        with self.connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO solver_sessions (id, user_id, problem) VALUES (%s, %s, %s)',
+                (session.id, user_id, problem)
+            )
+            conn.commit()
+        self._cache(session)
+        self._maybe_purge()
+        return session
+
+    def get(self, session_id):
+        """Return the session, loading it from the database if needed, or None."""
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            if cached and time.monotonic() - cached.last_used >= self.idle_ttl:
+                cached = None
+
+        with self.connect() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT turn_count, summary_turns FROM solver_sessions WHERE id = %s',
+                           (session_id,))
+            row = cursor.fetchone()
+            if not row:
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                return None
+
+            if cached and row['turn_count'] == len(cached.turns):
+                if row['summary_turns'] > cached.summary_turns:
+                    # Another worker has summarized further
+                    cursor.execute(
+                        'SELECT summary, summary_turns FROM solver_sessions WHERE id = %s',
+                        (session_id,)
+                    )
+                    latest = cursor.fetchone()
+                    if latest:
+                        cached.summary = latest['summary'] or ''
+                        cached.summary_turns = latest['summary_turns']
+                with self._lock:
+                    cached.last_used = time.monotonic()
+                    if session_id in self._sessions:
+                        self._sessions.move_to_end(session_id)
+                    self.hits += 1
+                return cached
+
+            cursor.execute(
+                'SELECT id, user_id, problem, summary, summary_turns FROM solver_sessions WHERE id = %s',
+                (session_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute(
+                'SELECT role, stage, content FROM solver_turns WHERE session_id = %s ORDER BY id',
+                (session_id,)
+            )
+            turns = list(cursor.fetchall())
+
+        self.loads += 1
+        session = SolverSession(row['id'], row['problem'], row['user_id'], turns,
+                                row['summary'], row['summary_turns'])
+        self._cache(session)
+        return session
+
+    def append(self, session, *turns):
+        """Store new turns (dicts with role, stage and content) on a session."""
+        with self.connect() as conn, conn.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO solver_turns (session_id, role, stage, content) VALUES (%s, %s, %s, %s)',
+                [(session.id, turn['role'], turn.get('stage'), turn['content']) for turn in turns]
+            )
+            cursor.execute(
+                '''UPDATE solver_sessions
+                   SET turn_count = turn_count + %s, last_active_at = CURRENT_TIMESTAMP
+                   WHERE id = %s''',
+                (len(turns), session.id)
+            )
+            conn.commit()
+        session.turns.extend(turns)
+        session.last_used = time.monotonic()
+
+    def save_summary(self, session, summary, turns):
+        """Store `summary` as the running summary of the session's first `turns` turns."""
+        with self.connect() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                '''UPDATE solver_sessions SET summary = %s, summary_turns = %s
+                   WHERE id = %s AND summary_turns < %s''',
+                (summary, turns, session.id, turns)
+            )
+            conn.commit()
+        session.summary = summary
+        session.summary_turns = turns
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        with self.connect() as conn, conn.cursor() as cursor:
+            deleted = cursor.execute('DELETE FROM solver_sessions WHERE id = %s', (session_id,))
+            conn.commit()
+        return bool(deleted)
+
+    def purge_expired(self):
+        """Delete sessions idle for longer than `retention`; returns the count."""
+        self._purged_at = time.monotonic()
+        with self.connect() as conn, conn.cursor() as cursor:
+            deleted = cursor.execute(
+                'DELETE FROM solver_sessions WHERE last_active_at < NOW() - INTERVAL %s SECOND',
+                (self.retention,)
+            )
+            conn.commit()
+        return deleted
+
+    def _maybe_purge(self):
+        if time.monotonic() - self._purged_at < self.purge_interval:
+            return
+        try:
+            self.purge_expired()
+        except Exception as e:
+            print(f"Error purging solver sessions: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {'cached': len(self._sessions), 'hits': self.hits, 'loads': self.loads}
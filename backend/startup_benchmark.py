@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark for the backend.
+
+Imports the app module and builds an app with create_app() in fresh
+interpreters, and fails if the median time is over budget or if any heavy
+client library was loaded along the way (they should load on first use of
+the endpoints that need them).
+
+    python startup_benchmark.py [--runs 5] [--budget-ms 600]
+
+The budget defaults to STARTUP_BUDGET_MS (600 ms) and the exit status is 1
+when the check fails, so this can gate a deploy or CI step.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that must not be imported just by starting the app
+HEAVY_MODULES = ('google.generativeai', 'google.api_core', 'boto3', 'botocore', 'PyPDF2')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+app.create_app()
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'ms': elapsed * 1000,
+    'heavy': [name for name in %r if name in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+
+def measure_once():
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=here, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float,
+                        default=float(os.getenv('STARTUP_BUDGET_MS', 600)))
+    args = parser.parse_args()
+
+    # The first run warms the filesystem cache and bytecode, and isn't counted
+    measure_once()
+    results = [measure_once() for _ in range(args.runs)]
+    timings = [result['ms'] for result in results]
+    heavy = sorted({name for result in results for name in result['heavy']})
+    median = statistics.median(timings)
+
+    print(f"startup: median {median:.0f} ms, min {min(timings):.0f} ms, "
+          f"max {max(timings):.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if median > args.budget_ms:
+        print(f"FAIL: median startup is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if heavy:
+        print(f"FAIL: imported at startup: {', '.join(heavy)}")
+        failed = True
+    if not failed:
+        print('OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
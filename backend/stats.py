@@ -0,0 +1,222 @@
+"""
+Precomputed per-user aggregates for the dashboard analytics endpoints.
+
+The problem write paths keep three tables in step with `problems`:
+
+    user_stats         totals and per-difficulty counts (one row per user)
+    user_topic_stats   problem count per (user, topic)
+    user_daily_points  points and problem count per (user, day)
+
+Every change is applied as a signed delta computed from the problem row
+itself, inside the same transaction as the write, so reads never have to
+scan `problems`.
+"""
+
+import threading
+import uuid
+
+DIFFICULTIES = ('Easy', 'Medium', 'Hard')
+
+
+class DataVersions:
+    """
+    In-process change counters used to build ETags for cached reads.
+
+    Each problem write takes the next sequence number and records it against
+    the user. A user's dashboard depends on their own data and, through the
+    leaderboard, on everyone else's, so its tag combines both counters. The
+    boot id keeps tags from one process lifetime from matching another's.
+
+    The counters are per process. Writes handled by other workers are
+    bumped here when the leaderboard's refresh finds them in `user_stats`.
+    That refresh re-reads an overlap window and compares totals as well as
+    stamps, so same-second and late-committed writes are found too and a
+    tag is stale for at most the leaderboard's refresh interval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._latest = 0
+        self._users = {}
+
+    def bump(self, user_id):
+        with self._lock:
+            self._latest += 1
+            self._users[str(user_id)] = self._latest
+
+    def bump_many(self, user_ids):
+        for user_id in user_ids:
+            self.bump(user_id)
+
+    def etag(self, user_id):
+        with self._lock:
+            return f'{self._boot_id}-{self._users.get(str(user_id), 0)}-{self._latest}'
+
+
+def apply_problem(cursor, problem_id, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) one problem's contribution to the
+    aggregates. Call with sign=-1 before deleting or updating the row and
+    with sign=1 after inserting or updating it.
+    """
+    cursor.execute(
+        '''INSERT INTO user_stats
+               (user_id, total_problems, total_points, easy_count, medium_count, hard_count)
+           SELECT user_id, %s, %s * points,
+                  %s * (difficulty = 'Easy'), %s * (difficulty = 'Medium'), %s * (difficulty = 'Hard')
+           FROM problems WHERE id = %s
+           ON DUPLICATE KEY UPDATE
+               total_problems = total_problems + VALUES(total_problems),
+               total_points = total_points + VALUES(total_points),
+               easy_count = easy_count + VALUES(easy_count),
+               medium_count = medium_count + VALUES(medium_count),
+               hard_count = hard_count + VALUES(hard_count)''',
+        (sign, sign, sign, sign, sign, problem_id)
+    )
+    cursor.execute(
+        '''INSERT INTO user_topic_stats (user_id, topic, problem_count)
+           SELECT user_id, topic, %s FROM problems WHERE id = %s
+           ON DUPLICATE KEY UPDATE problem_count = problem_count + VALUES(problem_count)''',
+        (sign, problem_id)
+    )
+    cursor.execute(
+        '''INSERT INTO user_daily_points (user_id, day, points, problem_count)
+           SELECT user_id, DATE(created_at), %s * points, %s FROM problems WHERE id = %s
+           ON DUPLICATE KEY UPDATE
+               points = points + VALUES(points),
+               problem_count = problem_count + VALUES(problem_count)''',
+        (sign, sign, problem_id)
+    )
+
+
+def apply_new_problems(cursor, user_id, problems):
+    """
+    Add a batch of freshly inserted problems for one user, given as dicts
+    with difficulty, topic, points and created_at. The deltas are summed
+    here, so the cost is three statements per batch rather than per row.
+    """
+    if not problems:
+        return
+
+    difficulty_counts = dict.fromkeys(DIFFICULTIES, 0)
+    topic_counts = {}
+    daily = {}
+    total_points = 0
+    for problem in problems:
+        difficulty_counts[problem['difficulty']] += 1
+        topic_counts[problem['topic']] = topic_counts.get(problem['topic'], 0) + 1
+        points, count = daily.get(problem['created_at'].date(), (0, 0))
+        daily[problem['created_at'].date()] = (points + problem['points'], count + 1)
+        total_points += problem['points']
+
+    cursor.execute(
+        '''INSERT INTO user_stats
+               (user_id, total_problems, total_points, easy_count, medium_count, hard_count)
+           VALUES (%s, %s, %s, %s, %s, %s)
+           ON DUPLICATE KEY UPDATE
+               total_problems = total_problems + VALUES(total_problems),
+               total_points = total_points + VALUES(total_points),
+               easy_count = easy_count + VALUES(easy_count),
+               medium_count = medium_count + VALUES(medium_count),
+               hard_count = hard_count + VALUES(hard_count)''',
+        (user_id, len(problems), total_points,
+         difficulty_counts['Easy'], difficulty_counts['Medium'], difficulty_counts['Hard'])
+    )
+    cursor.executemany(
+        '''INSERT INTO user_topic_stats (user_id, topic, problem_count)
+           VALUES (%s, %s, %s)
+           ON DUPLICATE KEY UPDATE problem_count = problem_count + VALUES(problem_count)''',
+        [(user_id, topic, count) for topic, count in topic_counts.items()]
+    )
+    cursor.executemany(
+        '''INSERT INTO user_daily_points (user_id, day, points, problem_count)
+           VALUES (%s, %s, %s, %s)
+           ON DUPLICATE KEY UPDATE
+               points = points + VALUES(points),
+               problem_count = problem_count + VALUES(problem_count)''',
+        [(user_id, day, points, count) for day, (points, count) in daily.items()]
+    )
+
+
+def get_summary(cursor, user_id):
+    cursor.execute(
+        '''SELECT total_problems, total_points, easy_count, medium_count, hard_count
+           FROM user_stats WHERE user_id = %s''',
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return {'total_problems': 0, 'total_points': 0,
+                'easy_count': 0, 'medium_count': 0, 'hard_count': 0}
+    return row
+
+
+def difficulty_breakdown(summary):
+    """Shape a user_stats row like the old GROUP BY difficulty result."""
+    counts = zip(DIFFICULTIES, (summary['easy_count'], summary['medium_count'], summary['hard_count']))
+    return [{'difficulty': difficulty, 'count': count} for difficulty, count in counts if count > 0]
+
+
+def get_topic_breakdown(cursor, user_id):
+    cursor.execute(
+        '''SELECT topic, problem_count as count
+           FROM user_topic_stats
+           WHERE user_id = %s AND problem_count > 0
+           ORDER BY count DESC''',
+        (user_id,)
+    )
+    return cursor.fetchall()
+
+
+def get_points_series(cursor, user_id):
+    """Cumulative points per day, oldest first."""
+    cursor.execute(
+        '''SELECT day, points
+           FROM user_daily_points
+           WHERE user_id = %s AND problem_count > 0
+           ORDER BY day ASC''',
+        (user_id,)
+    )
+    cumulative = 0
+    series = []
+    for row in cursor.fetchall():
+        cumulative += row['points']
+        series.append({'date': row['day'].strftime('%Y-%m-%d'), 'points': cumulative})
+    return series
+
+
+def rebuild(cursor, user_id=None):
+    """
+    Recompute the aggregates from `problems`, for one user or everyone.
+    Used to backfill existing data and to repair drift.
+    """
+    where = 'WHERE user_id = %s' if user_id is not None else ''
+    params = (user_id,) if user_id is not None else ()
+
+    for table in ('user_stats', 'user_topic_stats', 'user_daily_points'):
+        cursor.execute(f'DELETE FROM {table} {where}', params)
+
+    cursor.execute(
+        f'''INSERT INTO user_stats
+                (user_id, total_problems, total_points, easy_count, medium_count, hard_count)
+            SELECT user_id, COUNT(*), SUM(points),
+                   SUM(difficulty = 'Easy'), SUM(difficulty = 'Medium'), SUM(difficulty = 'Hard')
+            FROM problems {where}
+            GROUP BY user_id''',
+        params
+    )
+    cursor.execute(
+        f'''INSERT INTO user_topic_stats (user_id, topic, problem_count)
+            SELECT user_id, topic, COUNT(*)
+            FROM problems {where}
+            GROUP BY user_id, topic''',
+        params
+    )
+    cursor.execute(
+        f'''INSERT INTO user_daily_points (user_id, day, points, problem_count)
+            SELECT user_id, DATE(created_at), SUM(points), COUNT(*)
+            FROM problems {where}
+            GROUP BY user_id, DATE(created_at)''',
+        params
+    )
@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta
+
+from leaderboard import Leaderboard
+from stats import DataVersions
+
+
+class FakeStats:
+    """Stands in for users LEFT JOIN user_stats, recording what was asked for."""
+
+    def __init__(self):
+        self.rows = {}
+        self.queries = []
+
+    def set(self, user_id, points, problems, second):
+        self.rows[user_id] = {'id': user_id, 'name': f'user {user_id}', 'email': f'{user_id}@x',
+                              'total_points': points, 'total_problems': problems,
+                              'updated_at': datetime(2024, 1, 1, 0, 0, second)}
+
+    def load(self, since=None):
+        self.queries.append(since)
+        return [dict(row) for row in self.rows.values()
+                if since is None or row['updated_at'] >= since]
+
+
+def test_refresh_moves_only_changed_users():
+    stats = FakeStats()
+    for user_id in range(1, 6):
+        stats.set(user_id, user_id * 10, user_id, second=1)
+    changes = []
+    board = Leaderboard(stats.load, refresh_interval=0, on_change=changes.append)
+
+    assert [entry['user_id'] for entry in board.top(3)] == [5, 4, 3]
+
+    # Another worker records a write for user 1
+    stats.set(1, 100, 2, second=5)
+    assert board.rank(1)['rank'] == 1
+    assert stats.queries == [None, datetime(2024, 1, 1, 0, 0, 1) - timedelta(seconds=10)]
+    assert changes == [[1]]
+
+    # Rows from the last refresh's second come back, but aren't changes
+    board.top(1)
+    assert changes == [[1]]
+    assert len(board) == 5
+
+
+def test_full_refresh_picks_up_new_and_deleted_users():
+    stats = FakeStats()
+    stats.set(1, 10, 1, second=1)
+    stats.set(2, 20, 2, second=1)
+    board = Leaderboard(stats.load, refresh_interval=0, full_refresh_interval=0.05)
+    assert len(board) == 2
+
+    del stats.rows[2]
+    stats.set(3, 5, 1, second=1)
+    time.sleep(0.06)
+    assert [entry['user_id'] for entry in board.top(10)] == [1, 3]
+
+
+def test_other_workers_writes_change_dashboard_etags():
+    stats = FakeStats()
+    stats.set(1, 10, 1, second=1)
+    versions = DataVersions()
+    board = Leaderboard(stats.load, refresh_interval=0, on_change=versions.bump_many)
+    board.refresh()
+    tag = versions.etag(1)
+
+    stats.set(1, 20, 2, second=3)
+    board.refresh()
+    assert versions.etag(1) != tag
+
+
+def test_same_second_writes_are_not_dropped():
+    stats = FakeStats()
+    stats.set(1, 10, 1, second=1)
+    stats.set(2, 20, 2, second=1)
+    board = Leaderboard(stats.load, refresh_interval=0)
+    board.refresh()
+
+    stats.set(1, 30, 2, second=3)
+    board.refresh()
+
+    # A second write from another worker, stamped in the same second
+    stats.set(1, 60, 3, second=3)
+    assert board.rank(1)['total_points'] == 60
+
+
+def test_late_commit_with_an_older_stamp_is_found():
+    stats = FakeStats()
+    stats.set(1, 10, 1, second=1)
+    stats.set(2, 20, 2, second=1)
+    board = Leaderboard(stats.load, refresh_interval=0)
+    board.refresh()
+
+    stats.set(2, 30, 3, second=8)
+    board.refresh()
+
+    # Stamped before user 2's row but committed after it was read
+    stats.set(1, 50, 2, second=6)
+    assert board.rank(1)['rank'] == 1
+
+
+def test_same_second_writes_change_dashboard_etags():
+    stats = FakeStats()
+    stats.set(1, 10, 1, second=1)
+    versions = DataVersions()
+    board = Leaderboard(stats.load, refresh_interval=0, on_change=versions.bump_many)
+    board.refresh()
+
+    stats.set(1, 30, 2, second=3)
+    board.refresh()
+    tag = versions.etag(1)
+
+    # Another worker's second write lands in the same second
+    stats.set(1, 60, 3, second=3)
+    board.refresh()
+    assert versions.etag(1) != tag
@@ -0,0 +1,243 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_cache import LLMCache
+from llm_gateway import LLMGateway, LLMUnavailable, GatewayBusy, CircuitOpen, CallTimeout
+
+
+class UpstreamError(Exception):
+    def __init__(self, code):
+        super().__init__(f'HTTP {code}')
+        self.code = code
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStream:
+    usage_metadata = None
+
+    def __init__(self, parts, delay):
+        self.parts = parts
+        self.delay = delay
+
+    def __iter__(self):
+        for part in self.parts:
+            time.sleep(self.delay)
+            yield Reply(part)
+
+
+class FakeModel:
+    """
+    Stands in for the Gemini model. Each call takes the next scripted step:
+    a reply text, an HTTP error code, or ('slow', seconds, text).
+    """
+
+    def __init__(self, *script, default='ok'):
+        self.script = list(script)
+        self.default = default
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next_step(self):
+        with self._lock:
+            self.calls += 1
+            return self.script.pop(0) if self.script else self.default
+
+    def _run(self, step):
+        if isinstance(step, int):
+            raise UpstreamError(step)
+        if isinstance(step, tuple):
+            _, seconds, step = step
+            time.sleep(seconds)
+        return step
+
+    def generate_content(self, prompt, stream=False):
+        step = self._run(self._next_step())
+        if stream:
+            return FakeStream(step.split(' '), delay=0.05)
+        return Reply(step)
+
+    async def generate_content_async(self, prompt, stream=False):
+        step = self._next_step()
+        if isinstance(step, tuple):
+            _, seconds, step = step
+            await asyncio.sleep(seconds)
+        return Reply(self._run(step))
+
+
+def make_gateway(model, **options):
+    options.setdefault('backoff', 0.01)
+    options.setdefault('max_backoff', 0.02)
+    return LLMGateway(lambda: model, 'fake-model', LLMCache(), **options)
+
+
+def generate(gateway, prompt='prompt'):
+    # ttl=0 keeps the response cache out of the way
+    return gateway.generate('test', prompt, ttl=0)
+
+
+@pytest.mark.parametrize('code', [429, 500, 503])
+def test_retries_transient_errors(code):
+    model = FakeModel(code, code, 'answer')
+    gateway = make_gateway(model, max_attempts=3)
+
+    assert generate(gateway) == 'answer'
+    assert model.calls == 3
+    assert gateway.stats()['stages']['test']['retries'] == 2
+
+
+def test_does_not_retry_client_errors():
+    model = FakeModel(400)
+    gateway = make_gateway(model, max_attempts=3)
+
+    with pytest.raises(UpstreamError):
+        generate(gateway)
+    assert model.calls == 1
+    assert gateway.stats()['circuit'] == 'closed'
+
+
+def test_breaker_opens_then_closes_after_a_good_trial_call():
+    model = FakeModel(500, 500, 'recovered')
+    gateway = make_gateway(model, max_attempts=1, failure_threshold=2, reset_timeout=0.2)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            generate(gateway)
+    assert gateway.stats()['circuit'] == 'open'
+
+    # Fails fast without reaching the model
+    with pytest.raises(CircuitOpen):
+        generate(gateway)
+    assert model.calls == 2
+
+    time.sleep(0.25)
+    assert generate(gateway) == 'recovered'
+    assert gateway.stats()['circuit'] == 'closed'
+
+
+def test_failed_trial_call_reopens_the_breaker():
+    model = FakeModel(500, 500)
+    gateway = make_gateway(model, max_attempts=1, failure_threshold=1, reset_timeout=0.1)
+
+    with pytest.raises(LLMUnavailable):
+        generate(gateway)
+    time.sleep(0.15)
+    with pytest.raises(LLMUnavailable):
+        generate(gateway)
+    stats = gateway.stats()
+    assert stats['circuit'] == 'open'
+    assert stats['opens'] == 2
+
+
+def test_deadline_stops_waiting_on_a_slow_call():
+    model = FakeModel(('slow', 1, 'late'))
+    gateway = make_gateway(model, deadline=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(CallTimeout):
+        generate(gateway)
+    assert time.monotonic() - started < 0.5
+
+
+def test_serves_the_last_good_response_when_upstream_fails():
+    model = FakeModel('first answer', 503)
+    gateway = make_gateway(model, max_attempts=1)
+
+    assert generate(gateway) == 'first answer'
+    assert generate(gateway) == 'first answer'
+    assert gateway.stats()['stages']['test']['degraded'] == 1
+
+    # Nothing to fall back on for a prompt that never succeeded
+    model.script.append(503)
+    with pytest.raises(LLMUnavailable):
+        generate(gateway, 'other prompt')
+
+
+def test_rejects_calls_beyond_the_concurrency_limit():
+    model = FakeModel(default=('slow', 0.4, 'ok'))
+    gateway = make_gateway(model, max_concurrency=2, queue_timeout=0.1)
+    results = []
+
+    def call(prompt):
+        try:
+            results.append(generate(gateway, prompt))
+        except GatewayBusy:
+            results.append('busy')
+
+    threads = [threading.Thread(target=call, args=(f'prompt {i}',)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == ['busy', 'ok', 'ok']
+    assert gateway.stats()['stages']['test']['rejected'] == 1
+    assert gateway.stats()['in_flight'] == 0
+
+
+def test_stream_keeps_its_slot_between_chunks():
+    model = FakeModel('one two three four', default=('slow', 0.3, 'ok'))
+    gateway = make_gateway(model, max_concurrency=1, queue_timeout=0.05)
+
+    chunks = gateway.stream('test', 'stream prompt', ttl=0)
+    received = [next(chunks)]
+
+    # The stream holds the only slot, so a new call is turned away rather
+    # than the stream losing its next chunk
+    with pytest.raises(GatewayBusy):
+        generate(gateway, 'competing prompt')
+    received.extend(chunks)
+
+    assert ''.join(received) == 'onetwothreefour'
+    assert gateway.stats()['in_flight'] == 0
+    assert generate(gateway, 'after the stream') == 'ok'
+
+
+def test_closing_a_stream_early_frees_its_slot():
+    model = FakeModel('one two three four')
+    gateway = make_gateway(model, max_concurrency=1)
+
+    chunks = gateway.stream('test', 'stream prompt', ttl=0)
+    next(chunks)
+    chunks.close()
+
+    assert gateway.stats()['in_flight'] == 0
+
+
+def test_follower_shares_an_empty_stream():
+    model = FakeModel(('slow', 0.2, ''), default='second call')
+    gateway = make_gateway(model)
+    results = {}
+
+    def consume(name):
+        results[name] = list(gateway.stream('test', 'stream prompt', ttl=0))
+
+    leader = threading.Thread(target=consume, args=('leader',))
+    leader.start()
+    time.sleep(0.05)
+    consume('follower')
+    leader.join()
+
+    # Nothing to send, and no second upstream call to find that out
+    assert results == {'leader': [], 'follower': []}
+    assert model.calls == 1
+    assert gateway.stats()['stages']['test']['coalesced'] == 1
+
+
+def test_async_calls_retry_and_respect_the_deadline():
+    model = FakeModel(429, 'answer', ('slow', 1, 'late'))
+    gateway = make_gateway(model, deadline=0.2)
+
+    async def run():
+        assert await gateway.agenerate('test', 'prompt', ttl=0) == 'answer'
+        with pytest.raises(CallTimeout):
+            await gateway.agenerate('test', 'other prompt', ttl=0)
+
+    asyncio.run(run())
+    assert gateway.stats()['async_in_flight'] == 0
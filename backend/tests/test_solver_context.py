@@ -0,0 +1,61 @@
+from solver_context import SolverContext
+
+
+def conversation(length):
+    return [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f'message {i}'}
+            for i in range(length)]
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return f'summary {len(self.prompts)}'
+
+
+def test_long_history_is_summarized_in_one_call():
+    summarize = FakeSummarizer()
+    context = SolverContext(summarize, recent_turns=6, block_turns=4)
+
+    compacted = context.compact(conversation(46))
+
+    assert compacted.summarized == 40
+    assert len(summarize.prompts) == 1
+    assert compacted.summary == 'summary 1'
+
+
+def test_later_blocks_build_on_the_cached_summary():
+    summarize = FakeSummarizer()
+    context = SolverContext(summarize, recent_turns=6, block_turns=4)
+    context.compact(conversation(46))
+
+    # Same history again: nothing new to summarize
+    context.compact(conversation(46))
+    assert len(summarize.prompts) == 1
+
+    # One more block: a single call folding it into the previous summary
+    compacted = context.compact(conversation(50))
+    assert len(summarize.prompts) == 2
+    assert 'Summary so far:\nsummary 1' in summarize.prompts[1]
+    assert 'message 40' in summarize.prompts[1] and 'message 39' not in summarize.prompts[1]
+    assert compacted.summarized == 44
+
+
+def test_continues_from_a_saved_summary():
+    summarize = FakeSummarizer()
+    context = SolverContext(summarize, recent_turns=6, block_turns=4)
+
+    # As another worker would, with the summary stored on the session
+    compacted = context.compact(conversation(50), saved=('stored summary', 40))
+
+    assert len(summarize.prompts) == 1
+    assert 'Summary so far:\nstored summary' in summarize.prompts[0]
+    assert 'message 40' in summarize.prompts[0] and 'message 39' not in summarize.prompts[0]
+    assert compacted.summarized == 44
+
+    # Nothing new since the saved summary: no call at all
+    compacted = context.compact(conversation(46), saved=('stored summary', 40))
+    assert compacted.summary == 'stored summary'
+    assert len(summarize.prompts) == 1
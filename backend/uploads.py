@@ -0,0 +1,71 @@
+"""
+Memory-bounded handling of uploaded files.
+
+Werkzeug parses multipart bodies into a stream obtained from
+`Request._get_file_stream`. UploadRequest swaps that for a spooled file that
+hashes bytes as the parser writes them, so the SHA-256 of an upload is known
+as soon as parsing finishes, without reading the file again. Bodies larger
+than `spool_max_size` go to a temporary file on disk rather than memory.
+"""
+
+import hashlib
+import shutil
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class HashingSpooledFile(SpooledTemporaryFile):
+    """SpooledTemporaryFile that keeps a running SHA-256 of everything written."""
+
+    def __init__(self, max_size):
+        super().__init__(max_size=max_size, mode='rb+')
+        self._digest = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.bytes_written += len(data)
+        return super().write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class UploadRequest(Request):
+    spool_max_size = 512 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return HashingSpooledFile(self.spool_max_size)
+
+
+def content_hash(stream):
+    """
+    SHA-256 of an upload stream. Free for streams produced by UploadRequest;
+    anything else is hashed in chunks and rewound.
+    """
+    if isinstance(stream, HashingSpooledFile):
+        return stream.hexdigest()
+
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def spool_copy(stream, max_size=UploadRequest.spool_max_size):
+    """
+    Copy an upload into a spooled file the caller owns, for work that
+    outlives the request (the request's own files are closed at teardown).
+    """
+    copy = SpooledTemporaryFile(max_size=max_size, mode='rb+')
+    stream.seek(0)
+    shutil.copyfileobj(stream, copy, COPY_CHUNK_SIZE)
+    stream.seek(0)
+    copy.seek(0)
+    return copy
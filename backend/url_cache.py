@@ -0,0 +1,47 @@
+"""
+Cache of presigned S3 GET URLs.
+
+Signing is pure CPU work, but it runs once per resume per listing, so a
+signed URL is reused until `safety_margin` seconds before it expires. That
+way every URL handed out stays valid for at least the margin.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PresignedURLCache:
+    def __init__(self, sign, expires_in=3600, safety_margin=300, max_entries=10000):
+        """`sign(s3_key, expires_in)` must return a presigned URL."""
+        self.sign = sign
+        self.expires_in = expires_in
+        self.safety_margin = safety_margin
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._urls = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, s3_key):
+        now = time.time()
+        with self._lock:
+            entry = self._urls.get(s3_key)
+            if entry and entry[0] - self.safety_margin > now:
+                self._urls.move_to_end(s3_key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        url = self.sign(s3_key, self.expires_in)
+        with self._lock:
+            self._urls[s3_key] = (now + self.expires_in, url)
+            self._urls.move_to_end(s3_key)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._urls), 'hits': self.hits, 'misses': self.misses}
@@ -16,6 +16,7 @@ export default function Dashboard() {
   const [topicData, setTopicData] = useState(null);
   const [pointsData, setPointsData] = useState(null);
   const [leaderboard, setLeaderboard] = useState([]);
+  const [rank, setRank] = useState(null);
 
   useEffect(() => {
     const userId = localStorage.getItem('user_id');
@@ -30,45 +31,43 @@ export default function Dashboard() {
     try {
       const userId = localStorage.getItem('user_id');
 
-      // Fetch summary
-      const summaryRes = await axios.get(getApiUrl(`/api/analytics/summary?user_id=${userId}`));
-      setSummary(summaryRes.data);
+      // Fetch everything in one round trip
+      const { data } = await axios.get(getApiUrl(`/api/dashboard?user_id=${userId}`));
+      setSummary(data.summary);
+      setRank(data.rank);
 
-      // Fetch difficulty distribution
-      const diffRes = await axios.get(getApiUrl(`/api/analytics/difficulty?user_id=${userId}`));
-      if (diffRes.data.length > 0) {
+      // Difficulty distribution
+      if (data.difficulty.length > 0) {
         setDifficultyData({
-          labels: diffRes.data.map(d => d.difficulty),
+          labels: data.difficulty.map(d => d.difficulty),
           datasets: [{
-            data: diffRes.data.map(d => d.count),
+            data: data.difficulty.map(d => d.count),
             backgroundColor: ['#48bb78', '#ed8936', '#f56565'],
             borderWidth: 0
           }]
         });
       }
 
-      // Fetch topic distribution
-      const topicRes = await axios.get(getApiUrl(`/api/analytics/topic?user_id=${userId}`));
-      if (topicRes.data.length > 0) {
+      // Topic distribution
+      if (data.topics.length > 0) {
         setTopicData({
-          labels: topicRes.data.map(t => t.topic),
+          labels: data.topics.map(t => t.topic),
           datasets: [{
             label: 'Problems Solved',
-            data: topicRes.data.map(t => t.count),
+            data: data.topics.map(t => t.count),
             backgroundColor: 'rgba(102, 126, 234, 0.8)',
             borderRadius: 10
           }]
         });
       }
 
-      // Fetch points over time
-      const pointsRes = await axios.get(getApiUrl(`/api/analytics/points?user_id=${userId}`));
-      if (pointsRes.data.length > 0) {
+      // Points over time
+      if (data.points.length > 0) {
         setPointsData({
-          labels: pointsRes.data.map(p => new Date(p.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' })),
+          labels: data.points.map(p => new Date(p.date).toLocaleDateString('en-US', { month: 'short', day: 'numeric' })),
           datasets: [{
             label: 'Total Points',
-            data: pointsRes.data.map(p => p.points),
+            data: data.points.map(p => p.points),
             borderColor: '#667eea',
             backgroundColor: 'rgba(102, 126, 234, 0.1)',
             tension: 0.4,
@@ -81,9 +80,8 @@ export default function Dashboard() {
         });
       }
 
-      // Fetch leaderboard
-      const leaderRes = await axios.get(getApiUrl('/api/leaderboard'));
-      setLeaderboard(leaderRes.data);
+      // Leaderboard
+      setLeaderboard(data.leaderboard);
 
     } catch (error) {
       console.error('Error fetching analytics:', error);
@@ -230,7 +228,10 @@ export default function Dashboard() {
                 <div className="col-12 fade-in-up">
                   <div className="feature-card">
                     <h3 className="card-title">🏆 Global Leaderboard</h3>
-                    <p className="card-text mb-4">See how you rank against other users</p>
+                    <p className="card-text mb-4">
+                      See how you rank against other users
+                      {rank && <> — you are <strong>#{rank}</strong></>}
+                    </p>
                     <div className="table-responsive">
                       <table className="table table-custom">
                         <thead>
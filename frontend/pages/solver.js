@@ -16,6 +16,9 @@ export default function GuidedSolver() {
   const [userIdea, setUserIdea] = useState('');
   const [hintCount, setHintCount] = useState(0);
   const chatEndRef = useRef(null);
+  // Server-side session holding the conversation; null falls back to
+  // sending the full history with every request
+  const sessionIdRef = useRef(null);
 
   useEffect(() => {
     const userId = localStorage.getItem('user_id');
@@ -35,6 +38,17 @@ export default function GuidedSolver() {
       return;
     }
 
+    try {
+      const res = await axios.post(getApiUrl('/api/solver/sessions'), {
+        problem: problemText,
+        user_id: localStorage.getItem('user_id'),
+      });
+      sessionIdRef.current = res.data.session_id;
+    } catch (err) {
+      console.warn('Could not create a solver session, sending full history instead:', err);
+      sessionIdRef.current = null;
+    }
+
     setSessionStarted(true);
     setMessages([
       { role: 'system', content: '🧩 Session started. I\'ll help you understand and solve this problem step by step.' },
@@ -46,19 +60,37 @@ export default function GuidedSolver() {
   const sendToAI = async (stage, idea = '') => {
     setLoading(true);
     try {
-      // Prepare conversation history (exclude system messages)
-      const history = messages
-        .filter(msg => msg.role !== 'system')
-        .map(msg => ({ role: msg.role, content: msg.content }));
+      let payload, streamPath, bufferedPath;
+      if (sessionIdRef.current) {
+        // The session already has the problem and earlier turns
+        payload = { stage, user_input: idea };
+        bufferedPath = `/api/solver/sessions/${sessionIdRef.current}/turns`;
+        streamPath = `${bufferedPath}/stream`;
+      } else {
+        // Prepare conversation history (exclude system messages)
+        const history = messages
+          .filter(msg => msg.role !== 'system')
+          .map(msg => ({ role: msg.role, content: msg.content, stage: msg.stage }));
 
-      const res = await axios.post(getApiUrl('/api/solve-problem'), {
-        problem: problemText,
-        stage,
-        user_input: idea,
-        conversation_history: history,  // Send full conversation context
-      });
-      const content = res.data.response || 'No response from AI.';
-      setMessages((prev) => [...prev, { role: 'assistant', content }]);
+        payload = {
+          problem: problemText,
+          stage,
+          user_input: idea,
+          conversation_history: history,  // The backend summarizes older turns
+        };
+        bufferedPath = '/api/solve-problem';
+        streamPath = '/api/solve-problem/stream';
+      }
+
+      try {
+        await streamFromAI(streamPath, payload);
+      } catch (streamErr) {
+        // Fall back to the buffered endpoint
+        console.warn('Streaming failed, falling back:', streamErr);
+        const res = await axios.post(getApiUrl(bufferedPath), payload);
+        const content = res.data.response || 'No response from AI.';
+        setMessages((prev) => [...prev, { role: 'assistant', content, stage }]);
+      }
     } catch (err) {
       console.error('Error:', err);
       setMessages((prev) => [
@@ -70,25 +102,85 @@ export default function GuidedSolver() {
     }
   };
 
+  // Stream the mentor's reply token by token from the SSE endpoint
+  const streamFromAI = async (path, payload) => {
+    const res = await fetch(getApiUrl(path), {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload),
+    });
+    if (!res.ok || !res.body) {
+      throw new Error(`Stream request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let content = '';
+    let started = false;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = raw.match(/^event: (.*)$/m)?.[1];
+        const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+
+        if (event === 'token') {
+          content += data.text;
+          const text = content;
+          if (!started) {
+            started = true;
+            setLoading(false);
+            setMessages((prev) => [...prev, { role: 'assistant', content: text, stage: payload.stage }]);
+          } else {
+            setMessages((prev) => [...prev.slice(0, -1), { role: 'assistant', content: text, stage: payload.stage }]);
+          }
+        } else if (event === 'error') {
+          if (started) {
+            setMessages((prev) => [...prev.slice(0, -1), { role: 'assistant', content: `${content}\n\n❌ ${data.error}`, stage: payload.stage }]);
+            return;
+          }
+          throw new Error(data.error);
+        }
+      }
+    }
+
+    if (!started) {
+      setMessages((prev) => [...prev, { role: 'assistant', content: 'No response from AI.' }]);
+    }
+  };
+
   const handleHint = () => {
-    setMessages((prev) => [...prev, { role: 'user', content: 'Can I have a hint?' }]);
+    setMessages((prev) => [...prev, { role: 'user', content: 'Can I have a hint?', stage: 'hint' }]);
     setHintCount(prev => prev + 1);
     sendToAI('hint');
   };
 
   const handleFeedback = async () => {
     if (!userIdea.trim()) return;
-    setMessages((prev) => [...prev, { role: 'user', content: `💡 My thought: ${userIdea}` }]);
+    setMessages((prev) => [...prev, { role: 'user', content: `💡 My thought: ${userIdea}`, stage: 'feedback' }]);
     setUserIdea('');
     await sendToAI('feedback', userIdea);
   };
 
   const handleSolution = () => {
-    setMessages((prev) => [...prev, { role: 'user', content: 'Please show me the complete solution.' }]);
+    setMessages((prev) => [...prev, { role: 'user', content: 'Please show me the complete solution.', stage: 'solution' }]);
     sendToAI('solution');
   };
 
   const handleReset = () => {
+    if (sessionIdRef.current) {
+      axios.delete(getApiUrl(`/api/solver/sessions/${sessionIdRef.current}`))
+        .catch((err) => console.warn('Could not delete solver session:', err));
+      sessionIdRef.current = null;
+    }
     setSessionStarted(false);
     setMessages([]);
     setProblemText('');
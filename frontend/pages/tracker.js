@@ -3,12 +3,17 @@ import { useRouter } from 'next/router';
 import Navbar from '../components/Navbar';
 import axios from 'axios';
 import { getApiUrl } from '../utils/api';
-import { FaPlus, FaEdit, FaTrash, FaMagic, FaLightbulb, FaStickyNote } from 'react-icons/fa';
+import { FaPlus, FaEdit, FaTrash, FaMagic, FaLightbulb, FaStickyNote, FaDownload } from 'react-icons/fa';
+
+// Problems fetched per request; older ones load on demand
+const PAGE_SIZE = 50;
 
 export default function Tracker() {
   const router = useRouter();
   const [problems, setProblems] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [showModal, setShowModal] = useState(false);
   const [showSuggestModal, setShowSuggestModal] = useState(false);
   const [showNotesModal, setShowNotesModal] = useState(false);
@@ -39,11 +44,19 @@ export default function Tracker() {
     }
   }, []);
 
-  const fetchProblems = async () => {
+  // Load the newest page of problems, or with a cursor the page after it
+  const fetchProblems = async (cursor = null) => {
     try {
       const userId = localStorage.getItem('user_id');
-      const response = await axios.get(getApiUrl(`/api/problems?user_id=${userId}`));
-      setProblems(response.data);
+      // The table doesn't show summary/notes, so leave those columns out
+      const fields = 'number,name,difficulty,topic,points';
+      let url = `/api/problems?user_id=${userId}&fields=${fields}&limit=${PAGE_SIZE}`;
+      if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+      }
+      const response = await axios.get(getApiUrl(url));
+      setProblems(cursor ? (previous) => [...previous, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error fetching problems:', error);
     } finally {
@@ -51,6 +64,12 @@ export default function Tracker() {
     }
   };
 
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    await fetchProblems(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleChange = (e) => {
     setFormData({
       ...formData,
@@ -87,11 +106,30 @@ export default function Tracker() {
       fetchProblems();
     } catch (error) {
       console.error('Error saving problem:', error);
-      alert('Failed to save problem. Please try again.');
+      if (error.response?.status === 409) {
+        alert(error.response.data.error);
+      } else {
+        alert('Failed to save problem. Please try again.');
+      }
     }
   };
 
-  const handleEdit = (problem) => {
+  // Load a problem with its summary and notes, which the list omits
+  const fetchProblem = async (problemId) => {
+    const userId = localStorage.getItem('user_id');
+    const response = await axios.get(getApiUrl(`/api/problems/${problemId}?user_id=${userId}`));
+    return response.data;
+  };
+
+  const handleEdit = async (listed) => {
+    let problem;
+    try {
+      problem = await fetchProblem(listed.id);
+    } catch (error) {
+      console.error('Error fetching problem:', error);
+      alert('Failed to load problem. Please try again.');
+      return;
+    }
     setEditingProblem(problem);
     setFormData({
       number: problem.number,
@@ -129,21 +167,25 @@ export default function Tracker() {
 
       setRecommendations(response.data.recommendations || []);
       
-      if (response.data.recommendations.length === 0 && response.data.raw_text) {
-        alert('Received recommendations but could not parse them. Check console for details.');
-        console.log('Raw recommendations:', response.data.raw_text);
+      if (response.data.recommendations.length === 0) {
+        alert(response.data.message);
       }
     } catch (error) {
       console.error('Error getting recommendations:', error);
-      alert('Failed to get recommendations. Please make sure Gemini API is configured.');
+      alert(error.response?.data?.error || 'Failed to get recommendations');
     } finally {
       setLoadingRecommendations(false);
     }
   };
 
-  const handleViewNotes = (problem) => {
-    setSelectedProblem(problem);
-    setShowNotesModal(true);
+  const handleViewNotes = async (listed) => {
+    try {
+      setSelectedProblem(await fetchProblem(listed.id));
+      setShowNotesModal(true);
+    } catch (error) {
+      console.error('Error fetching problem:', error);
+      alert('Failed to load notes. Please try again.');
+    }
   };
 
   const getDifficultyBadge = (difficulty) => {
@@ -196,6 +238,17 @@ export default function Tracker() {
             <FaMagic style={{ marginRight: '0.5rem' }} />
             Suggest Problems (AI)
           </button>
+
+          <button
+            className="btn btn-outline-secondary ms-2"
+            onClick={() => {
+              const userId = localStorage.getItem('user_id');
+              window.location.href = getApiUrl(`/api/problems/export?user_id=${userId}&format=csv`);
+            }}
+          >
+            <FaDownload style={{ marginRight: '0.5rem' }} />
+            Export CSV
+          </button>
         </div>
 
         {loading ? (
@@ -274,6 +327,17 @@ export default function Tracker() {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <div className="text-center">
+                <button
+                  className="btn btn-primary-custom"
+                  onClick={handleLoadMore}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -460,7 +524,7 @@ export default function Tracker() {
                         <div key={index} className="list-group-item">
                           <div className="d-flex justify-content-between align-items-start">
                             <div className="flex-grow-1">
-                              <h6 className="mb-1">{rec.problem_name}</h6>
+                              <h6 className="mb-1">{rec.number ? `${rec.number}. ` : ''}{rec.problem_name}</h6>
                               <div className="mb-2">
                                 <span className={`badge ${
                                   rec.difficulty === 'Easy' ? 'bg-success' : 
@@ -91,8 +91,10 @@ export default function Upload() {
     }
   };
 
-  const handleAnalyze = async () => {
-    if (!selectedFile) {
+  // Analyze the selected file, or an already uploaded resume by id
+  const handleAnalyze = async (resumeId) => {
+    const useStored = typeof resumeId === 'number';
+    if (!useStored && !selectedFile) {
       alert('Please select a file first');
       return;
     }
@@ -102,17 +104,39 @@ export default function Upload() {
     setCandidateName('');
 
     try {
-      const formData = new FormData();
-      formData.append('file', selectedFile);
+      const userId = localStorage.getItem('user_id');
+      let submitted;
 
-      const response = await axios.post(getApiUrl('/api/analyze-resume'), formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      // Queue the analysis, then poll until the job finishes
+      if (useStored) {
+        submitted = await axios.post(getApiUrl('/api/analyze-resume/jobs'), {
+          resume_id: resumeId,
+          user_id: userId
+        });
+      } else {
+        const formData = new FormData();
+        formData.append('file', selectedFile);
+        formData.append('user_id', userId);
+
+        submitted = await axios.post(getApiUrl('/api/analyze-resume/jobs'), formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data'
+          }
+        });
+      }
+
+      let job = submitted.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        job = (await axios.get(getApiUrl(`/api/analyze-resume/jobs/${submitted.data.job_id}`))).data;
+      }
+
+      if (job.status === 'failed') {
+        throw { response: { data: { error: job.error || 'Analysis failed' } } };
+      }
 
-      setAnalysis(response.data.analysis);
-      setCandidateName(response.data.candidate_name || '');
+      setAnalysis(job.analysis);
+      setCandidateName(job.candidate_name || '');
       setShowAnalysis(true);
     } catch (error) {
       console.error('Error analyzing resume:', error);
@@ -266,6 +290,14 @@ export default function Upload() {
                                 <FaDownload style={{ marginRight: '0.3rem' }} />
                                 Download
                               </a>
+                              <button
+                                className="btn btn-sm btn-success ms-2"
+                                onClick={() => handleAnalyze(resume.id)}
+                                disabled={analyzing}
+                              >
+                                <FaMagic style={{ marginRight: '0.3rem' }} />
+                                Analyze
+                              </button>
                             </td>
                           </tr>
                         ))}